@@ -1,10 +1,11 @@
-from decimal import Decimal
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from sqlalchemy import cast, Date, func
+from sqlalchemy import func, update
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta, date
+from functools import wraps
 import calendar
+import os
 
 from app.database import SessionLocal
 from app.models.pago_model import PagoFijo
@@ -12,8 +13,24 @@ from app.models.user_model import User
 from app.models.transaction_model import Transaction
 from app.models.budget_model import Budget
 from app.models.categoria_model import Categoria
-from app.utils.notificaciones import enviar_correo
-from app.utils.sms import enviar_sms
+from app.utils.alertas import avisar
+from app.utils.contexto import origen_actual
+from app.utils.proyeccion import proyectar_todos, guardar_faltantes, tomar_faltantes
+from app.utils.idempotencia import purgar_expiradas
+from app.utils.particiones import asegurar_particiones
+from app.utils.periodos import en_rango, rango_mes
+from app.utils.archivo import archivar_periodos_cerrados
+from app.utils.estados_cuenta import generar_estados, mes_anterior
+from app.utils.anomalias import detectar_anomalias, pendientes_de_aviso
+from app.utils.conciliacion import conciliar_saldos
+from app.utils.eventos import notificar, transaccion_a_dict
+from app.utils.cambios import purgar_cambios
+from app.utils.corridas import anotar_error, anotar_lag_pago, contar, escuchar, purgar_corridas, registrar
+from app.utils.dinero import formatear, porcentaje
+from app.utils.shards import en_cada_shard, motor_actual, replicar_categorias
+from app.models.anomalia_model import Anomalia
+
+PROYECCION_DIAS = int(os.environ.get("PROYECCION_DIAS", "60"))
 
 # ===== Helper: sumar meses sin dependencias externas =====
 def add_months(d: date, months: int) -> date:
@@ -22,16 +39,19 @@ def add_months(d: date, months: int) -> date:
     last_day = calendar.monthrange(y, m)[1]
     return date(y, m, min(d.day, last_day))
 
+def _reprogramar(pago: PagoFijo):
+    """Siguiente ejecución según la periodicidad; los pagos únicos se desactivan."""
+    if pago.periodicidad == 'weekly':
+        pago.proxima_ejecucion = pago.proxima_ejecucion + timedelta(weeks=1)
+    elif pago.periodicidad == 'monthly':
+        pago.proxima_ejecucion = add_months(pago.proxima_ejecucion, 1)
+    else:
+        pago.activo = False
+
 def _avisar(user: User, asunto: str, mensaje: str):
-    try:
-        enviar_correo(user.correo, asunto, mensaje)
-    except Exception as e:
-        print(f"[Correo] Error notificando a {user.correo}: {e}")
-    try:
-        if getattr(user, "telefono", None):
-            enviar_sms(user.telefono, f"{asunto}: {mensaje}")
-    except Exception as e:
-        print(f"[SMS] Error notificando a {user.telefono}: {e}")
+    # Solo cuenta lo entregado: con el circuito abierto enviar_correo/enviar_sms devuelven False
+    if avisar(user.correo, getattr(user, "telefono", None), asunto, mensaje):
+        contar("notificaciones")
 
 # ===== Aviso 2 días antes (presupuesto y saldo) =====
 def verificar_pagos_pendientes():
@@ -47,8 +67,9 @@ def verificar_pagos_pendientes():
 
         pagos = db.query(PagoFijo).filter(
             PagoFijo.activo == True,
-            cast(PagoFijo.proxima_ejecucion, Date) == objetivo
+            PagoFijo.proxima_ejecucion == objetivo
         ).all()
+        contar("filas_revisadas", len(pagos))
 
         for pago in pagos:
             usuario = db.query(User).filter(User.id_usuario == pago.id_usuario).first()
@@ -57,24 +78,100 @@ def verificar_pagos_pendientes():
 
             if obtener_presupuesto_disponible and pago.categoria_id:
                 disponible = obtener_presupuesto_disponible(db, pago.id_usuario, pago.categoria_id, datetime.utcnow())
-                if disponible < float(pago.monto):
+                if disponible is not None and disponible < pago.monto:
                     _avisar(
                         usuario,
                         "⚠ Presupuesto insuficiente (aviso previo)",
-                        f"En 2 días se programó '{pago.descripcion}' por ${pago.monto}, "
+                        f"En 2 días se programó '{pago.descripcion}' por ${formatear(pago.monto)}, "
                         f"pero no hay presupuesto suficiente en la categoría."
                     )
 
-            if (usuario.saldo or Decimal("0.00")) < pago.monto:
+            if (usuario.saldo or 0) < pago.monto:
                 _avisar(
                     usuario,
                     "⚠ Saldo insuficiente (aviso previo)",
-                    f"En 2 días se programó '{pago.descripcion}' por ${pago.monto}, "
+                    f"En 2 días se programó '{pago.descripcion}' por ${formatear(pago.monto)}, "
                     f"pero tu saldo actual no alcanza."
                 )
+
+        # Faltantes detectados por la proyección nocturna (semanas antes): un solo query para todos
+        faltantes = tomar_faltantes(db)
+        if faltantes:
+            usuarios = db.query(User).filter(User.id_usuario.in_(list(faltantes))).all()
+            contar("filas_revisadas", len(usuarios))
+            for usuario in usuarios:
+                fecha, minimo = faltantes[usuario.id_usuario]
+                _avisar(
+                    usuario,
+                    "⚠ Saldo proyectado insuficiente",
+                    f"Con tus pagos programados y presupuestos, tu saldo quedaría en negativo el {fecha} "
+                    f"(mínimo proyectado ${formatear(minimo)})."
+                )
+    finally:
+        db.close()
+
+# ===== Proyección nocturna de saldo para todos los usuarios =====
+def proyectar_saldos_global():
+    """
+    Puntúa a todos los usuarios de una vez (consultas en bloque + NumPy) y deja los faltantes
+    listos para que verificar_pagos_pendientes avise con semanas de anticipación.
+    """
+    db: Session = SessionLocal()
+    try:
+        hoy = datetime.utcnow().date()
+        guardar_faltantes(db, proyectar_todos(db, hoy, PROYECCION_DIAS))
     finally:
         db.close()
 
+# ===== Particiones y archivo frío de transacciones =====
+def mantener_particiones():
+    """Crea por adelantado las particiones mensuales (no-op si ya existen o la tabla no está particionada)."""
+    asegurar_particiones(motor_actual())
+
+def archivar_transacciones():
+    """Mueve a NDJSON.gz + resumen_archivado los meses fuera de la ventana caliente."""
+    archivados = archivar_periodos_cerrados()
+    if archivados:
+        print(f"[Archivo] Periodos archivados: {', '.join(archivados)}")
+
+# ===== Estados de cuenta del mes anterior =====
+def generar_estados_cuenta():
+    """Reanuda desde el último id con archivo escrito si una corrida anterior se cortó."""
+    resultado = generar_estados(mes_anterior())
+    print(f"[Estados] {resultado['periodo']}: {resultado['usuarios']} estados generados")
+
+# ===== Anomalías de gasto (NumPy sobre todos los egresos de la ventana) =====
+def detectar_anomalias_global():
+    """Marca los egresos atípicos de ayer y avisa una vez por usuario con el resumen."""
+    db: Session = SessionLocal()
+    try:
+        detectar_anomalias(db, datetime.utcnow().date())
+
+        pendientes = pendientes_de_aviso(db)
+        if not pendientes:
+            return
+        usuarios = db.query(User).filter(User.id_usuario.in_(list(pendientes))).all()
+        for usuario in usuarios:
+            anomalias = pendientes[usuario.id_usuario]
+            lineas = "; ".join(f"${formatear(a.monto)} el {a.fecha:%Y-%m-%d} ({a.detalle})" for a in anomalias[:5])
+            extra = f" y {len(anomalias) - 5} más" if len(anomalias) > 5 else ""
+            _avisar(
+                usuario,
+                "🔎 Movimientos inusuales en tu cuenta",
+                f"Detectamos {len(anomalias)} egreso(s) fuera de lo habitual: {lineas}{extra}."
+            )
+        db.query(Anomalia).filter(
+            Anomalia.id.in_([a.id for lista in pendientes.values() for a in lista])
+        ).update({Anomalia.notificada: True}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+# ===== Conciliación de usuarios.saldo contra el libro de transacciones =====
+def conciliar_saldos_global():
+    """Reporta (y con CONCILIACION_REPARAR=1 corrige) los desvíos; retoma la corrida del día si se cortó."""
+    conciliar_saldos()
+
 # ===== Ejecutar pagos del día (con reprogramación recurrente) =====
 def ejecutar_pagos_fijos():
     db: Session = SessionLocal()
@@ -83,80 +180,88 @@ def ejecutar_pagos_fijos():
 
         pagos = db.query(PagoFijo).filter(
             PagoFijo.activo == True,
-            cast(PagoFijo.proxima_ejecucion, Date) <= hoy  
+            PagoFijo.proxima_ejecucion <= hoy
         ).all()
 
+        contar("filas_revisadas", len(pagos))
+
         try:
-            from app.routes.presupuestos_routes import obtener_presupuesto_disponible
+            from app.routes.presupuestos_routes import estado_presupuesto, alertar_cruce_por_pago
         except Exception:
-            obtener_presupuesto_disponible = None
+            estado_presupuesto = None
 
         for pago in pagos:
-            usuario = db.query(User).filter(User.id_usuario == pago.id_usuario).first()
-            if not usuario:
-                continue
+            id_pago = pago.id_pago
+            try:
+                usuario = db.query(User).filter(User.id_usuario == pago.id_usuario).first()
+                if not usuario:
+                    continue
+                anotar_lag_pago(pago.proxima_ejecucion)
 
-            if obtener_presupuesto_disponible and pago.categoria_id:
-                disponible = obtener_presupuesto_disponible(db, pago.id_usuario, pago.categoria_id, datetime.utcnow())
-            else:
-                disponible = float('inf')
+                presupuesto = None
+                if estado_presupuesto and pago.categoria_id:
+                    presupuesto = estado_presupuesto(db, pago.id_usuario, pago.categoria_id, datetime.utcnow())
 
-            if disponible < float(pago.monto):
-                _avisar(
-                    usuario,
-                    "🚫 Pago no ejecutado (presupuesto insuficiente)",
-                    f"No se ejecutó '{pago.descripcion}' por ${pago.monto} por falta de presupuesto."
+                if presupuesto is not None and presupuesto[0] - presupuesto[1] < pago.monto:
+                    _avisar(
+                        usuario,
+                        "🚫 Pago no ejecutado (presupuesto insuficiente)",
+                        f"No se ejecutó '{pago.descripcion}' por ${formatear(pago.monto)} por falta de presupuesto."
+                    )
+                    contar("omitidos_presupuesto")
+                    _reprogramar(pago)
+                    db.commit()
+                    continue
+
+                # Débito condicional y relativo (bloquea la fila del usuario): un egreso, una
+                # transferencia o la reparación de la conciliación en paralelo no se pisan
+                cobrado = db.execute(
+                    update(User)
+                    .where(User.id_usuario == pago.id_usuario, User.saldo >= pago.monto)
+                    .values(saldo=User.saldo - pago.monto)
+                    .execution_options(synchronize_session=False)
+                ).rowcount == 1
+                if not cobrado:
+                    _reprogramar(pago)
+                    db.commit()  # antes del aviso: no retener el candado mientras responde el proveedor
+                    contar("omitidos_saldo")
+                    _avisar(
+                        usuario,
+                        "🚫 Pago no ejecutado (saldo insuficiente)",
+                        f"No se ejecutó '{pago.descripcion}' por ${formatear(pago.monto)} por saldo insuficiente."
+                    )
+                    continue
+
+                tx = Transaction(
+                    id_usuario=pago.id_usuario,
+                    tipo="egreso",
+                    monto=pago.monto,
+                    descripcion=f"Pago fijo: {pago.descripcion}",
+                    categoria_id=pago.categoria_id,
+                    estado="completada",
+                    fecha=datetime.utcnow()
                 )
-                if pago.periodicidad == 'weekly':
-                    pago.proxima_ejecucion = pago.proxima_ejecucion + timedelta(weeks=1)
-                elif pago.periodicidad == 'monthly':
-                    pago.proxima_ejecucion = add_months(pago.proxima_ejecucion, 1)
-                else:
-                    pago.activo = False
+                db.add(tx)
+                # Reprogramar en el mismo commit del cargo: si algo falla después, no se vuelve a cobrar
+                _reprogramar(pago)
                 db.commit()
-                continue
+                contar("pagos_ejecutados")
+                notificar(db, [usuario.id_usuario], "pago_fijo",
+                          {"id_pago": pago.id_pago, "transaccion": transaccion_a_dict(tx)})
+
+                if presupuesto is not None:
+                    alertar_cruce_por_pago(db, usuario, pago.categoria_id, presupuesto, pago.monto)
 
-            if (usuario.saldo or Decimal("0.00")) < pago.monto:
                 _avisar(
                     usuario,
-                    "🚫 Pago no ejecutado (saldo insuficiente)",
-                    f"No se ejecutó '{pago.descripcion}' por ${pago.monto} por saldo insuficiente."
+                    "💸 Pago fijo ejecutado",
+                    f"Se ejecutó '{pago.descripcion}' por ${formatear(pago.monto)}."
                 )
-                if pago.periodicidad == 'weekly':
-                    pago.proxima_ejecucion = pago.proxima_ejecucion + timedelta(weeks=1)
-                elif pago.periodicidad == 'monthly':
-                    pago.proxima_ejecucion = add_months(pago.proxima_ejecucion, 1)
-                else:
-                    pago.activo = False
-                db.commit()
-                continue
-
-            tx = Transaction(
-                id_usuario=pago.id_usuario,
-                tipo="egreso",
-                monto=pago.monto,
-                descripcion=f"Pago fijo: {pago.descripcion}",
-                categoria_id=pago.categoria_id,
-                estado="completada",
-                fecha=datetime.utcnow()
-            )
-            db.add(tx)
-            usuario.saldo -= pago.monto
-            db.commit()
-
-            _avisar(
-                usuario,
-                "💸 Pago fijo ejecutado",
-                f"Se ejecutó '{pago.descripcion}' por ${pago.monto}."
-            )
-
-            if pago.periodicidad == 'weekly':
-                pago.proxima_ejecucion = pago.proxima_ejecucion + timedelta(weeks=1)
-            elif pago.periodicidad == 'monthly':
-                pago.proxima_ejecucion = add_months(pago.proxima_ejecucion, 1)
-            else:
-                pago.activo = False
-            db.commit()
+            except Exception as e:
+                # Un pago con error no frena a los demás (antes cortaba la corrida en ese punto)
+                db.rollback()
+                anotar_error(e)
+                print(f"[Cron] Pago {id_pago} falló: {e}")
     finally:
         db.close()
 
@@ -165,6 +270,8 @@ def verificar_presupuestos_global():
     """
     Recorre todos los usuarios y sus presupuestos del mes actual.
     Envía alerta por correo/SMS cuando el gasto por categoría supera 80% o 100%.
+    Retirado del scheduler: las alertas salen al cruzar el umbral en el egreso
+    (ver alertar_cruce_presupuesto). Se conserva con ENABLE_BUDGET_SWEEP=1.
     """
     db: Session = SessionLocal()
     try:
@@ -172,12 +279,14 @@ def verificar_presupuestos_global():
         mes, anio = hoy.month, hoy.year
 
         usuarios = db.query(User).all()
+        contar("filas_revisadas", len(usuarios))
         for usuario in usuarios:
             presupuestos = db.query(Budget).filter(
                 Budget.id_usuario == usuario.id_usuario,
                 Budget.mes == mes,
                 Budget.año == anio
             ).all()
+            contar("filas_revisadas", len(presupuestos))
 
             for p in presupuestos:
                 total_gastado = (
@@ -186,33 +295,62 @@ def verificar_presupuestos_global():
                         Transaction.id_usuario == usuario.id_usuario,
                         Transaction.categoria_id == p.id_categoria,
                         Transaction.tipo == "egreso",
-                        func.extract("month", Transaction.fecha) == mes,
-                        func.extract("year", Transaction.fecha) == anio
+                        en_rango(Transaction.fecha, rango_mes(anio, mes))
                     ).scalar()
                     or 0
                 )
 
-                if p.monto_mensual and p.monto_mensual > 0:
-                    porcentaje = float(total_gastado) / float(p.monto_mensual) * 100.0
-                else:
-                    porcentaje = 0.0
+                uso = porcentaje(total_gastado, p.monto_mensual or 0)
 
-                if porcentaje >= 80:
+                if uso >= 80:
                     nombre_cat = db.query(Categoria.nombre).filter(Categoria.id_categoria == p.id_categoria).scalar() or "Sin categoría"
-                    nivel = "excedido" if porcentaje >= 100 else "alto (80%)"
+                    nivel = "excedido" if uso >= 100 else "alto (80%)"
                     _avisar(
                         usuario,
                         "⚠ Alerta de Presupuesto",
-                        f"Categoría '{nombre_cat}': llevas ${float(total_gastado):.2f} "
-                        f"({porcentaje:.1f}% de ${float(p.monto_mensual):.2f}). Nivel: {nivel}."
+                        f"Categoría '{nombre_cat}': llevas ${formatear(total_gastado)} "
+                        f"({uso:.1f}% de ${formatear(p.monto_mensual)}). Nivel: {nivel}."
                     )
     finally:
         db.close()
 
+# ===== Etiquetar consultas del job (ver /diagnostico/consultas) =====
+def _con_origen(job):
+    @wraps(job)
+    def envoltura(*args, **kwargs):
+        token = origen_actual.set(f"cron:{job.__name__}")
+        try:
+            return job(*args, **kwargs)
+        finally:
+            origen_actual.reset(token)
+    return envoltura
+
+# ===== Programar con id estable e historial en corridas_jobs (ver /diagnostico/cron) =====
+def _programar(scheduler: BackgroundScheduler, job, trigger, por_shard: bool = True, **kwargs):
+    """El id en APScheduler es el nombre del job: con él el listener de corridas completa sus filas."""
+    tarea = en_cada_shard(registrar(job)) if por_shard else registrar(job)
+    scheduler.add_job(_con_origen(tarea), trigger, id=job.__name__, name=job.__name__, **kwargs)
+
 # ===== Inicializar scheduler =====
 def iniciar_cron_jobs():
     scheduler = BackgroundScheduler()
-    scheduler.add_job(verificar_pagos_pendientes, CronTrigger(minute="*/1"))
-    scheduler.add_job(ejecutar_pagos_fijos,     CronTrigger(minute="*/1"))
-    scheduler.add_job(verificar_presupuestos_global, CronTrigger(hour=9, minute=0))
+    escuchar(scheduler)
+    # Los jobs por usuario corren una vez por shard, en paralelo (sin sharding: una vez, igual que antes)
+    _programar(scheduler, verificar_pagos_pendientes, CronTrigger(minute="*/1"))
+    _programar(scheduler, ejecutar_pagos_fijos,       CronTrigger(minute="*/1"))
+    if os.environ.get("ENABLE_BUDGET_SWEEP", "0") == "1":
+        _programar(scheduler, verificar_presupuestos_global, CronTrigger(hour=9, minute=0))
+    _programar(scheduler, proyectar_saldos_global, CronTrigger(hour=2, minute=0))
+    _programar(scheduler, detectar_anomalias_global, CronTrigger(hour=2, minute=30))
+    _programar(scheduler, conciliar_saldos_global, CronTrigger(hour=4, minute=0),
+               max_instances=1, coalesce=True)
+    _programar(scheduler, purgar_expiradas, CronTrigger(minute=30), por_shard=False)
+    _programar(scheduler, purgar_cambios, CronTrigger(hour=3, minute=45))
+    _programar(scheduler, purgar_corridas, CronTrigger(hour=3, minute=50), por_shard=False)
+    _programar(scheduler, replicar_categorias, CronTrigger(hour=1, minute=0), por_shard=False)
+    _programar(scheduler, mantener_particiones, CronTrigger(hour=1, minute=30))
+    _programar(scheduler, archivar_transacciones, CronTrigger(day=1, hour=3, minute=15))
+    # Cada hora del día 1 hasta completar: si un worker se reinicia, retoma desde el checkpoint
+    _programar(scheduler, generar_estados_cuenta, CronTrigger(day=1, hour="0-23", minute=5),
+               max_instances=1, coalesce=True)
     scheduler.start()
\ No newline at end of file
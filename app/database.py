@@ -3,11 +3,31 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import Session
 from typing import Generator
+import os
 
-DATABASE_URL = "mysql+pymysql://root:@127.0.0.1:3306/lana_app"
+from app.utils import consultas_lentas, shards
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = os.environ.get("DATABASE_URL", "mysql+pymysql://root:@127.0.0.1:3306/lana_app")
+# Opcional: URLs separadas por coma, una por shard; la primera es el primario (directorio de
+# usuarios, idempotencia y categorías maestras) y suele ser la DATABASE_URL de siempre.
+DATABASE_SHARDS = [u.strip() for u in os.environ.get("DATABASE_SHARDS", "").split(",") if u.strip()]
+
+def _crear_engine(url: str):
+    # SQLite (desarrollo local) necesita compartir la conexión entre los hilos del threadpool
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    motor = create_engine(url, connect_args=connect_args)
+    # Mide cada sentencia (huellas, lentas + muestreo) para /diagnostico/consultas
+    consultas_lentas.instalar(motor)
+    return motor
+
+if len(DATABASE_SHARDS) > 1:
+    motores = {str(i): _crear_engine(url) for i, url in enumerate(DATABASE_SHARDS)}
+    engine = motores[shards.SHARD_PRIMARIO]
+    SessionLocal = shards.fabrica_sesiones(motores, autocommit=False, autoflush=False)
+else:
+    engine = _crear_engine(DATABASE_URL)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    shards.configurar_unico(engine)
 
 Base = declarative_base()
 
@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
 
@@ -9,8 +10,21 @@ from app.routes.categoria_routes import router as categoria_router
 from app.routes.presupuestos_routes import router as presupuesto_router
 from app.routes.pago_routes import router as pago_router
 from app.routes.estadisticas_routes import router as estadistica_router
+from app.routes.diagnostico_routes import router as diagnostico_router
+from app.routes.busqueda_routes import router as busqueda_router
+from app.routes.transferencias_routes import router as transferencia_router
+from app.routes.estados_cuenta_routes import router as estados_cuenta_router
+from app.routes.anomalias_routes import router as anomalias_router
+from app.routes.eventos_routes import router as eventos_router
+from app.routes.cambios_routes import router as cambios_router
 from app.routes import resumen_routes
 from app.cron_jobs import iniciar_cron_jobs  
+from app.utils.contexto import origen_actual, plantilla_ruta
+from app.utils.idempotencia import IdempotenciaMiddleware
+from app.utils.busqueda import asegurar_fts
+from app.utils.limitador import LimitadorMiddleware
+from app.utils.perfilador import PerfiladorMiddleware
+from app.utils import autocompletar, cambios, shards
 
 app = FastAPI(
     title="API de Finanzas Personales",
@@ -18,7 +32,14 @@ app = FastAPI(
     version="1.0.0",
 )
 
-Base.metadata.create_all(bind=engine)
+# Esquema en cada shard (sin DATABASE_SHARDS: solo el engine de siempre) + directorio y rangos de ids
+shards.preparar(Base.metadata)
+for shard in shards.lista():
+    asegurar_fts(shards.motor(shard))
+# Bitácora para GET /cambios: toda sesión ORM registra sus altas/cambios/bajas al hacer flush
+cambios.instalar()
+# Índices de autocompletar en memoria: cada alta/baja confirmada actualiza el del usuario
+autocompletar.instalar()
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,6 +49,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reintentos seguros en POST que mueven dinero (header Idempotency-Key)
+app.add_middleware(IdempotenciaMiddleware)
+
+# Token buckets por usuario/ruta y recorte de carga cuando el pool de BD se satura
+if os.environ.get("RATE_LIMIT_ENABLED", "1") == "1":
+    app.add_middleware(LimitadorMiddleware, engine=engine)
+
+@app.exception_handler(shards.UsuarioEnMovimiento)
+async def _usuario_en_movimiento(request: Request, exc: shards.UsuarioEnMovimiento):
+    # Ventana corta mientras el resharding copia al usuario a su nuevo shard
+    return JSONResponse(status_code=503, content={"detail": "Cuenta en mantenimiento, reintenta en unos segundos."},
+                        headers={"Retry-After": str(max(1, int(shards.SHARD_MAPA_TTL)))})
+
+@app.middleware("http")
+async def _origen_consultas(request: Request, call_next):
+    # Etiqueta las consultas SQL con la ruta que las originó (ver /diagnostico/consultas)
+    token = origen_actual.set(f"{request.method} {plantilla_ruta(request)}")
+    try:
+        return await call_next(request)
+    finally:
+        origen_actual.reset(token)
+
+# Perfil de un request puntual (X-Perfilar o muestreo por ruta); por fuera de todo, así incluye
+# limitador, idempotencia y serialización (ver /diagnostico/perfiles)
+app.add_middleware(PerfiladorMiddleware)
+
 # Routers
 app.include_router(user_router, tags=["Usuarios"])
 app.include_router(transaction_router, tags=["Transacciones"])
@@ -35,7 +82,14 @@ app.include_router(categoria_router, tags=["Categorías"])
 app.include_router(presupuesto_router, tags=["Presupuestos"])
 app.include_router(pago_router, tags=["Pagos"])
 app.include_router(estadistica_router, tags=["Estadísticas"])
+app.include_router(transferencia_router, tags=["Transferencias"])
+app.include_router(estados_cuenta_router, tags=["Estados de cuenta"])
+app.include_router(anomalias_router, tags=["Anomalías"])
+app.include_router(eventos_router, tags=["Eventos"])
+app.include_router(cambios_router, tags=["Sincronización"])
 app.include_router(resumen_routes.router)
+app.include_router(busqueda_router, tags=["Búsqueda"])
+app.include_router(diagnostico_router, tags=["Diagnóstico"])
 
 @app.get("/health")
 def health():
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, Float, DateTime, String, Enum, Boolean, Index, UniqueConstraint
+from datetime import datetime
+from app.database import Base
+from app.utils.dinero import Centavos
+
+class Anomalia(Base):
+    """Egresos marcados por la detección nocturna (app/utils/anomalias.py). Solo lectura para la API."""
+    __tablename__ = "anomalias"
+
+    id             = Column(Integer, primary_key=True)
+    id_transaccion = Column(Integer, nullable=False)                  # sin FK: transacciones está particionada
+    id_usuario     = Column(Integer, nullable=False)
+    categoria_id   = Column(Integer, nullable=True)
+    fecha          = Column(DateTime, nullable=False)                 # fecha de la transacción
+    monto          = Column(Centavos(), nullable=False)
+    motivo         = Column(Enum('monto','frecuencia'), nullable=False)
+    puntaje        = Column(Float, nullable=False)                    # z-score (monto) o repeticiones (frecuencia)
+    detalle        = Column(String(255), nullable=True)
+    detectada_en   = Column(DateTime, default=datetime.utcnow, nullable=False)
+    notificada     = Column(Boolean, default=False, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("id_transaccion", "motivo", name="uq_anomalia_tx_motivo"),  # re-correr el job no duplica
+        Index("idx_anomalia_usuario_fecha", "id_usuario", "fecha"),
+        {"sqlite_autoincrement": True},  # rango de ids por shard (utils/shards.py)
+    )
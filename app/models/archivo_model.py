@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime, Enum, Index
+from datetime import datetime
+from app.database import Base
+from app.utils.dinero import Centavos
+
+class ResumenArchivado(Base):
+    """Totales diarios de transacciones completadas de periodos ya archivados (fuera de la tabla caliente)."""
+    __tablename__ = "resumen_archivado"
+
+    id           = Column(Integer, primary_key=True)
+    id_usuario   = Column(Integer, nullable=False)
+    dia          = Column(Date, nullable=False)
+    tipo         = Column(Enum('ingreso','egreso','envio','solicitud'), nullable=False)
+    rol          = Column(Enum('titular','destinatario'), nullable=False, default='titular')  # destinatario: contraparte de envío/solicitud
+    categoria_id = Column(Integer, nullable=True)
+    total        = Column(Centavos(14), nullable=False)
+    conteo       = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("idx_resarch_usuario_dia", "id_usuario", "dia"),
+        {"sqlite_autoincrement": True},  # rango de ids por shard (utils/shards.py)
+    )
+
+class PeriodoArchivado(Base):
+    __tablename__ = "periodos_archivados"
+
+    periodo      = Column(String(7), primary_key=True)            # 'YYYY-MM'
+    desde        = Column(Date, nullable=False)
+    hasta        = Column(Date, nullable=False)                   # exclusivo
+    archivo      = Column(String(255), nullable=False)            # NDJSON.gz con las filas originales
+    sha256       = Column(String(64), nullable=False)
+    filas        = Column(Integer, nullable=False)
+    archivado_en = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, ForeignKey
 from app.database import Base
+from app.utils.dinero import Centavos
 
 class Budget(Base):
     __tablename__ = "presupuestos"
@@ -7,6 +8,8 @@ class Budget(Base):
     id_presupuesto = Column(Integer, primary_key=True, index=True)
     id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"))
     id_categoria = Column(Integer, ForeignKey("categorias.id_categoria"))
-    monto_mensual = Column(Numeric(10, 2))
+    monto_mensual = Column(Centavos())
     mes = Column(Integer)
     año = Column(Integer)
+
+    __table_args__ = {"sqlite_autoincrement": True}  # rango de ids por shard (utils/shards.py)
@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, BigInteger, DateTime, Enum, Index
+from datetime import datetime
+from app.database import Base
+
+class Cambio(Base):
+    """
+    Bitácora de altas/cambios/bajas por usuario; `id` es el cursor del feed de sincronización.
+    El id no sale del AUTO_INCREMENT sino de SecuenciaCambios al confirmar (app/utils/cambios.py).
+    """
+    __tablename__ = "cambios"
+
+    id         = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    id_usuario = Column(Integer, nullable=False)
+    entidad    = Column(Enum('transaccion','pago','presupuesto'), nullable=False)
+    id_entidad = Column(Integer, nullable=False)
+    operacion  = Column(Enum('alta','cambio','baja'), nullable=False)
+    creado     = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("idx_cambios_usuario_id", "id_usuario", "id"),
+        Index("idx_cambios_creado", "creado"),
+        {"sqlite_autoincrement": True},  # rango de ids por shard (utils/shards.py)
+    )
+
+class SecuenciaCambios(Base):
+    """Una sola fila por shard: último id de `cambios` entregado. Su candado ordena los commits."""
+    __tablename__ = "secuencia_cambios"
+
+    id    = Column(Integer, primary_key=True, autoincrement=False)   # siempre 1
+    valor = Column(BigInteger, nullable=False)
@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, BigInteger, Float, DateTime, String, Enum, Text, Index
+from app.database import Base
+
+class CorridaJob(Base):
+    """Una fila por corrida de cron (y por shard). La escribe app/utils/corridas.py en el primario."""
+    __tablename__ = "corridas_jobs"
+
+    id                   = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    job                  = Column(String(64), nullable=False)
+    shard                = Column(String(16), nullable=True)              # NULL: sin sharding o job global
+    estado               = Column(Enum('ok','error','omitida','perdida'), nullable=False)
+    programada           = Column(DateTime, nullable=True)                # hora que tocaba según el CronTrigger
+    inicio               = Column(DateTime, nullable=False)
+    fin                  = Column(DateTime, nullable=True)
+    duracion_ms          = Column(Float, nullable=True)
+    retraso_ms           = Column(Float, nullable=True)                   # inicio - programada (cola del scheduler)
+    filas_revisadas      = Column(Integer, default=0, nullable=False)
+    pagos_ejecutados     = Column(Integer, default=0, nullable=False)
+    omitidos_presupuesto = Column(Integer, default=0, nullable=False)
+    omitidos_saldo       = Column(Integer, default=0, nullable=False)
+    notificaciones       = Column(Integer, default=0, nullable=False)
+    errores              = Column(Integer, default=0, nullable=False)
+    lag_pago_max_s       = Column(Float, nullable=True)                   # ejecución - proxima_ejecucion, peor pago
+    lag_pago_prom_s      = Column(Float, nullable=True)
+    error                = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("idx_corrida_job_inicio", "job", "inicio"),
+        Index("idx_corrida_inicio", "inicio"),
+    )
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, Date, DateTime, String, Index
+from datetime import datetime
+from app.database import Base
+from app.utils.dinero import Centavos
+
+class FaltanteSaldo(Base):
+    """
+    Usuarios cuya proyección nocturna queda en negativo (app/utils/proyeccion.py), pendientes de
+    aviso. En la BD y no en memoria: sobrevive reinicios y la comparten todos los workers.
+    """
+    __tablename__ = "faltantes_saldo"
+
+    id_usuario = Column(Integer, primary_key=True, autoincrement=False)
+    fecha      = Column(Date, nullable=False)                         # primer día con saldo proyectado < 0
+    minimo     = Column(Centavos(), nullable=False)                   # saldo mínimo proyectado
+    calculado  = Column(DateTime, default=datetime.utcnow, nullable=False)
+    tomado_por = Column(String(32), nullable=True)                    # NULL: aviso pendiente
+
+    __table_args__ = (
+        Index("idx_faltante_tomado", "tomado_por"),
+    )
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, Enum
+from datetime import datetime
+from app.database import Base
+
+class ClaveIdempotencia(Base):
+    __tablename__ = "idempotencia"
+
+    clave        = Column(String(255), primary_key=True)          # "<ruta>|u:<id_usuario>|<Idempotency-Key>"
+    huella       = Column(String(64), nullable=False)             # sha256 de método + ruta + query + cuerpo
+    estado       = Column(Enum('en_proceso', 'completada'), nullable=False, default='en_proceso')
+    dueno        = Column(String(32), nullable=True)              # token del request que la reservó
+    status_code  = Column(Integer, nullable=True)
+    content_type = Column(String(100), nullable=True)
+    cuerpo       = Column(LargeBinary, nullable=True)
+    creada       = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expira       = Column(DateTime, nullable=False, index=True)
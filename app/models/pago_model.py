@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, Date, ForeignKey, Enum, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Enum, Boolean
 from datetime import datetime
 from app.database import Base
+from app.utils.dinero import Centavos
 
 class PagoFijo(Base):
     __tablename__ = "pagos"
@@ -8,9 +9,11 @@ class PagoFijo(Base):
     id_pago = Column(Integer, primary_key=True, index=True)
     id_usuario = Column(Integer, ForeignKey("usuarios.id_usuario"), nullable=False)
     descripcion = Column(String, nullable=False)
-    monto = Column(Numeric(10, 2), nullable=False)
+    monto = Column(Centavos(), nullable=False)
     fecha_programada = Column(DateTime, nullable=False)
     categoria_id = Column(Integer, ForeignKey("categorias.id_categoria"), nullable=True)
     periodicidad = Column(Enum('none', 'weekly', 'monthly'), nullable=False, default='none')
     proxima_ejecucion = Column(Date, nullable=False)
     activo = Column(Boolean, nullable=False, default=True)
+
+    __table_args__ = {"sqlite_autoincrement": True}  # rango de ids por shard (utils/shards.py)
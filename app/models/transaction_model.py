@@ -1,17 +1,28 @@
 # app/models/transaction_model.py
-from sqlalchemy import Column, Integer, Numeric, DateTime, String, ForeignKey, Enum
+from sqlalchemy import Column, Integer, DateTime, String, Enum, Index
 from datetime import datetime
 from app.database import Base
+from app.utils.dinero import Centavos
 
 class Transaction(Base):
+    """
+    Sin FOREIGN KEY, igual que en MySQL tras la migración 003 (tabla particionada): con sharding
+    destinatario_id suele ser un usuario de otro shard y la llave lo rechazaría.
+    """
     __tablename__ = "transacciones"
 
     id_transaccion  = Column(Integer, primary_key=True, index=True)
-    id_usuario      = Column(Integer, ForeignKey("usuarios.id_usuario"), nullable=False)
+    id_usuario      = Column(Integer, nullable=False)
     tipo            = Column(Enum('ingreso','egreso','envio','solicitud'), nullable=False)
-    monto           = Column(Numeric(10, 2), nullable=False)
+    monto           = Column(Centavos(), nullable=False)
     fecha           = Column(DateTime, default=datetime.utcnow, nullable=False)
     descripcion     = Column(String, nullable=True)
-    categoria_id    = Column(Integer, ForeignKey("categorias.id_categoria"), nullable=True)
-    destinatario_id = Column(Integer, ForeignKey("usuarios.id_usuario"), nullable=True)
+    categoria_id    = Column(Integer, nullable=True)
+    destinatario_id = Column(Integer, nullable=True)
     estado          = Column(Enum('pendiente','completada','cancelada'), default='completada', nullable=False)
+
+    # Cubre las sumas por usuario/tipo/categoría en un rango de fecha sin leer la tabla
+    __table_args__ = (
+        Index("idx_tx_cubriente", "id_usuario", "tipo", "categoria_id", "fecha", "monto"),
+        {"sqlite_autoincrement": True},  # rango de ids por shard (utils/shards.py)
+    )
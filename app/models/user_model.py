@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Numeric
+from sqlalchemy import Column, Integer, String, DateTime
 from app.database import Base
+from app.utils.dinero import Centavos
 from datetime import datetime
 
 class User(Base):
@@ -12,4 +13,4 @@ class User(Base):
     contrasena_hash = Column(String(255), nullable=False)
     pin_seguridad = Column(String(10), nullable=True)
     fecha_registro = Column(DateTime, default=datetime.utcnow)
-    saldo = Column(Numeric(10, 2), default=0.00)
+    saldo = Column(Centavos(), default=0)
@@ -4,3 +4,10 @@ from .categoria_routes import router as categoria_routes
 from .presupuestos_routes import router as presupuestos_routes
 from .pago_routes import router as pago_routes
 from .estadisticas_routes import router as estadisticas_routes
+from .transferencias_routes import router as transferencias_routes
+from .estados_cuenta_routes import router as estados_cuenta_routes
+from .diagnostico_routes import router as diagnostico_routes
+from .busqueda_routes import router as busqueda_routes
+from .anomalias_routes import router as anomalias_routes
+from .eventos_routes import router as eventos_routes
+from .cambios_routes import router as cambios_routes
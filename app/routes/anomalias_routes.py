@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import List, Optional
+from app.database import get_db
+from app.models.anomalia_model import Anomalia
+from app.utils.periodos import inicio_dia
+from app.utils.serializacion import columnas_de, respuesta_filas
+from app.utils.dinero import Monto
+
+router = APIRouter(tags=["Anomalías"])
+
+class AnomaliaRespuesta(BaseModel):
+    id: int
+    id_transaccion: int
+    id_usuario: int
+    categoria_id: Optional[int]
+    fecha: datetime
+    monto: Monto
+    motivo: str
+    puntaje: float
+    detalle: Optional[str]
+    detectada_en: datetime
+
+    class Config:
+        orm_mode = True
+
+# ────── Anomalías de gasto (calculadas por el job nocturno; aquí solo se leen) ──────
+@router.get("/anomalias/{id_usuario}", response_model=List[AnomaliaRespuesta])
+def listar_anomalias(
+    id_usuario: int,
+    desde: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    motivo: Optional[str] = Query(None, description="'monto' o 'frecuencia'"),
+    limite: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    if motivo and motivo not in ("monto", "frecuencia"):
+        raise HTTPException(status_code=400, detail="Motivo inválido. Usa 'monto' o 'frecuencia'.")
+    query = db.query(*columnas_de(Anomalia, AnomaliaRespuesta)).filter(Anomalia.id_usuario == id_usuario)
+    if desde:
+        try:
+            query = query.filter(Anomalia.fecha >= inicio_dia(datetime.strptime(desde, "%Y-%m-%d").date()))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato de fecha inválido. Usa YYYY-MM-DD")
+    if motivo:
+        query = query.filter(Anomalia.motivo == motivo)
+    # idx_anomalia_usuario_fecha: lectura por rango sin ordenar en memoria
+    return respuesta_filas(query.order_by(Anomalia.fecha.desc()).limit(limite), AnomaliaRespuesta)
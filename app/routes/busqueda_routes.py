@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional
+from app.database import get_db
+from app.utils.busqueda import FUENTES, buscar
+from app.utils.autocompletar import sugerir
+
+router = APIRouter(tags=["Búsqueda"])
+
+# ────── Búsqueda de texto en descripciones (transacciones y pagos) ──────
+@router.get("/busqueda")
+def buscar_descripciones(
+    id_usuario: int = Query(...),
+    q: str = Query(..., min_length=1, description="Texto a buscar en la descripción"),
+    fuente: Optional[str] = Query(None, description="'transacciones' o 'pagos' (por defecto ambas)"),
+    desde: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    hasta: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    categoria_id: Optional[int] = None,
+    limite: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Valor de 'siguiente' de la página anterior"),
+    db: Session = Depends(get_db)
+):
+    if fuente and fuente not in FUENTES:
+        raise HTTPException(status_code=400, detail="Fuente inválida. Usa 'transacciones' o 'pagos'.")
+    try:
+        ini = datetime.strptime(desde, "%Y-%m-%d").date() if desde else None
+        fin = datetime.strptime(hasta, "%Y-%m-%d").date() if hasta else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido. Usa YYYY-MM-DD")
+
+    try:
+        resultados, siguiente = buscar(
+            db, id_usuario, q,
+            fuentes=(fuente,) if fuente else FUENTES,
+            desde=ini, hasta=fin, categoria_id=categoria_id,
+            limite=limite, cursor=cursor,
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+
+    return {"resultados": resultados, "siguiente": siguiente}
+
+# ────── Autocompletar descripciones y categorías mientras se escribe ──────
+@router.get("/busqueda/autocompletar")
+def autocompletar(
+    id_usuario: int = Query(...),
+    q: str = Query(..., min_length=1, max_length=100, description="Lo que el usuario lleva escrito"),
+    tipo: Optional[str] = Query(None, description="'descripcion' o 'categoria' (por defecto ambas)"),
+    limite: int = Query(8, ge=1, le=20),
+    db: Session = Depends(get_db)
+):
+    """
+    Sugerencias por prefijo (del texto o de cualquiera de sus primeras palabras), ordenadas por
+    cuántas veces y qué tan recientemente las usó este usuario. Se sirven de un índice en memoria
+    por usuario que se arma con la primera consulta y se actualiza con cada alta.
+    """
+    if tipo and tipo not in ("descripcion", "categoria"):
+        raise HTTPException(status_code=400, detail="Tipo inválido. Usa 'descripcion' o 'categoria'.")
+    return {"sugerencias": sugerir(db, id_usuario, q, limite, tipo)}
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+from app.database import get_db
+from app.models.budget_model import Budget
+from app.models.pago_model import PagoFijo
+from app.models.transaction_model import Transaction
+from app.routes.pago_routes import PagoRespuesta
+from app.routes.presupuestos_routes import PresupuestoRespuesta
+from app.routes.transaction_routes import TransaccionRespuesta
+from app.utils.cambios import cabeza, cursor_vigente, leer_cambios
+from app.utils.serializacion import RespuestaJSONRapida, columnas_de, filas_a_dicts
+
+router = APIRouter(tags=["Sincronización"])
+
+# entidad -> (clave en la respuesta, modelo, PK, esquema)
+_FUENTES = {
+    "transaccion": ("transacciones", Transaction, Transaction.id_transaccion, TransaccionRespuesta),
+    "pago": ("pagos", PagoFijo, PagoFijo.id_pago, PagoRespuesta),
+    "presupuesto": ("presupuestos", Budget, Budget.id_presupuesto, PresupuestoRespuesta),
+}
+
+def _vacio(cursor: int, reiniciar: bool, hay_mas: bool = False) -> dict:
+    respuesta = {"cursor": cursor, "hay_mas": hay_mas, "reiniciar": reiniciar}
+    for clave, *_ in _FUENTES.values():
+        respuesta[clave] = []
+    respuesta["eliminados"] = {clave: [] for clave, *_ in _FUENTES.values()}
+    return respuesta
+
+# ────── Feed de cambios para sincronización incremental ──────
+@router.get("/cambios/{id_usuario}")
+def feed_cambios(
+    id_usuario: int,
+    cursor: Optional[int] = Query(None, ge=0, description="Valor de 'cursor' de la respuesta anterior"),
+    limite: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db)
+):
+    """
+    Filas creadas/modificadas (estado actual) e ids eliminados desde `cursor`. Sin cursor, o con
+    `reiniciar: true`, el cliente descarga los listados completos una vez y sigue desde el cursor
+    devuelto. Repetir una página es inocuo: cada fila es el estado vigente.
+    """
+    if cursor is None or not cursor_vigente(db, id_usuario, cursor):
+        return RespuestaJSONRapida(_vacio(cabeza(db, id_usuario), reiniciar=True))
+
+    ultimas, nuevo, hay_mas = leer_cambios(db, id_usuario, cursor, limite)
+    respuesta = _vacio(nuevo, reiniciar=False, hay_mas=hay_mas)
+
+    vigentes: Dict[str, List[int]] = {}
+    for entidad, id_entidad, operacion in ultimas:
+        if operacion == "baja":
+            respuesta["eliminados"][_FUENTES[entidad][0]].append(id_entidad)
+        else:
+            vigentes.setdefault(entidad, []).append(id_entidad)
+
+    # Una consulta por entidad con los ids de la página; lo que ya no existe es lápida
+    for entidad, ids in vigentes.items():
+        clave, modelo, pk, esquema = _FUENTES[entidad]
+        filas = db.query(*columnas_de(modelo, esquema)).filter(pk.in_(ids)).all()
+        encontrados = {getattr(f, pk.key) for f in filas}
+        respuesta[clave] = filas_a_dicts(filas, esquema)
+        respuesta["eliminados"][clave].extend(i for i in ids if i not in encontrados)
+    return RespuestaJSONRapida(respuesta)
@@ -4,6 +4,7 @@ from typing import List, Optional
 from pydantic import BaseModel
 from app.database import get_db
 from app.models.categoria_model import Categoria
+from app.utils.serializacion import columnas_de, respuesta_filas
 
 router = APIRouter(tags=["Categorías"])
 
@@ -41,10 +42,10 @@ def listar_categorias(
     limit: int = 20,
     db: Session = Depends(get_db)
 ):
-    query = db.query(Categoria)
+    query = db.query(*columnas_de(Categoria, CategoriaRespuesta))
     if tipo:
         query = query.filter(Categoria.tipo == tipo.lower().strip())
-    return query.offset(skip).limit(limit).all()
+    return respuesta_filas(query.offset(skip).limit(limit), CategoriaRespuesta)
 
 # ────── Obtener una ──────
 @router.get("/categorias/{id_categoria}", response_model=CategoriaRespuesta)
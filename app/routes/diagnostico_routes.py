@@ -0,0 +1,180 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+from datetime import datetime
+import hmac
+import json
+import os
+
+from app.database import engine, get_db
+from app.models.archivo_model import PeriodoArchivado
+from app.models.pago_model import PagoFijo
+from app.utils import autocompletar, conciliacion, consultas_lentas, corridas, notificaciones, particiones, perfilador, sms
+from app.utils.periodos import inicio_mes, mes_siguiente
+
+router = APIRouter(tags=["Diagnóstico"])
+
+DIAGNOSTICO_TOKEN = os.environ.get("DIAGNOSTICO_TOKEN")
+
+def _verificar_token(token: Optional[str]):
+    # Sin DIAGNOSTICO_TOKEN los endpoints no existen: exponen SQL, particiones, proveedores y cron
+    if not DIAGNOSTICO_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode(), DIAGNOSTICO_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Token de diagnóstico inválido.")
+
+# ────── Consultas SQL por huella / origen ──────
+@router.get("/diagnostico/consultas")
+def diagnostico_consultas(
+    agrupar: str = Query("huella", pattern="^(huella|origen|ambos)$"),
+    orden: str = Query("total_ms", pattern="^(total_ms|max_ms|conteo|lentas)$"),
+    limite: int = Query(50, ge=1, le=500),
+    x_diagnostico_token: Optional[str] = Header(None),
+) -> List[dict]:
+    _verificar_token(x_diagnostico_token)
+    return consultas_lentas.resumen(agrupar=agrupar, orden=orden, limite=limite)
+
+@router.delete("/diagnostico/consultas")
+def reiniciar_diagnostico_consultas(x_diagnostico_token: Optional[str] = Header(None)):
+    _verificar_token(x_diagnostico_token)
+    consultas_lentas.reiniciar()
+    return {"mensaje": "Estadísticas de consultas reiniciadas"}
+
+# ────── Particiones de transacciones y archivo frío ──────
+@router.get("/diagnostico/particiones")
+def diagnostico_particiones(
+    x_diagnostico_token: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    _verificar_token(x_diagnostico_token)
+    mes = inicio_mes(datetime.utcnow().date())
+    archivados = db.query(PeriodoArchivado).order_by(PeriodoArchivado.periodo).all()
+    return {
+        "particiones": [
+            {"nombre": p["nombre"], "hasta": str(p["hasta"]) if p["hasta"] else "MAXVALUE", "filas": p["filas"]}
+            for p in particiones.particiones(engine)
+        ],
+        # El mes en curso debe tocar una sola partición
+        "poda_mes_actual": particiones.verificar_poda(engine, mes, mes_siguiente(mes)),
+        "archivo": {
+            "corte": str(archivados[-1].hasta) if archivados else None,
+            "periodos": [
+                {"periodo": a.periodo, "filas": a.filas, "archivo": a.archivo, "sha256": a.sha256}
+                for a in archivados
+            ],
+        },
+    }
+
+# ────── Proveedores externos (SMTP / Twilio) ──────
+@router.get("/diagnostico/proveedores")
+def diagnostico_proveedores(x_diagnostico_token: Optional[str] = Header(None)) -> List[dict]:
+    _verificar_token(x_diagnostico_token)
+    return [notificaciones.circuito_smtp.estado(), sms.circuito_sms.estado()]
+
+# ────── Índices de autocompletar en memoria (este worker) ──────
+@router.get("/diagnostico/autocompletar")
+def diagnostico_autocompletar(x_diagnostico_token: Optional[str] = Header(None)):
+    _verificar_token(x_diagnostico_token)
+    return dict(autocompletar.estadisticas, usuarios=len(autocompletar._indices),
+                maximo=autocompletar.AUTOCOMPLETAR_MAX_USUARIOS)
+
+# ────── Conciliación de saldos (reporte de la última corrida o de una fecha) ──────
+@router.get("/diagnostico/conciliacion")
+def diagnostico_conciliacion(
+    corrida: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}(-shard\d+)?$",
+                                   description="YYYY-MM-DD (con sharding, YYYY-MM-DD-shardN)"),
+    limite: int = Query(100, ge=0, le=1000, description="Desvíos a incluir"),
+    x_diagnostico_token: Optional[str] = Header(None),
+):
+    _verificar_token(x_diagnostico_token)
+    corrida = corrida or conciliacion.ultima_corrida()
+    if not corrida or not os.path.isdir(conciliacion.ruta_corrida(corrida)):
+        raise HTTPException(status_code=404, detail="No hay corridas de conciliación.")
+    desvios = []
+    if limite and os.path.isfile(conciliacion.ruta_desvios(corrida)):
+        with open(conciliacion.ruta_desvios(corrida), encoding="utf-8") as f:
+            for linea in f:
+                desvios.append(json.loads(linea))
+                if len(desvios) >= limite:
+                    break
+    return {"corrida": corrida, "avance": conciliacion.leer_avance(corrida), "desvios": desvios}
+
+# ────── Cron jobs: historial de corridas y cola de pagos vencidos ──────
+@router.get("/diagnostico/cron")
+def diagnostico_cron(
+    horas: int = Query(24, ge=1, le=24 * 30, description="Ventana del historial"),
+    recientes: int = Query(10, ge=0, le=200, description="Últimas corridas a incluir por job"),
+    job: Optional[str] = Query(None, max_length=64),
+    x_diagnostico_token: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Por job: corridas por estado (ok/error/omitida/perdida), p50/p95 de duración y de retraso contra
+    la hora programada, y totales. cola_pagos es el atraso actual entre proxima_ejecucion y ahora.
+    """
+    _verificar_token(x_diagnostico_token)
+    ahora = datetime.utcnow()
+    # Con sharding llega una fila por shard: se acumula
+    vencidos, mas_antiguo = 0, None
+    for conteo, minimo in (
+        db.query(func.count(PagoFijo.id_pago), func.min(PagoFijo.proxima_ejecucion))
+          .filter(PagoFijo.activo == True, PagoFijo.proxima_ejecucion <= ahora.date())
+          .all()
+    ):
+        vencidos += conteo or 0
+        if minimo is not None and (mas_antiguo is None or minimo < mas_antiguo):
+            mas_antiguo = minimo
+    return {
+        "jobs": corridas.resumen(horas=horas, recientes=recientes, job=job),
+        "proximas": corridas.proximas(),  # None: este worker no corre el scheduler (ENABLE_CRON=0)
+        "cola_pagos": {
+            "vencidos": vencidos,
+            "mas_antiguo": str(mas_antiguo) if mas_antiguo else None,
+            "lag_s": round((ahora - datetime.combine(mas_antiguo, datetime.min.time())).total_seconds(), 1)
+                     if mas_antiguo else None,
+        },
+    }
+
+# ────── Perfiles de requests (header X-Perfilar o muestreo por ruta) ──────
+class MuestreoPerfiles(BaseModel):
+    rutas: Dict[str, float] = Field(..., description="{'GET /estadisticas/dashboard': 0.1}: fracción a perfilar por ruta")
+    usuarios: List[int] = Field(default_factory=list, description="Solo estos id_usuario (vacío: todos)")
+    minutos: int = Field(60, ge=1, le=24 * 60, description="Vencimiento; después vuelve a PERFIL_RUTAS")
+
+@router.get("/diagnostico/perfiles")
+def listar_perfiles(
+    limite: int = Query(50, ge=1, le=500),
+    x_diagnostico_token: Optional[str] = Header(None),
+):
+    _verificar_token(x_diagnostico_token)
+    return {"muestreo": perfilador.estado_muestreo(), "perfiles": perfilador.listar(limite)}
+
+@router.put("/diagnostico/perfiles/muestreo")
+def fijar_muestreo_perfiles(data: MuestreoPerfiles, x_diagnostico_token: Optional[str] = Header(None)):
+    """Lo leen todos los workers que comparten PERFIL_DIR en menos de PERFIL_RECARGA_S, sin reiniciar."""
+    _verificar_token(x_diagnostico_token)
+    invalidas = [r for r, tasa in data.rutas.items() if " /" not in r or not 0 <= tasa <= 1]
+    if invalidas:
+        raise HTTPException(status_code=400, detail=f"Rutas inválidas (usa 'GET /ruta': 0..1): {', '.join(invalidas)}")
+    return perfilador.fijar_muestreo(data.rutas, data.usuarios, data.minutos)
+
+@router.delete("/diagnostico/perfiles/muestreo")
+def quitar_muestreo_perfiles(x_diagnostico_token: Optional[str] = Header(None)):
+    _verificar_token(x_diagnostico_token)
+    perfilador.quitar_muestreo()
+    return {"mensaje": "Muestreo de perfiles desactivado (queda PERFIL_RUTAS si está configurado)"}
+
+@router.get("/diagnostico/perfiles/{id_perfil}")
+def obtener_perfil(
+    id_perfil: str,
+    formato: str = Query("json", pattern="^(json|folded)$", description="'folded': pilas para flamegraph/speedscope"),
+    x_diagnostico_token: Optional[str] = Header(None),
+):
+    _verificar_token(x_diagnostico_token)
+    perfil = perfilador.leer(id_perfil, formato)
+    if perfil is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado.")
+    return PlainTextResponse(perfil) if formato == "folded" else perfil
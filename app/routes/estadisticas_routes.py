@@ -1,22 +1,78 @@
 from fastapi import APIRouter, Depends, HTTPException , Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func
+import numpy as np
 from typing import List, Dict ,Optional
 from app.database import get_db
 from datetime import datetime, timedelta , date
 from app.models.transaction_model import Transaction
 from app.models.categoria_model import Categoria
+from app.utils.archivo import movimientos
+from app.utils.dinero import a_pesos
+from app.utils.periodos import en_rango, rango_mes_de
+from app.utils.series import GRANULARIDADES, METODOS_MUESTREO, calendario, expr_periodo, lttb, reducir_suma, rellenar
 
 router = APIRouter(tags=["Estadísticas"])
 
+METRICAS = ("ingresos", "egresos", "balance", "conteo")
+
+def _serie_agregada(db: Session, id_usuario: int, ini: date, fin: date, granularidad: str, por_categoria: bool = False):
+    """
+    Un solo GROUP BY (periodo[, categoría], tipo) sobre un rango sargable de fecha, leyendo
+    filas calientes y resúmenes archivados; el calendario y el relleno de huecos se hacen con NumPy.
+    """
+    m = movimientos(db, id_usuario, ini, fin + timedelta(days=1), tipos=("ingreso", "egreso"))
+    periodo = expr_periodo(m.c.fecha, granularidad, db.get_bind().dialect.name).label("periodo")
+    columnas = [periodo, m.c.tipo, func.sum(m.c.monto), func.sum(m.c.conteo)]
+    agrupar = [periodo, m.c.tipo]
+    if por_categoria:
+        columnas[1:1] = [m.c.categoria_id, Categoria.nombre]
+        agrupar[1:1] = [m.c.categoria_id, Categoria.nombre]
+
+    q = db.query(*columnas).select_from(m)
+    if por_categoria:
+        q = q.outerjoin(Categoria, Categoria.id_categoria == m.c.categoria_id)
+    filas = q.group_by(*agrupar).all()
+
+    if por_categoria:
+        nombres = {f[1]: f[2] or "Sin categoría" for f in filas}
+        claves = sorted(nombres, key=lambda c: (c is None, c or 0))
+        filas_clave = [f[1] for f in filas]
+    else:
+        nombres = {None: None}
+        claves = [None]
+        filas_clave = [None] * len(filas)
+
+    periodos = calendario(ini, fin, granularidad)
+    es_ingreso = [f[-3] == "ingreso" for f in filas]
+    montos = [f[-2] or 0 for f in filas]   # centavos
+    claves, m = rellenar(
+        periodos,
+        claves,
+        [f[0] for f in filas],
+        filas_clave,
+        {
+            "ingresos": [v if i else 0 for v, i in zip(montos, es_ingreso)],
+            "egresos": [0 if i else v for v, i in zip(montos, es_ingreso)],
+            "conteo": [int(f[-1]) for f in filas],
+        },
+    )
+    m["balance"] = m["ingresos"] - m["egresos"]
+    return periodos, claves, nombres, m
+
 
 @router.get("/estadisticas/dashboard")
 def dashboard_estadisticas(
     id_usuario: int = Query(..., description="ID del usuario"),
     desde: Optional[str] = Query(None, description="YYYY-MM-DD"),
     hasta: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    max_points: Optional[int] = Query(None, ge=2, le=5000, description="Máximo de puntos en serie_diaria"),
+    muestreo: str = Query("suma", description="'suma' (cubetas que conservan totales) o 'lttb' (conserva la forma)"),
     db: Session = Depends(get_db)
 ):
+    if muestreo not in METODOS_MUESTREO:
+        raise HTTPException(status_code=400, detail="Muestreo inválido. Usa 'suma' o 'lttb'.")
+
     # 1) Rango por defecto: últimos 30 días (incluyendo hoy)
     if not desde or not hasta:
         fin = datetime.utcnow().date()
@@ -27,108 +83,65 @@ def dashboard_estadisticas(
             ini = datetime.strptime(desde, "%Y-%m-%d").date()
         except ValueError:
             raise HTTPException(status_code=400, detail="Formato de fecha inválido. Usa YYYY-MM-DD")
+    if ini > fin:
+        raise HTTPException(status_code=400, detail="'desde' debe ser anterior o igual a 'hasta'")
 
-    # 2) Resumen (no depende de categoría)
-    ingresos = (
-        db.query(func.sum(Transaction.monto))
-          .filter(
-              Transaction.id_usuario == id_usuario,
-              Transaction.tipo == "ingreso",
-              func.date(Transaction.fecha).between(ini, fin)
-          ).scalar()
-    ) or 0
-    egresos = (
-        db.query(func.sum(Transaction.monto))
-          .filter(
-              Transaction.id_usuario == id_usuario,
-              Transaction.tipo == "egreso",
-              func.date(Transaction.fecha).between(ini, fin)
-          ).scalar()
-    ) or 0
-
-    # 3) Por categoría: usar LEFT OUTER JOIN y COALESCE para incluir transacciones sin categoría
+    # 2) Resumen y 3) por categoría en un solo GROUP BY (categoría, tipo); LEFT JOIN + COALESCE
+    #    para incluir transacciones sin categoría. Filas calientes + resúmenes archivados.
+    m = movimientos(db, id_usuario, ini, fin + timedelta(days=1), tipos=("ingreso", "egreso"))
     categoria_col = func.coalesce(Categoria.nombre, "Sin categoría").label("categoria")
-
-    por_cat_ing = (
-        db.query(
-            categoria_col,
-            func.sum(Transaction.monto).label("total")
-        )
-        .outerjoin(Categoria, Categoria.id_categoria == Transaction.categoria_id)
-        .filter(
-            Transaction.id_usuario == id_usuario,
-            Transaction.tipo == "ingreso",
-            func.date(Transaction.fecha).between(ini, fin)
-        )
-        .group_by(categoria_col)
-        .all()
-    )
-
-    por_cat_egr = (
-        db.query(
-            categoria_col,
-            func.sum(Transaction.monto).label("total")
-        )
-        .outerjoin(Categoria, Categoria.id_categoria == Transaction.categoria_id)
-        .filter(
-            Transaction.id_usuario == id_usuario,
-            Transaction.tipo == "egreso",
-            func.date(Transaction.fecha).between(ini, fin)
-        )
-        .group_by(categoria_col)
-        .all()
-    )
-
-    # 4) Serie diaria (ingresos / egresos por día del rango)
-    serie_ing = dict(
-        db.query(
-            func.date(Transaction.fecha).label("fecha"),
-            func.sum(Transaction.monto).label("total")
-        )
-        .filter(
-            Transaction.id_usuario == id_usuario,
-            Transaction.tipo == "ingreso",
-            func.date(Transaction.fecha).between(ini, fin)
-        )
-        .group_by(func.date(Transaction.fecha))
-        .all()
-    )
-    serie_egr = dict(
-        db.query(
-            func.date(Transaction.fecha).label("fecha"),
-            func.sum(Transaction.monto).label("total")
-        )
-        .filter(
-            Transaction.id_usuario == id_usuario,
-            Transaction.tipo == "egreso",
-            func.date(Transaction.fecha).between(ini, fin)
-        )
-        .group_by(func.date(Transaction.fecha))
+    filas = (
+        db.query(categoria_col, m.c.tipo, func.sum(m.c.monto).label("total"))
+        .select_from(m)
+        .outerjoin(Categoria, Categoria.id_categoria == m.c.categoria_id)
+        .group_by(categoria_col, m.c.tipo)
         .all()
     )
+    por_cat_ing = [(c, t) for c, tipo, t in filas if tipo == "ingreso"]
+    por_cat_egr = [(c, t) for c, tipo, t in filas if tipo == "egreso"]
+    ingresos = sum((t for _, t in por_cat_ing), 0)
+    egresos = sum((t for _, t in por_cat_egr), 0)
 
-    # 5) Normalizar serie: un elemento por día aunque no haya movimientos
-    dias = []
-    cur: date = ini
-    while cur <= fin:
-        dias.append({
-            "fecha": str(cur),
-            "ingresos": float(serie_ing.get(cur, 0) or 0),
-            "egresos": float(serie_egr.get(cur, 0) or 0),
-        })
-        cur += timedelta(days=1)
+    # 4) Serie diaria (ingresos / egresos por día del rango), huecos rellenados en bloque
+    periodos, _, _, serie = _serie_agregada(db, id_usuario, ini, fin, "dia")
+    valores = np.vstack([serie["ingresos"][0], serie["egresos"][0]])
+    n_dias = len(periodos)
+    if max_points and n_dias > max_points:
+        # Tamaño de respuesta acotado sin importar el rango (el cliente dibuja pocos píxeles)
+        if muestreo == "lttb":
+            idx = lttb(periodos.astype(np.int64), valores, max_points)
+            periodos, valores = periodos[idx], valores[:, idx]
+            dias = [
+                {"fecha": f, "ingresos": i, "egresos": e}
+                for f, i, e in zip(periodos.astype(str).tolist(), (valores[0] / 100).tolist(), (valores[1] / 100).tolist())
+            ]
+        else:
+            inicios, valores = reducir_suma(valores, max_points)
+            fines = np.append(inicios[1:], n_dias) - 1
+            dias = [
+                {"fecha": f, "hasta": h, "ingresos": i, "egresos": e}
+                for f, h, i, e in zip(periodos[inicios].astype(str).tolist(), periodos[fines].astype(str).tolist(),
+                                      (valores[0] / 100).tolist(), (valores[1] / 100).tolist())
+            ]
+    else:
+        dias = [
+            {"fecha": f, "ingresos": i, "egresos": e}
+            for f, i, e in zip(periodos.astype(str).tolist(), (valores[0] / 100).tolist(), (valores[1] / 100).tolist())
+        ]
 
     return {
         "resumen": {
-            "ingresos": float(ingresos),
-            "egresos": float(egresos),
-            "balance": float(ingresos) - float(egresos),
+            "ingresos": a_pesos(ingresos),
+            "egresos": a_pesos(egresos),
+            "balance": a_pesos(ingresos - egresos),
         },
         "por_categoria": {
-            "ingresos": [{"categoria": c, "total": float(t)} for c, t in por_cat_ing],
-            "egresos":  [{"categoria": c, "total": float(t)} for c, t in por_cat_egr],
+            "ingresos": [{"categoria": c, "total": a_pesos(t)} for c, t in por_cat_ing],
+            "egresos":  [{"categoria": c, "total": a_pesos(t)} for c, t in por_cat_egr],
         },
         "serie_diaria": dias,
+        "muestreo": {"metodo": muestreo if max_points and n_dias > max_points else None,
+                     "puntos_originales": n_dias, "puntos": len(dias)},
         "rango": {"desde": str(ini), "hasta": str(fin)},
     }
 # ────── Obtener resumen de ingresos/egresos por categoría ──────
@@ -140,19 +153,19 @@ def obtener_estadisticas_por_categoria(id_usuario: int, tipo: str, db: Session =
     if tipo not in ["ingreso", "egreso"]:
         raise HTTPException(status_code=400, detail="Tipo inválido. Usa 'ingreso' o 'egreso'.")
 
+    m = movimientos(db, id_usuario, tipos=(tipo,))
     resultados = (
         db.query(
             Categoria.nombre.label("categoria"),
-            func.sum(Transaction.monto).label("total")
+            func.sum(m.c.monto).label("total")
         )
-        .join(Categoria, Categoria.id_categoria == Transaction.categoria_id)
-        .filter(Transaction.id_usuario == id_usuario)
-        .filter(Transaction.tipo == tipo)
+        .select_from(m)
+        .join(Categoria, Categoria.id_categoria == m.c.categoria_id)
         .group_by(Categoria.nombre)
         .all()
     )
 
-    return [{"categoria": r.categoria, "total": float(r.total)} for r in resultados]
+    return [{"categoria": r.categoria, "total": a_pesos(r.total)} for r in resultados]
 
 # ────── Obtener resumen mensual por tipo ──────
 @router.get("/estadisticas/mensual")
@@ -160,33 +173,21 @@ def obtener_estadisticas_mensual(id_usuario: int, db: Session = Depends(get_db))
     """
     Devuelve el total de ingresos y egresos del mes actual
     """
-    from datetime import datetime
-
-    hoy = datetime.utcnow()
-    mes = hoy.month
-    anio = hoy.year
-
-    ingresos = (
-        db.query(func.sum(Transaction.monto))
-        .filter(Transaction.id_usuario == id_usuario)
-        .filter(Transaction.tipo == "ingreso")
-        .filter(func.extract("month", Transaction.fecha) == mes)
-        .filter(func.extract("year", Transaction.fecha) == anio)
-        .scalar()
-    ) or 0
-
-    egresos = (
-        db.query(func.sum(Transaction.monto))
+    # Un solo GROUP BY por tipo sobre [inicio de mes, inicio del siguiente)
+    totales = dict(
+        db.query(Transaction.tipo, func.sum(Transaction.monto))
         .filter(Transaction.id_usuario == id_usuario)
-        .filter(Transaction.tipo == "egreso")
-        .filter(func.extract("month", Transaction.fecha) == mes)
-        .filter(func.extract("year", Transaction.fecha) == anio)
-        .scalar()
-    ) or 0
+        .filter(Transaction.tipo.in_(("ingreso", "egreso")))
+        .filter(en_rango(Transaction.fecha, rango_mes_de(datetime.utcnow())))
+        .group_by(Transaction.tipo)
+        .all()
+    )
+    ingresos = totales.get("ingreso") or 0
+    egresos = totales.get("egreso") or 0
 
     return {
-        "ingresos_mes_actual": float(ingresos),
-        "egresos_mes_actual": float(egresos)
+        "ingresos_mes_actual": a_pesos(ingresos),
+        "egresos_mes_actual": a_pesos(egresos)
     }
 
 @router.get("/estadisticas/anual")
@@ -194,32 +195,66 @@ def obtener_estadisticas_anuales(id_usuario: int, anio: int, db: Session = Depen
     """
     Devuelve lista con totales mensuales de ingresos y egresos para el año especificado.
     """
-    ingresos_mensuales = [0.0] * 12
-    egresos_mensuales = [0.0] * 12
-
-    for mes in range(1, 13):
-        ingresos = (
-            db.query(func.sum(Transaction.monto))
-            .filter(Transaction.id_usuario == id_usuario)
-            .filter(Transaction.tipo == "ingreso")
-            .filter(func.extract("month", Transaction.fecha) == mes)
-            .filter(func.extract("year", Transaction.fecha) == anio)
-            .scalar()
-        ) or 0
-
-        egresos = (
-            db.query(func.sum(Transaction.monto))
-            .filter(Transaction.id_usuario == id_usuario)
-            .filter(Transaction.tipo == "egreso")
-            .filter(func.extract("month", Transaction.fecha) == mes)
-            .filter(func.extract("year", Transaction.fecha) == anio)
-            .scalar()
-        ) or 0
-
-        ingresos_mensuales[mes - 1] = float(ingresos)
-        egresos_mensuales[mes - 1] = float(egresos)
+    # Un GROUP BY por mes (caliente + archivado) en lugar de 24 consultas
+    _, _, _, m = _serie_agregada(db, id_usuario, date(anio, 1, 1), date(anio, 12, 31), "mes")
+    ingresos_mensuales = (m["ingresos"][0] / 100).tolist()
+    egresos_mensuales = (m["egresos"][0] / 100).tolist()
 
     return {
         "ingresos_por_mes": ingresos_mensuales,
         "egresos_por_mes": egresos_mensuales
-    }
\ No newline at end of file
+    }
+
+# ────── Serie temporal genérica (día / semana / mes / trimestre) ──────
+@router.get("/estadisticas/serie")
+def serie_estadisticas(
+    id_usuario: int = Query(..., description="ID del usuario"),
+    desde: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    hasta: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    granularidad: str = Query("dia", description="dia, semana, mes o trimestre"),
+    metricas: str = Query("ingresos,egresos,balance", description="Lista separada por comas: " + ", ".join(METRICAS)),
+    por_categoria: bool = Query(False, description="Una serie por categoría"),
+    db: Session = Depends(get_db)
+):
+    if granularidad not in GRANULARIDADES:
+        raise HTTPException(status_code=400, detail=f"Granularidad inválida. Usa: {', '.join(GRANULARIDADES)}")
+    pedidas = [x.strip() for x in metricas.split(",") if x.strip()]
+    invalidas = [x for x in pedidas if x not in METRICAS]
+    if not pedidas or invalidas:
+        raise HTTPException(status_code=400, detail=f"Métricas inválidas. Usa: {', '.join(METRICAS)}")
+
+    if not desde or not hasta:
+        fin = datetime.utcnow().date()
+        ini = fin - timedelta(days=29)
+    else:
+        try:
+            fin = datetime.strptime(hasta, "%Y-%m-%d").date()
+            ini = datetime.strptime(desde, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato de fecha inválido. Usa YYYY-MM-DD")
+    if ini > fin:
+        raise HTTPException(status_code=400, detail="'desde' debe ser anterior o igual a 'hasta'")
+
+    periodos, claves, nombres, m = _serie_agregada(db, id_usuario, ini, fin, granularidad, por_categoria)
+
+    def _valores(nombre: str, i: int):
+        fila = m[nombre][i]
+        return fila.tolist() if nombre == "conteo" else (fila / 100).tolist()
+
+    respuesta = {
+        "granularidad": granularidad,
+        "rango": {"desde": str(ini), "hasta": str(fin)},
+        "periodos": periodos.astype(str).tolist(),
+    }
+    if por_categoria:
+        respuesta["por_categoria"] = [
+            {
+                "categoria_id": c,
+                "categoria": nombres[c],
+                "series": {nombre: _valores(nombre, i) for nombre in pedidas},
+            }
+            for i, c in enumerate(claves)
+        ]
+    else:
+        respuesta["series"] = {nombre: _valores(nombre, 0) for nombre in pedidas}
+    return respuesta
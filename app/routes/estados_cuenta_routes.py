@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException, Path
+from fastapi.responses import FileResponse
+import os
+
+from app.utils.estados_cuenta import periodos_disponibles, ruta_estado
+
+router = APIRouter(tags=["Estados de cuenta"])
+
+# ────── Estados de cuenta mensuales (archivos generados por el job de fin de mes) ──────
+@router.get("/estados-cuenta/{id_usuario}")
+def listar_estados_cuenta(id_usuario: int):
+    return {"id_usuario": id_usuario, "periodos": periodos_disponibles(id_usuario)}
+
+@router.get("/estados-cuenta/{id_usuario}/{periodo}")
+def obtener_estado_cuenta(id_usuario: int, periodo: str = Path(..., pattern=r"^\d{4}-\d{2}$", description="YYYY-MM")):
+    ruta = ruta_estado(periodo, id_usuario)
+    if not os.path.isfile(ruta):
+        raise HTTPException(status_code=404, detail="Estado de cuenta no disponible para ese periodo.")
+    # Archivo estático: sin consultas a la BD; el cliente puede cachearlo (no cambia una vez generado)
+    return FileResponse(ruta, media_type="application/json", headers={"Cache-Control": "private, max-age=86400"})
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio
+
+from app.database import SessionLocal
+from app.models.user_model import User
+from app.utils import eventos
+from app.utils.dinero import a_pesos
+
+router = APIRouter(tags=["Eventos"])
+
+def _saldo_actual(id_usuario: int):
+    db = SessionLocal()
+    try:
+        return db.query(User.saldo).filter(User.id_usuario == id_usuario).first()
+    finally:
+        db.close()
+
+# ────── Eventos en vivo (Server-Sent Events): saldo, transacciones, pagos fijos, alertas ──────
+@router.get("/eventos/{id_usuario}")
+async def flujo_eventos(id_usuario: int, request: Request):
+    """
+    Mantiene la conexión abierta y empuja cada cambio del usuario: `saldo` (estado inicial),
+    `transaccion`, `transaccion_eliminada`, `solicitud`, `pago_fijo` y `alerta_presupuesto`.
+    Todos traen el saldo confirmado, así el cliente no vuelve a consultar /usuarios ni /resumen.
+    """
+    # Suscribir antes de leer el saldo: un cambio entre ambos pasos llega como evento
+    suscripcion = eventos.suscribir(id_usuario)
+    try:
+        fila = await run_in_threadpool(_saldo_actual, id_usuario)
+    except Exception:
+        eventos.cancelar(suscripcion)
+        raise
+    if fila is None:
+        eventos.cancelar(suscripcion)
+        raise HTTPException(status_code=404, detail="Usuario no encontrado.")
+
+    async def emitir():
+        try:
+            yield "retry: 3000\n\n"
+            yield eventos.formatear_sse({"id": 0, "tipo": "saldo", "datos": {"saldo": a_pesos(fila[0] or 0)}})
+            while not await request.is_disconnected():
+                try:
+                    evento = await asyncio.wait_for(suscripcion.cola.get(), timeout=eventos.EVENTOS_LATIDO_S)
+                except asyncio.TimeoutError:
+                    yield ": latido\n\n"
+                    continue
+                yield eventos.formatear_sse(evento)
+        finally:
+            eventos.cancelar(suscripcion)
+
+    return StreamingResponse(
+        emitir(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
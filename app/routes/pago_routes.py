@@ -1,10 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from sqlalchemy import cast, Date
 from datetime import datetime, timedelta, date
 from typing import List, Optional
 from pydantic import BaseModel, Field
-from decimal import Decimal
 import calendar
 from app.database import get_db
 from app.models.pago_model import PagoFijo
@@ -12,6 +11,10 @@ from app.models.user_model import User
 from app.models.budget_model import Budget
 from app.models.transaction_model import Transaction
 from app.utils.notificaciones import enviar_correo
+from app.utils.proyeccion import proyectar_usuario
+from app.utils.serializacion import columnas_de, respuesta_filas
+from app.utils.eventos import notificar, transaccion_a_dict
+from app.utils.dinero import Monto, MontoEntrada, formatear
 
 router = APIRouter(tags=["Pagos"])
 
@@ -23,18 +26,27 @@ def add_months(d: date, months: int) -> date:
     last_day = calendar.monthrange(y, m)[1]
     return date(y, m, min(d.day, last_day))
 
+def _reprogramar(pago: PagoFijo):
+    """Siguiente ejecución según la periodicidad; los pagos únicos se desactivan."""
+    if pago.periodicidad == "weekly":
+        pago.proxima_ejecucion = pago.proxima_ejecucion + timedelta(weeks=1)
+    elif pago.periodicidad == "monthly":
+        pago.proxima_ejecucion = add_months(pago.proxima_ejecucion, 1)
+    else:
+        pago.activo = False
+
 # ────── Esquemas ──────
 class PagoCrear(BaseModel):
     id_usuario: int
     descripcion: str
-    monto: float = Field(gt=0)
+    monto: MontoEntrada = Field(gt=0)
     fecha_programada: datetime
     categoria_id: Optional[int] = None
     periodicidad: str = Field(default="none", pattern="^(none|weekly|monthly)$")
 
 class PagoActualizar(BaseModel):
     descripcion: str
-    monto: float = Field(gt=0)
+    monto: MontoEntrada = Field(gt=0)
     fecha_programada: datetime
     categoria_id: Optional[int] = None
     periodicidad: str = Field(default="none", pattern="^(none|weekly|monthly)$")
@@ -43,7 +55,7 @@ class PagoRespuesta(BaseModel):
     id_pago: int
     id_usuario: int
     descripcion: str
-    monto: float
+    monto: Monto
     fecha_programada: datetime
     categoria_id: Optional[int] = None
     periodicidad: str
@@ -63,7 +75,7 @@ def crear_pago(data: PagoCrear, db: Session = Depends(get_db)):
     nuevo = PagoFijo(
         id_usuario=data.id_usuario,
         descripcion=data.descripcion,
-        monto=Decimal(data.monto),
+        monto=data.monto,
         fecha_programada=data.fecha_programada,
         categoria_id=data.categoria_id,
         periodicidad=data.periodicidad,
@@ -83,13 +95,13 @@ def listar_pagos(
     limit: int = 20,
     db: Session = Depends(get_db)
 ):
-    return (
-        db.query(PagoFijo)
+    query = (
+        db.query(*columnas_de(PagoFijo, PagoRespuesta))
         .filter(PagoFijo.id_usuario == id_usuario)
         .offset(skip)
         .limit(limit)
-        .all()
     )
+    return respuesta_filas(query, PagoRespuesta)
 
 # ────── Ejecutar pagos programados ──────
 @router.post("/pagos/ejecutar")
@@ -98,7 +110,7 @@ def ejecutar_pagos_automaticos(db: Session = Depends(get_db)):
 
     pagos = db.query(PagoFijo).filter(
         PagoFijo.activo == True,
-        cast(PagoFijo.proxima_ejecucion, Date) <= hoy
+        PagoFijo.proxima_ejecucion <= hoy
     ).all()
 
     ejecutados = 0
@@ -107,9 +119,9 @@ def ejecutar_pagos_automaticos(db: Session = Depends(get_db)):
 
     # Import local para evitar dependencias circulares
     try:
-        from app.routes.presupuestos_routes import obtener_presupuesto_disponible
+        from app.routes.presupuestos_routes import estado_presupuesto, alertar_cruce_por_pago
     except Exception:
-        obtener_presupuesto_disponible = None
+        estado_presupuesto = None
 
     for pago in pagos:
         usuario = db.query(User).filter(User.id_usuario == pago.id_usuario).first()
@@ -117,44 +129,41 @@ def ejecutar_pagos_automaticos(db: Session = Depends(get_db)):
             continue
 
         # 1) Verifica presupuesto por categoría (si aplica)
-        if obtener_presupuesto_disponible and pago.categoria_id:
-            disponible = obtener_presupuesto_disponible(db, pago.id_usuario, pago.categoria_id, datetime.utcnow())
-            if disponible < float(pago.monto):
+        presupuesto = None
+        if estado_presupuesto and pago.categoria_id:
+            presupuesto = estado_presupuesto(db, pago.id_usuario, pago.categoria_id, datetime.utcnow())
+            if presupuesto is not None and presupuesto[0] - presupuesto[1] < pago.monto:
                 enviar_correo(
                     destinatario=usuario.correo,
                     asunto="⚠ Presupuesto insuficiente para pago programado",
-                    mensaje=f"Tu pago '{pago.descripcion}' de ${pago.monto} excede el presupuesto de la categoría."
+                    mensaje=f"Tu pago '{pago.descripcion}' de ${formatear(pago.monto)} excede el presupuesto de la categoría."
                 )
                 omitidos_presupuesto += 1
-                # Reprogramar según periodicidad
-                if pago.periodicidad == "weekly":
-                    pago.proxima_ejecucion = pago.proxima_ejecucion + timedelta(weeks=1)
-                elif pago.periodicidad == "monthly":
-                    pago.proxima_ejecucion = add_months(pago.proxima_ejecucion, 1)
-                else:
-                    pago.activo = False
+                _reprogramar(pago)
                 db.commit()
                 continue
 
-        # 2) Verifica saldo
-        if (usuario.saldo or Decimal("0.00")) < pago.monto:
+        # 2) Débito condicional y relativo (bloquea la fila del usuario): un egreso, una
+        # transferencia o la reparación de la conciliación en paralelo no se pisan
+        cobrado = db.execute(
+            update(User)
+            .where(User.id_usuario == pago.id_usuario, User.saldo >= pago.monto)
+            .values(saldo=User.saldo - pago.monto)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        if not cobrado:
+            _reprogramar(pago)
+            db.commit()  # antes del correo: no retener el candado mientras responde SMTP
             enviar_correo(
                 destinatario=usuario.correo,
                 asunto="❗ Pago no ejecutado por saldo insuficiente",
                 mensaje=f"Hola {usuario.nombre}, tu pago '{pago.descripcion}' no se realizó por saldo insuficiente."
             )
             omitidos_saldo += 1
-            if pago.periodicidad == "weekly":
-                pago.proxima_ejecucion = pago.proxima_ejecucion + timedelta(weeks=1)
-            elif pago.periodicidad == "monthly":
-                pago.proxima_ejecucion = add_months(pago.proxima_ejecucion, 1)
-            else:
-                pago.activo = False
-            db.commit()
             continue
 
-        # 3) Ejecutar pago: registrar transacción + descontar saldo
-        usuario.saldo -= pago.monto
+        # 3) Registrar la transacción y reprogramar en el mismo commit del cargo: un corte a la
+        # mitad ya no vuelve a cobrar en la siguiente corrida
         nueva_tx = Transaction(
             id_usuario=pago.id_usuario,
             tipo="egreso",
@@ -164,21 +173,18 @@ def ejecutar_pagos_automaticos(db: Session = Depends(get_db)):
             estado="completada"
         )
         db.add(nueva_tx)
+        _reprogramar(pago)
         db.commit()
+        notificar(db, [usuario.id_usuario], "pago_fijo",
+                  {"id_pago": pago.id_pago, "transaccion": transaccion_a_dict(nueva_tx)})
 
-        # 4) Reprogramar siguiente ejecución
-        if pago.periodicidad == "weekly":
-            pago.proxima_ejecucion = pago.proxima_ejecucion + timedelta(weeks=1)
-        elif pago.periodicidad == "monthly":
-            pago.proxima_ejecucion = add_months(pago.proxima_ejecucion, 1)
-        else:
-            pago.activo = False
-        db.commit()
+        if presupuesto is not None:
+            alertar_cruce_por_pago(db, usuario, pago.categoria_id, presupuesto, pago.monto)
 
         enviar_correo(
             destinatario=usuario.correo,
             asunto="💸 Pago programado ejecutado",
-            mensaje=f"Tu pago de ${pago.monto} ('{pago.descripcion}') se ejecutó con éxito."
+            mensaje=f"Tu pago de ${formatear(pago.monto)} ('{pago.descripcion}') se ejecutó con éxito."
         )
         ejecutados += 1
 
@@ -189,6 +195,22 @@ def ejecutar_pagos_automaticos(db: Session = Depends(get_db)):
         "omitidos_por_saldo": omitidos_saldo
     }
 
+# ────── Proyección de saldo por pagos recurrentes ──────
+@router.get("/pagos/proyeccion")
+def proyeccion_saldo(
+    id_usuario: int = Query(...),
+    meses: int = Query(3, ge=1, le=24, description="Horizonte en meses"),
+    incluir_presupuestos: bool = Query(True, description="Descontar lo que queda de cada presupuesto mensual"),
+    db: Session = Depends(get_db)
+):
+    hoy = datetime.utcnow().date()
+    dias = (add_months(hoy, meses) - hoy).days
+    proyeccion = proyectar_usuario(db, id_usuario, hoy, dias, incluir_presupuestos)
+    if proyeccion is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado.")
+    proyeccion["rango"] = {"desde": str(hoy), "hasta": str(hoy + timedelta(days=dias - 1))}
+    return proyeccion
+
 # ────── Obtener uno ──────
 @router.get("/pagos/{id_pago}", response_model=PagoRespuesta)
 def obtener_pago(id_pago: int, db: Session = Depends(get_db)):
@@ -211,7 +233,7 @@ def actualizar_pago(id_pago: int, data: PagoActualizar, db: Session = Depends(ge
             raise HTTPException(status_code=404, detail="Categoría no encontrada.")
 
     pago.descripcion = data.descripcion
-    pago.monto = Decimal(data.monto)
+    pago.monto = data.monto
     pago.fecha_programada = data.fecha_programada
     pago.categoria_id = data.categoria_id
     pago.periodicidad = data.periodicidad
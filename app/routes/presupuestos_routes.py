@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, select
+from typing import List, Optional, Tuple
 from pydantic import BaseModel
 from app.database import get_db
 from app.models.budget_model import Budget
@@ -9,8 +9,13 @@ from app.models.categoria_model import Categoria
 from app.models.transaction_model import Transaction
 from app.models.user_model import User
 from app.utils.notificaciones import enviar_alerta_presupuesto
+from app.utils.alertas import umbral_cruzado, alertar_cruce_presupuesto
+from app.utils.serializacion import columnas_de, respuesta_filas
+from app.utils.archivo import movimientos
+from app.utils.periodos import en_rango, mes_siguiente, rango_mes, rango_mes_de
+from app.utils.dinero import Monto, MontoEntrada, a_pesos, porcentaje
 
-from datetime import datetime
+from datetime import date, datetime
 
 router = APIRouter(tags=["Presupuestos"])
 
@@ -18,7 +23,7 @@ router = APIRouter(tags=["Presupuestos"])
 class PresupuestoCrear(BaseModel):
     id_usuario: int
     id_categoria: int
-    monto_mensual: float
+    monto_mensual: MontoEntrada
     mes: int
     año: int
 
@@ -26,28 +31,24 @@ class PresupuestoRespuesta(BaseModel):
     id_presupuesto: int
     id_usuario: int
     id_categoria: int
-    monto_mensual: float
+    monto_mensual: Monto
     mes: int
     año: int
 
     class Config:
         orm_mode = True
 
-def obtener_presupuesto_disponible(db: Session, id_usuario: int, categoria_id: int, fecha_ref: datetime) -> float:
-    from sqlalchemy import func
-    mes = fecha_ref.month
-    anio = fecha_ref.year
-
+def estado_presupuesto(db: Session, id_usuario: int, categoria_id: int, fecha_ref: datetime) -> Optional[Tuple[int, int]]:
+    """(monto_mensual, gastado_en_el_mes) en centavos del presupuesto de la categoría, o None si no hay presupuesto."""
     presupuesto = db.query(Budget).filter(
         Budget.id_usuario == id_usuario,
         Budget.id_categoria == categoria_id,
-        Budget.mes == mes,
-        Budget.año == anio
+        Budget.mes == fecha_ref.month,
+        Budget.año == fecha_ref.year
     ).first()
 
     if not presupuesto:
-        # Si no hay presupuesto definido, interpretamos "sin límite"
-        return float('inf')
+        return None
 
     total_egresado = (
         db.query(func.sum(Transaction.monto))
@@ -55,13 +56,31 @@ def obtener_presupuesto_disponible(db: Session, id_usuario: int, categoria_id: i
             Transaction.id_usuario == id_usuario,
             Transaction.categoria_id == categoria_id,
             Transaction.tipo == "egreso",
-            func.extract("month", Transaction.fecha) == mes,
-            func.extract("year", Transaction.fecha) == anio,
+            en_rango(Transaction.fecha, rango_mes_de(fecha_ref)),
         )
         .scalar()
     ) or 0
 
-    return float(presupuesto.monto_mensual) - float(total_egresado)
+    return presupuesto.monto_mensual or 0, total_egresado
+
+def obtener_presupuesto_disponible(db: Session, id_usuario: int, categoria_id: int, fecha_ref: datetime) -> Optional[int]:
+    """Centavos que quedan en el presupuesto del mes; None si no hay presupuesto (sin límite)."""
+    estado = estado_presupuesto(db, id_usuario, categoria_id, fecha_ref)
+    if estado is None:
+        return None
+    monto_mensual, gastado = estado
+    return monto_mensual - gastado
+
+def alertar_cruce_por_pago(db: Session, usuario: User, categoria_id: int, estado: Optional[Tuple[int, int]], monto: int) -> bool:
+    """Para pagos programados: el nombre de la categoría solo se consulta si de verdad se cruzó un umbral."""
+    if estado is None:
+        return False
+    monto_mensual, gastado = estado
+    if umbral_cruzado(monto_mensual, gastado, gastado + monto) is None:
+        return False
+    nombre = db.query(Categoria.nombre).filter(Categoria.id_categoria == categoria_id).scalar() or "Sin categoría"
+    return alertar_cruce_presupuesto(usuario.correo, usuario.telefono, nombre, monto_mensual, gastado, gastado + monto,
+                                     id_usuario=usuario.id_usuario)
 
 # ────── Crear ──────
 @router.post("/presupuestos", response_model=PresupuestoRespuesta)
@@ -89,7 +108,62 @@ def listar_presupuestos(
     limit: int = 20,
     db: Session = Depends(get_db)
 ):
-    return db.query(Budget).filter(Budget.id_usuario == id_usuario).offset(skip).limit(limit).all()
+    query = db.query(*columnas_de(Budget, PresupuestoRespuesta)).filter(Budget.id_usuario == id_usuario)
+    return respuesta_filas(query.offset(skip).limit(limit), PresupuestoRespuesta)
+
+# ────── Estado de todos los presupuestos del mes ──────
+@router.get("/presupuestos/estado")
+def estado_presupuestos_mes(
+    id_usuario: int = Query(...),
+    mes: Optional[int] = Query(None, ge=1, le=12, description="Por defecto, el mes actual"),
+    año: Optional[int] = Query(None, ge=1900, le=9999),
+    db: Session = Depends(get_db)
+):
+    """
+    Presupuesto, gastado, disponible y porcentaje de cada categoría del mes en una sola consulta:
+    presupuestos LEFT JOIN (egresos agrupados por categoría sobre [inicio de mes, inicio del siguiente)).
+    """
+    hoy = datetime.utcnow()
+    mes = mes or hoy.month
+    año = año or hoy.year
+    ini = date(año, mes, 1)
+    fin = mes_siguiente(ini)
+
+    m = movimientos(db, id_usuario, ini, fin, tipos=("egreso",))
+    gastos = (
+        select(m.c.categoria_id, func.sum(m.c.monto).label("gastado"))
+        .group_by(m.c.categoria_id)
+        .subquery("gastos")
+    )
+    filas = (
+        db.query(
+            Budget.id_presupuesto,
+            Budget.id_categoria,
+            Categoria.nombre,
+            Budget.monto_mensual,
+            func.coalesce(gastos.c.gastado, 0),
+        )
+        .outerjoin(Categoria, Categoria.id_categoria == Budget.id_categoria)
+        .outerjoin(gastos, gastos.c.categoria_id == Budget.id_categoria)
+        .filter(Budget.id_usuario == id_usuario, Budget.mes == mes, Budget.año == año)
+        .order_by(Budget.id_categoria)
+        .all()
+    )
+
+    presupuestos = []
+    for id_presupuesto, id_categoria, nombre, monto_mensual, gastado in filas:
+        monto = monto_mensual or 0
+        gastado = gastado or 0
+        presupuestos.append({
+            "id_presupuesto": id_presupuesto,
+            "id_categoria": id_categoria,
+            "categoria": nombre or "Sin categoría",
+            "monto_mensual": a_pesos(monto),
+            "gastado": a_pesos(gastado),
+            "disponible": a_pesos(monto - gastado),
+            "porcentaje": round(porcentaje(gastado, monto), 2) if monto else None,
+        })
+    return {"id_usuario": id_usuario, "mes": mes, "año": año, "presupuestos": presupuestos}
 
 # ────── Actualizar ──────
 @router.put("/presupuestos/{id_presupuesto}", response_model=PresupuestoRespuesta)
@@ -136,8 +210,7 @@ def verificar_alertas_presupuesto(
                 Transaction.id_usuario == id_usuario,
                 Transaction.categoria_id == presupuesto.id_categoria,
                 Transaction.tipo == "egreso",
-                func.extract("month", Transaction.fecha) == mes,
-                func.extract("year", Transaction.fecha) == año,
+                en_rango(Transaction.fecha, rango_mes(año, mes)),
             )
             .scalar()
         ) or 0
@@ -148,10 +221,10 @@ def verificar_alertas_presupuesto(
             .scalar()
         ) or "Sin categoría"
 
-        porcentaje = (total_gastado / presupuesto.monto_mensual) * 100 if presupuesto.monto_mensual else 0
+        uso = porcentaje(total_gastado, presupuesto.monto_mensual or 0)
 
-        if porcentaje >= 100 or porcentaje >= 80:
-            enviar_alerta_presupuesto(usuario.correo, categoria_nombre, float(total_gastado), float(porcentaje))
+        if uso >= 100 or uso >= 80:
+            enviar_alerta_presupuesto(usuario.correo, categoria_nombre, total_gastado, uso)
 
     return {"mensaje": "Verificación completada"}
 
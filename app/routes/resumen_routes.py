@@ -2,6 +2,8 @@ from fastapi import APIRouter, HTTPException ,Depends
 from sqlalchemy.orm import Session
 from app.database import SessionLocal , get_db
 from app.models.transaction_model import Transaction
+from app.utils.archivo import movimientos
+from app.utils.dinero import a_pesos
 
 
 router = APIRouter(prefix="/resumen", tags=["Resumen"])
@@ -10,20 +12,20 @@ router = APIRouter(prefix="/resumen", tags=["Resumen"])
 def get_resumen(id_usuario: int, db: Session = Depends(get_db)):
     from sqlalchemy import func
 
-    ingresos = (
-        db.query(func.sum(Transaction.monto))
-          .filter(Transaction.id_usuario == id_usuario, Transaction.tipo == "ingreso")
-          .scalar()
-    ) or 0
-    egresos = (
-        db.query(func.sum(Transaction.monto))
-          .filter(Transaction.id_usuario == id_usuario, Transaction.tipo == "egreso")
-          .scalar()
-    ) or 0
+    # Totales históricos: filas calientes + resúmenes de periodos archivados
+    m = movimientos(db, id_usuario, tipos=("ingreso", "egreso"))
+    totales = dict(
+        db.query(m.c.tipo, func.sum(m.c.monto))
+          .select_from(m)
+          .group_by(m.c.tipo)
+          .all()
+    )
+    ingresos = totales.get("ingreso") or 0
+    egresos = totales.get("egreso") or 0
     return {
         "id_usuario": id_usuario,
-        "ingresos": float(ingresos),
-        "egresos": float(egresos),
-        "balance": float(ingresos) - float(egresos),
+        "ingresos": a_pesos(ingresos),
+        "egresos": a_pesos(egresos),
+        "balance": a_pesos(ingresos - egresos),
     }
     
\ No newline at end of file
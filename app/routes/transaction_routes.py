@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, update
 from sqlalchemy.orm import Session
-from decimal import Decimal
 from datetime import datetime
 from typing import List, Optional
 from pydantic import BaseModel
@@ -10,32 +11,37 @@ from app.models.user_model import User
 from app.models.categoria_model import Categoria
 from app.models.budget_model import Budget
 from app.utils.notificaciones import enviar_correo 
+from app.utils.alertas import alertar_cruce_presupuesto
+from app.utils.serializacion import columnas_de, respuesta_filas
+from app.utils.commit_agrupado import GROUP_COMMIT, Asiento, CommitIncierto, agrupador
+from app.utils.eventos import notificar, transaccion_a_dict
+from app.utils.dinero import Monto, MontoEntrada, formatear
 
 router = APIRouter(tags=["Transacciones"])
 
 # ────── Esquemas ──────
 class IngresoCrear(BaseModel):
     id_usuario: int
-    monto: float
+    monto: MontoEntrada
     descripcion: str
     categoria_id: Optional[int] = None   # 👈 nuevo
 
 class EgresoCrear(BaseModel):
     id_usuario: int
-    monto: float
+    monto: MontoEntrada
     descripcion: str
     categoria_id: Optional[int] = None
     
 class TransaccionActualizar(BaseModel):
     id_usuario: int
-    monto: float
+    monto: MontoEntrada
     descripcion: str
 
 class TransaccionRespuesta(BaseModel):
     id_transaccion: int
     id_usuario: int
     tipo: str
-    monto: float
+    monto: Monto
     descripcion: str
     categoria_id: Optional[int]
     estado: str
@@ -68,7 +74,39 @@ def crear_ingreso(data: IngresoCrear, db: Session = Depends(get_db)):
     else:
         categoria = obtener_o_crear_categoria(db, data.descripcion, "ingreso")
 
-    monto = Decimal(data.monto)
+    monto = data.monto
+    if GROUP_COMMIT:
+        # INSERT + saldo de este y otros requests en un solo commit; responde tras el commit durable.
+        # Se suelta la conexión antes de esperar: el hilo de escritura necesita una del mismo pool
+        asiento = Asiento(
+            id_usuario=data.id_usuario,
+            tipo="ingreso",
+            monto=monto,
+            descripcion=data.descripcion,
+            categoria_id=categoria.id_categoria,
+            delta_saldo=monto,
+        )
+        db.close()
+        try:
+            resultado = agrupador().registrar(asiento)
+        except CommitIncierto:
+            # No es un 5xx a propósito: con Idempotency-Key el reintento recibe esta misma respuesta
+            # en vez de volver a registrar un ingreso que quizá ya quedó escrito
+            return JSONResponse(status_code=202, content={
+                "detail": "No se pudo confirmar si el ingreso quedó registrado; revisa tus movimientos antes de reintentar.",
+                "estado": "incierto",
+            })
+        notificar(db, [data.id_usuario], "transaccion", {"transaccion": resultado})
+        return resultado
+
+    # Saldo (relativo: bloquea la fila del usuario) y movimiento en el mismo commit, para que
+    # la conciliación nunca vea uno sin el otro
+    db.execute(
+        update(User)
+        .where(User.id_usuario == data.id_usuario)
+        .values(saldo=func.coalesce(User.saldo, 0) + monto)
+        .execution_options(synchronize_session=False)
+    )
     nueva = Transaction(
         id_usuario=data.id_usuario,
         tipo="ingreso",
@@ -80,9 +118,7 @@ def crear_ingreso(data: IngresoCrear, db: Session = Depends(get_db)):
     db.add(nueva)
     db.commit()
     db.refresh(nueva)
-
-    usuario.saldo = (usuario.saldo or Decimal("0.00")) + monto
-    db.commit()
+    notificar(db, [data.id_usuario], "transaccion", {"transaccion": transaccion_a_dict(nueva)})
     return nueva
 
 # ────── EGRESOS ──────
@@ -93,9 +129,7 @@ def crear_egreso(data: EgresoCrear, db: Session = Depends(get_db)):
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado.")
 
-    monto = Decimal(data.monto)
-    if (usuario.saldo or Decimal("0.00")) < monto:
-        raise HTTPException(status_code=400, detail="Saldo insuficiente.")
+    monto = data.monto
 
     # Resolver categoría
     if data.categoria_id:
@@ -110,20 +144,32 @@ def crear_egreso(data: EgresoCrear, db: Session = Depends(get_db)):
     # === Verificación de presupuesto previo ===
     try:
         # Import local para evitar dependencia circular si lo pusiste en presupuestos_routes
-        from app.routes.presupuestos_routes import obtener_presupuesto_disponible
+        from app.routes.presupuestos_routes import estado_presupuesto
     except Exception:
         # Si moviste el helper a otro módulo, ajusta el import arriba.
         raise HTTPException(status_code=500, detail="No se pudo cargar verificador de presupuesto.")
 
-    disponible = obtener_presupuesto_disponible(db, data.id_usuario, categoria_id, datetime.utcnow())
-    if disponible < float(monto):
-        faltante = float(monto) - disponible
+    presupuesto = estado_presupuesto(db, data.id_usuario, categoria_id, datetime.utcnow())
+    if presupuesto is not None and presupuesto[0] - presupuesto[1] < monto:
+        faltante = monto - (presupuesto[0] - presupuesto[1])
         raise HTTPException(
             status_code=400,
-            detail=f"Presupuesto insuficiente en la categoría. Faltan ${faltante:.2f} para cubrir este egreso."
+            detail=f"Presupuesto insuficiente en la categoría. Faltan ${formatear(faltante)} para cubrir este egreso."
         )
 
-    # Crear transacción de egreso
+    # Datos del aviso antes del commit (después expiran y costarían otro SELECT)
+    contacto = (usuario.correo, usuario.telefono, categoria.nombre)
+
+    # Débito condicional (bloquea la fila del usuario) y movimiento en el mismo commit
+    r = db.execute(
+        update(User)
+        .where(User.id_usuario == data.id_usuario, User.saldo >= monto)
+        .values(saldo=User.saldo - monto)
+        .execution_options(synchronize_session=False)
+    )
+    if r.rowcount != 1:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Saldo insuficiente.")
     nueva = Transaction(
         id_usuario=data.id_usuario,
         tipo="egreso",
@@ -135,15 +181,20 @@ def crear_egreso(data: EgresoCrear, db: Session = Depends(get_db)):
     db.add(nueva)
     db.commit()
     db.refresh(nueva)
+    notificar(db, [data.id_usuario], "transaccion", {"transaccion": transaccion_a_dict(nueva)})
 
-    usuario.saldo -= monto
-    db.commit()
+    # Alerta 80%/100% solo si este egreso cruza el umbral (reemplaza el barrido diario)
+    if presupuesto is not None:
+        monto_mensual, gastado = presupuesto
+        alertar_cruce_presupuesto(*contacto, monto_mensual, gastado, gastado + monto,
+                                  id_usuario=data.id_usuario)
     return nueva
 
 # ────── CONSULTAR TRANSACCIONES ──────
 @router.get("/transacciones", response_model=List[TransaccionRespuesta])
 def obtener_todas(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    return db.query(Transaction).offset(skip).limit(limit).all()
+    query = db.query(*columnas_de(Transaction, TransaccionRespuesta))
+    return respuesta_filas(query.offset(skip).limit(limit), TransaccionRespuesta)
 
 @router.get("/transacciones/usuario/{id_usuario}", response_model=List[TransaccionRespuesta])
 def obtener_por_usuario(
@@ -151,11 +202,10 @@ def obtener_por_usuario(
     tipo: Optional[str] = Query(None, description="Opcional: 'ingreso' o 'egreso'"),
     db: Session = Depends(get_db)
 ):
-    query = db.query(Transaction).filter(Transaction.id_usuario == id_usuario)
+    query = db.query(*columnas_de(Transaction, TransaccionRespuesta)).filter(Transaction.id_usuario == id_usuario)
     if tipo in ("ingreso", "egreso"):
         query = query.filter(Transaction.tipo == tipo)
-    transacciones = query.order_by(Transaction.fecha.desc()).all()
-    return transacciones
+    return respuesta_filas(query.order_by(Transaction.fecha.desc()), TransaccionRespuesta)
 
 # ────── ACTUALIZAR ──────
 @router.put("/transacciones/{id}", response_model=TransaccionRespuesta)
@@ -164,20 +214,25 @@ def actualizar(id: int, data: TransaccionActualizar, db: Session = Depends(get_d
     if not trans:
         raise HTTPException(status_code=404, detail="Transacción no encontrada.")
 
-    usuario = db.query(User).filter(User.id_usuario == data.id_usuario).first()
-    if not usuario:
+    if not db.query(User.id_usuario).filter(User.id_usuario == data.id_usuario).first():
         raise HTTPException(status_code=404, detail="Usuario no encontrado.")
 
-    diferencia = Decimal(data.monto) - trans.monto
-    if trans.tipo == "ingreso":
-        usuario.saldo += diferencia
-    elif trans.tipo == "egreso":
-        usuario.saldo -= diferencia
+    # Ajuste relativo (bloquea la fila del usuario) en el mismo commit que el nuevo monto
+    diferencia = data.monto - trans.monto
+    signo = {"ingreso": 1, "egreso": -1}.get(trans.tipo)
+    if signo and diferencia:
+        db.execute(
+            update(User)
+            .where(User.id_usuario == data.id_usuario)
+            .values(saldo=func.coalesce(User.saldo, 0) + signo * diferencia)
+            .execution_options(synchronize_session=False)
+        )
 
-    trans.monto = Decimal(data.monto)
+    trans.monto = data.monto
     trans.descripcion = data.descripcion
     db.commit()
     db.refresh(trans)
+    notificar(db, [data.id_usuario], "transaccion", {"transaccion": transaccion_a_dict(trans)})
 
     return trans
 
@@ -187,7 +242,9 @@ def eliminar(id: int, db: Session = Depends(get_db)):
     trans = db.query(Transaction).filter(Transaction.id_transaccion == id).first()
     if not trans:
         raise HTTPException(status_code=404, detail="Transacción no encontrada.")
+    id_usuario = trans.id_usuario
     db.delete(trans)
     db.commit()
+    notificar(db, [id_usuario], "transaccion_eliminada", {"id_transaccion": id})
     return {"mensaje": "Transacción eliminada correctamente"}
 
@@ -0,0 +1,177 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from app.database import get_db
+from app.models.transaction_model import Transaction
+from app.models.user_model import User
+from app.utils.eventos import notificar, transaccion_a_dict
+from app.utils.dinero import Monto, MontoEntrada
+
+router = APIRouter(tags=["Transferencias"])
+
+# ────── Esquemas ──────
+class TransferenciaCrear(BaseModel):
+    id_usuario: int                  # quien envía
+    destinatario_id: int             # quien recibe
+    monto: MontoEntrada = Field(gt=0)
+    descripcion: Optional[str] = None
+
+class SolicitudCrear(BaseModel):
+    id_usuario: int                  # quien cobra
+    destinatario_id: int             # a quien se le pide el pago
+    monto: MontoEntrada = Field(gt=0)
+    descripcion: Optional[str] = None
+
+class SolicitudResponder(BaseModel):
+    id_usuario: int                  # debe ser el destinatario de la solicitud
+
+class TransferenciaRespuesta(BaseModel):
+    id_transaccion: int
+    id_usuario: int
+    destinatario_id: Optional[int]
+    tipo: str
+    monto: Monto
+    descripcion: Optional[str]
+    estado: str
+    fecha: datetime
+
+    class Config:
+        orm_mode = True
+
+# ===== Movimiento de saldo entre dos usuarios =====
+def mover_saldo(db: Session, origen: int, destino: int, monto: int):
+    """
+    Debita y acredita ambos `usuarios.saldo` dentro de la transacción abierta de `db`.
+    Las filas se actualizan (y por tanto se bloquean) en orden de id_usuario para que dos
+    transferencias cruzadas nunca se esperen mutuamente. El débito es condicional
+    (saldo >= monto), así no hace falta un SELECT ... FOR UPDATE previo.
+    No hace commit: el llamador confirma todo junto.
+    """
+    for id_usuario in sorted((origen, destino)):
+        if id_usuario == origen:
+            r = db.execute(
+                update(User)
+                .where(User.id_usuario == origen, User.saldo >= monto)
+                .values(saldo=User.saldo - monto)
+                .execution_options(synchronize_session=False)
+            )
+            if r.rowcount != 1:
+                db.rollback()
+                existe = db.query(User.id_usuario).filter(User.id_usuario == origen).first()
+                raise HTTPException(
+                    status_code=400 if existe else 404,
+                    detail="Saldo insuficiente." if existe else "Usuario no encontrado."
+                )
+        else:
+            r = db.execute(
+                update(User)
+                .where(User.id_usuario == destino)
+                .values(saldo=User.saldo + monto)
+                .execution_options(synchronize_session=False)
+            )
+            if r.rowcount != 1:
+                db.rollback()
+                raise HTTPException(status_code=404, detail="Destinatario no encontrado.")
+
+# ────── Transferencia directa (envío) ──────
+@router.post("/transferencias", response_model=TransferenciaRespuesta)
+def crear_transferencia(data: TransferenciaCrear, db: Session = Depends(get_db)):
+    if data.id_usuario == data.destinatario_id:
+        raise HTTPException(status_code=400, detail="No puedes transferirte a ti mismo.")
+
+    monto = data.monto
+    # Primero los saldos: mover_saldo toma los candados exclusivos de ambos usuarios en orden de id
+    # (y responde 404 si alguno no existe). El INSERT después, en la misma transacción: si fuera
+    # antes, sus candados compartidos sobre usuarios (FK en InnoDB) se escalarían en desorden.
+    mover_saldo(db, data.id_usuario, data.destinatario_id, monto)
+    nueva = Transaction(
+        id_usuario=data.id_usuario,
+        destinatario_id=data.destinatario_id,
+        tipo="envio",
+        monto=monto,
+        descripcion=data.descripcion,
+        estado="completada"
+    )
+    db.add(nueva)
+    db.commit()
+    db.refresh(nueva)
+    notificar(db, [nueva.id_usuario, nueva.destinatario_id], "transaccion", {"transaccion": transaccion_a_dict(nueva)})
+    return nueva
+
+# ────── Solicitud de pago ──────
+@router.post("/solicitudes", response_model=TransferenciaRespuesta)
+def crear_solicitud(data: SolicitudCrear, db: Session = Depends(get_db)):
+    if data.id_usuario == data.destinatario_id:
+        raise HTTPException(status_code=400, detail="No puedes solicitarte un pago a ti mismo.")
+    # len(...) y no COUNT: con sharding cada usuario puede estar en otra base y los COUNT no se suman
+    encontrados = len(db.query(User.id_usuario).filter(User.id_usuario.in_([data.id_usuario, data.destinatario_id])).all())
+    if encontrados != 2:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado.")
+
+    nueva = Transaction(
+        id_usuario=data.id_usuario,
+        destinatario_id=data.destinatario_id,
+        tipo="solicitud",
+        monto=data.monto,
+        descripcion=data.descripcion,
+        estado="pendiente"
+    )
+    db.add(nueva)
+    db.commit()
+    db.refresh(nueva)
+    notificar(db, [nueva.destinatario_id], "solicitud", {"transaccion": transaccion_a_dict(nueva)})
+    return nueva
+
+@router.get("/solicitudes/pendientes", response_model=List[TransferenciaRespuesta])
+def listar_solicitudes_pendientes(id_usuario: int = Query(...), db: Session = Depends(get_db)):
+    """Solicitudes que otros le hicieron a este usuario y siguen sin pagar."""
+    return (
+        db.query(Transaction)
+        .filter(
+            Transaction.destinatario_id == id_usuario,
+            Transaction.tipo == "solicitud",
+            Transaction.estado == "pendiente",
+        )
+        .order_by(Transaction.fecha.desc())
+        .all()
+    )
+
+def _solicitud_pendiente(db: Session, id_transaccion: int, id_usuario: int) -> Transaction:
+    # La fila de la solicitud se bloquea antes que los usuarios (mismo orden en todos los caminos)
+    solicitud = (
+        db.query(Transaction)
+        .filter(Transaction.id_transaccion == id_transaccion, Transaction.tipo == "solicitud")
+        .with_for_update()
+        .first()
+    )
+    if not solicitud:
+        raise HTTPException(status_code=404, detail="Solicitud no encontrada.")
+    if solicitud.destinatario_id != id_usuario:
+        raise HTTPException(status_code=403, detail="La solicitud no está dirigida a este usuario.")
+    if solicitud.estado != "pendiente":
+        raise HTTPException(status_code=409, detail=f"La solicitud ya está {solicitud.estado}.")
+    return solicitud
+
+@router.post("/solicitudes/{id_transaccion}/pagar", response_model=TransferenciaRespuesta)
+def pagar_solicitud(id_transaccion: int, data: SolicitudResponder, db: Session = Depends(get_db)):
+    """Pendiente -> completada en un solo viaje: mueve el saldo y cambia el estado en el mismo commit."""
+    solicitud = _solicitud_pendiente(db, id_transaccion, data.id_usuario)
+    mover_saldo(db, solicitud.destinatario_id, solicitud.id_usuario, solicitud.monto)
+    solicitud.estado = "completada"
+    db.commit()
+    db.refresh(solicitud)
+    notificar(db, [solicitud.id_usuario, solicitud.destinatario_id], "transaccion",
+              {"transaccion": transaccion_a_dict(solicitud)})
+    return solicitud
+
+@router.post("/solicitudes/{id_transaccion}/rechazar", response_model=TransferenciaRespuesta)
+def rechazar_solicitud(id_transaccion: int, data: SolicitudResponder, db: Session = Depends(get_db)):
+    solicitud = _solicitud_pendiente(db, id_transaccion, data.id_usuario)
+    solicitud.estado = "cancelada"
+    db.commit()
+    db.refresh(solicitud)
+    notificar(db, [solicitud.id_usuario], "solicitud", {"transaccion": transaccion_a_dict(solicitud)})
+    return solicitud
@@ -6,6 +6,7 @@ import re
 
 from app.database import SessionLocal
 from app.models.user_model import User
+from app.utils.dinero import Monto
 
 router = APIRouter(tags=["Usuarios"])
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -44,7 +45,7 @@ class UsuarioRespuesta(BaseModel):
     nombre: str
     correo: EmailStr
     telefono: str
-    saldo: float
+    saldo: Monto
 
 def obtener_db():
     db = SessionLocal()
@@ -80,7 +81,7 @@ def registrar(usuario: UsuarioCrear, db: Session = Depends(obtener_db)):
         correo=correo_norm,
         telefono=tel_norm,
         contrasena_hash=hash_contrasena,
-        saldo=0.0
+        saldo=0
     )
 
     db.add(nuevo)
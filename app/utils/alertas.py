@@ -0,0 +1,93 @@
+import os
+import queue
+import threading
+from typing import Optional
+
+from app.utils import eventos
+from app.utils.dinero import a_pesos, formatear, porcentaje
+from app.utils.notificaciones import enviar_correo
+from app.utils.sms import enviar_sms
+
+UMBRALES_PRESUPUESTO = (80, 100)
+ALERTAS_COLA_MAX = int(os.environ.get("ALERTAS_COLA_MAX", "10000"))
+
+def avisar(correo: str, telefono: Optional[str], asunto: str, mensaje: str) -> bool:
+    """
+    Correo + SMS (si hay teléfono). Devuelve True si al menos uno se entregó. Nunca lanza:
+    un proveedor caído no debe tumbar al llamador.
+    """
+    entregado = False
+    try:
+        entregado = enviar_correo(correo, asunto, mensaje)
+    except Exception as e:
+        print(f"[Correo] Error notificando a {correo}: {e}")
+    try:
+        if telefono:
+            entregado = enviar_sms(telefono, f"{asunto}: {mensaje}") or entregado
+    except Exception as e:
+        print(f"[SMS] Error notificando a {telefono}: {e}")
+    return entregado
+
+# ===== Cola en segundo plano: el request no espera a SMTP/Twilio =====
+_cola: "queue.Queue" = queue.Queue(maxsize=ALERTAS_COLA_MAX)
+_hilo: Optional[threading.Thread] = None
+_hilo_lock = threading.Lock()
+
+def _trabajador():
+    while True:
+        correo, telefono, asunto, mensaje = _cola.get()
+        try:
+            avisar(correo, telefono, asunto, mensaje)
+        finally:
+            _cola.task_done()
+
+def encolar_aviso(correo: str, telefono: Optional[str], asunto: str, mensaje: str):
+    global _hilo
+    if _hilo is None:
+        with _hilo_lock:
+            if _hilo is None:
+                _hilo = threading.Thread(target=_trabajador, name="alertas", daemon=True)
+                _hilo.start()
+    try:
+        _cola.put_nowait((correo, telefono, asunto, mensaje))
+    except queue.Full:
+        print(f"[Alertas] Cola llena, se descarta aviso a {correo}: {asunto}")
+
+# ===== Cruce de umbrales de presupuesto =====
+def umbral_cruzado(monto_mensual: int, gastado_antes: int, gastado_despues: int) -> Optional[int]:
+    """Mayor umbral (80/100 %) que el gasto cruza con esta escritura, o None si no cruza ninguno. Todo en centavos."""
+    if not monto_mensual or monto_mensual <= 0:
+        return None
+    # antes% < u <= después%, multiplicado por monto_mensual para comparar enteros sin redondeo
+    antes, despues = gastado_antes * 100, gastado_despues * 100
+    cruzados = [u for u in UMBRALES_PRESUPUESTO if antes < u * monto_mensual <= despues]
+    return cruzados[-1] if cruzados else None
+
+def alertar_cruce_presupuesto(
+    correo: str,
+    telefono: Optional[str],
+    categoria: str,
+    monto_mensual: int,
+    gastado_antes: int,
+    gastado_despues: int,
+    id_usuario: Optional[int] = None,
+) -> bool:
+    """O(1): compara el gasto del mes antes y después del egreso y encola la alerta solo si cruza un umbral."""
+    umbral = umbral_cruzado(monto_mensual, gastado_antes, gastado_despues)
+    if umbral is None:
+        return False
+    uso = porcentaje(gastado_despues, monto_mensual)
+    nivel = "excedido" if umbral >= 100 else "alto (80%)"
+    if id_usuario is not None:
+        eventos.publicar(id_usuario, "alerta_presupuesto", {
+            "categoria": categoria, "umbral": umbral, "gastado": a_pesos(gastado_despues),
+            "monto_mensual": a_pesos(monto_mensual), "porcentaje": round(uso, 1),
+        })
+    encolar_aviso(
+        correo,
+        telefono,
+        "⚠ Alerta de Presupuesto",
+        f"Categoría '{categoria}': llevas ${formatear(gastado_despues)} "
+        f"({uso:.1f}% de ${formatear(monto_mensual)}). Nivel: {nivel}."
+    )
+    return True
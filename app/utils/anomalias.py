@@ -0,0 +1,155 @@
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.anomalia_model import Anomalia
+from app.models.transaction_model import Transaction
+from app.utils.periodos import inicio_dia
+
+ANOMALIAS_HISTORIA_DIAS = int(os.environ.get("ANOMALIAS_HISTORIA_DIAS", "180"))   # base de comparación
+ANOMALIAS_VENTANA_DIAS = int(os.environ.get("ANOMALIAS_VENTANA_DIAS", "1"))       # días que se evalúan
+ANOMALIAS_Z = float(os.environ.get("ANOMALIAS_Z", "3.0"))
+ANOMALIAS_MIN_HISTORIA = int(os.environ.get("ANOMALIAS_MIN_HISTORIA", "5"))       # egresos previos por categoría
+ANOMALIAS_REPETICIONES = int(os.environ.get("ANOMALIAS_REPETICIONES", "3"))       # descripción nueva repetida
+_LOTE = 50000
+
+# ===== Carga columnar (un SELECT en streaming, sin entidades ORM) =====
+def _cargar(db: Session, desde: date, hasta: date) -> Dict[str, np.ndarray]:
+    """Egresos completados de [desde, hasta) como arreglos NumPy paralelos."""
+    consulta = (
+        select(
+            Transaction.id_transaccion,
+            Transaction.id_usuario,
+            Transaction.categoria_id,
+            Transaction.fecha,
+            Transaction.monto,
+            func.lower(func.trim(func.coalesce(Transaction.descripcion, ""))),
+        )
+        .where(
+            Transaction.tipo == "egreso",
+            Transaction.estado == "completada",
+            Transaction.fecha >= inicio_dia(desde),
+            Transaction.fecha < inicio_dia(hasta),
+        )
+        .execution_options(yield_per=_LOTE)
+    )
+    partes = {k: [] for k in ("id", "usuario", "categoria", "fecha", "monto", "descripcion")}
+    for bloque in db.execute(consulta).partitions():
+        ids, usuarios, categorias, fechas, montos, descripciones = zip(*bloque)
+        partes["id"].append(np.fromiter(ids, dtype=np.int64, count=len(ids)))
+        partes["usuario"].append(np.fromiter(usuarios, dtype=np.int64, count=len(ids)))
+        partes["categoria"].append(np.array([-1 if c is None else c for c in categorias], dtype=np.int64))
+        partes["fecha"].append(np.array(fechas, dtype="datetime64[s]"))
+        partes["monto"].append(np.fromiter(montos, dtype=np.int64, count=len(ids)))   # centavos
+        partes["descripcion"].append(np.array(descripciones, dtype=object))
+    vacios = {"id": np.int64, "usuario": np.int64, "categoria": np.int64,
+              "fecha": "datetime64[s]", "monto": np.int64, "descripcion": object}
+    return {k: np.concatenate(v) if v else np.zeros(0, dtype=vacios[k]) for k, v in partes.items()}
+
+# ===== Detectores vectorizados =====
+def atipicos_por_monto(usuario, categoria, monto, es_nueva, z_min=ANOMALIAS_Z, min_historia=ANOMALIAS_MIN_HISTORIA):
+    """
+    Z-score de cada egreso nuevo contra la media/desviación de los egresos previos del mismo
+    usuario y categoría. Devuelve (índices marcados, z) sobre los arreglos de entrada.
+    """
+    claves = (usuario << 32) | (categoria + 1)
+    _, grupo = np.unique(claves, return_inverse=True)
+    n_grupos = int(grupo.max()) + 1 if len(grupo) else 0
+    hist = ~es_nueva
+
+    n = np.bincount(grupo[hist], minlength=n_grupos)
+    media = np.bincount(grupo[hist], weights=monto[hist], minlength=n_grupos) / np.maximum(n, 1)
+    # Dos pasadas (desviaciones respecto a la media) en vez de E[x²]-E[x]²: estable con montos grandes
+    desvio = monto[hist] - media[grupo[hist]]
+    var = np.bincount(grupo[hist], weights=desvio * desvio, minlength=n_grupos) / np.maximum(n - 1, 1)
+    std = np.sqrt(var)
+
+    nuevas = np.nonzero(es_nueva)[0]
+    g = grupo[nuevas]
+    z = np.zeros(len(nuevas), dtype=np.float64)
+    con_base = (n[g] >= min_historia) & (std[g] > 0)
+    z[con_base] = (monto[nuevas][con_base] - media[g][con_base]) / std[g][con_base]
+    marcadas = con_base & (z >= z_min)
+    return nuevas[marcadas], z[marcadas]
+
+def descripciones_repetidas(usuario, descripcion, es_nueva, minimo=ANOMALIAS_REPETICIONES):
+    """
+    Descripciones que el usuario nunca había usado en la historia y que aparecen `minimo` o más
+    veces en la ventana (p. ej. cargos repetidos de un comercio nuevo). Devuelve
+    (índice representativo = el último de cada grupo, repeticiones).
+    """
+    _, codigo = np.unique(descripcion, return_inverse=True)
+    claves = (usuario << 32) | codigo.astype(np.int64)
+    candidatas = es_nueva & (descripcion != "")
+    candidatas &= ~np.isin(claves, claves[~es_nueva])
+
+    idx = np.nonzero(candidatas)[0]
+    if not len(idx):
+        return idx, np.zeros(0, dtype=np.int64)
+    unicas, grupo, conteo = np.unique(claves[idx], return_inverse=True, return_counts=True)
+    ultimo = np.full(len(unicas), -1, dtype=np.int64)
+    np.maximum.at(ultimo, grupo, idx)
+    frecuentes = conteo >= minimo
+    return ultimo[frecuentes], conteo[frecuentes]
+
+# ===== Corrida nocturna =====
+def detectar_anomalias(db: Session, hoy: date, ventana_dias: int = ANOMALIAS_VENTANA_DIAS) -> List[dict]:
+    """
+    Evalúa los egresos de [hoy - ventana, hoy) contra los ANOMALIAS_HISTORIA_DIAS anteriores y
+    guarda las anomalías nuevas en `anomalias`. Idempotente: re-correr el mismo día no duplica.
+    La historia se lee solo de la tabla caliente (más de 13 meses), no de los resúmenes archivados.
+    """
+    corte = hoy - timedelta(days=ventana_dias)
+    datos = _cargar(db, corte - timedelta(days=ANOMALIAS_HISTORIA_DIAS), hoy)
+    if not len(datos["id"]):
+        return []
+    es_nueva = datos["fecha"] >= np.datetime64(corte, "s")
+
+    filas = []
+    idx, z = atipicos_por_monto(datos["usuario"], datos["categoria"], datos["monto"], es_nueva)
+    for i, puntaje in zip(idx.tolist(), z.tolist()):
+        filas.append(_fila(datos, i, "monto", puntaje, f"{puntaje:.1f} desviaciones sobre tu gasto habitual"))
+    idx, conteo = descripciones_repetidas(datos["usuario"], datos["descripcion"], es_nueva)
+    for i, veces in zip(idx.tolist(), conteo.tolist()):
+        filas.append(_fila(datos, i, "frecuencia", float(veces),
+                           f"'{datos['descripcion'][i][:200]}' {veces} veces en {ventana_dias} día(s)"))
+    if not filas:
+        return []
+
+    existentes = set(db.query(Anomalia.id_transaccion, Anomalia.motivo).filter(
+        Anomalia.fecha >= inicio_dia(corte)
+    ).all())
+    nuevas = [f for f in filas if (f["id_transaccion"], f["motivo"]) not in existentes]
+    if nuevas:
+        db.execute(insert(Anomalia), nuevas)
+        db.commit()
+    print(f"[Anomalías] {len(es_nueva.nonzero()[0])} egresos evaluados, {len(nuevas)} anomalías nuevas")
+    return nuevas
+
+def _fila(datos: Dict[str, np.ndarray], i: int, motivo: str, puntaje: float, detalle: str) -> dict:
+    categoria = int(datos["categoria"][i])
+    return {
+        "id_transaccion": int(datos["id"][i]),
+        "id_usuario": int(datos["usuario"][i]),
+        "categoria_id": None if categoria < 0 else categoria,
+        "fecha": datos["fecha"][i].astype("datetime64[us]").item(),
+        "monto": int(datos["monto"][i]),
+        "motivo": motivo,
+        "puntaje": round(puntaje, 3),
+        "detalle": detalle,
+        "notificada": False,
+    }
+
+def pendientes_de_aviso(db: Session, limite: Optional[int] = None) -> Dict[int, List[Anomalia]]:
+    """Anomalías aún no notificadas, agrupadas por usuario."""
+    q = db.query(Anomalia).filter(Anomalia.notificada == False).order_by(Anomalia.id_usuario, Anomalia.fecha)
+    if limite:
+        q = q.limit(limite)
+    por_usuario: Dict[int, List[Anomalia]] = {}
+    for a in q.all():
+        por_usuario.setdefault(a.id_usuario, []).append(a)
+    return por_usuario
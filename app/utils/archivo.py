@@ -0,0 +1,215 @@
+import gzip
+import hashlib
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Sequence
+
+from sqlalchemy import and_, func, insert, literal, select, text, union_all
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.archivo_model import PeriodoArchivado, ResumenArchivado
+from app.models.transaction_model import Transaction
+from app.utils import particiones, shards
+from app.utils.dinero import formatear
+from app.utils.periodos import en_rango, inicio_dia, inicio_mes, mes_siguiente, rango_mes_de
+
+ARCHIVO_DIR = os.environ.get("ARCHIVO_DIR", "archivo")
+# Meses completos que se quedan en la tabla caliente (además del mes en curso)
+ARCHIVO_MESES_CALIENTES = int(os.environ.get("ARCHIVO_MESES_CALIENTES", "13"))
+_LOTE = 5000
+
+# ===== Marca de agua =====
+def corte_archivo(db: Session, id_usuario: Optional[int] = None) -> Optional[date]:
+    """
+    Primer día que sigue en `transacciones`; todo lo anterior se lee de `resumen_archivado`.
+    Con sharding cada shard archiva por su cuenta: `id_usuario` elige el shard a consultar.
+    """
+    return db.execute(
+        select(func.max(PeriodoArchivado.hasta)), bind_arguments=shards.argumentos(id_usuario)
+    ).scalar()
+
+# ===== Fuente combinada para estadísticas =====
+def movimientos(
+    db: Session,
+    id_usuario: int,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    tipos: Optional[Sequence[str]] = None,
+):
+    """
+    Subconsulta (id_usuario, fecha, tipo, categoria_id, monto, conteo) que une las filas calientes
+    con los resúmenes diarios archivados. `hasta` es exclusivo. Los filtros van dentro de cada
+    rama para que MySQL pode particiones y resuelva la rama caliente solo con idx_tx_cubriente
+    sin depender del pushdown. Sin archivo (o con el rango entero en caliente) es solo la tabla caliente.
+    """
+    corte = corte_archivo(db, id_usuario)
+
+    caliente = select(
+        Transaction.id_usuario,
+        Transaction.fecha.label("fecha"),
+        Transaction.tipo.label("tipo"),
+        Transaction.categoria_id.label("categoria_id"),
+        Transaction.monto.label("monto"),
+        literal(1).label("conteo"),
+    ).where(Transaction.id_usuario == id_usuario)
+    if tipos:
+        caliente = caliente.where(Transaction.tipo.in_(tuple(tipos)))
+    desde_caliente = max(desde, corte) if desde and corte else (desde or corte)
+    if desde_caliente:
+        caliente = caliente.where(Transaction.fecha >= inicio_dia(desde_caliente))
+    if hasta:
+        caliente = caliente.where(Transaction.fecha < inicio_dia(hasta))
+
+    if corte is None or (desde and desde >= corte):
+        return caliente.subquery("movimientos")
+
+    frio = select(
+        ResumenArchivado.id_usuario,
+        ResumenArchivado.dia,
+        ResumenArchivado.tipo,
+        ResumenArchivado.categoria_id,
+        ResumenArchivado.total,
+        ResumenArchivado.conteo,
+    ).where(
+        ResumenArchivado.id_usuario == id_usuario,
+        ResumenArchivado.rol == "titular",
+        ResumenArchivado.dia < (min(hasta, corte) if hasta else corte),
+    )
+    if desde:
+        frio = frio.where(ResumenArchivado.dia >= desde)
+    if tipos:
+        frio = frio.where(ResumenArchivado.tipo.in_(tuple(tipos)))
+    return union_all(caliente, frio).subquery("movimientos")
+
+# ===== Archivado de meses cerrados =====
+def _ruta_archivo(mes: date) -> str:
+    return os.path.join(ARCHIVO_DIR, "transacciones", *shards.segmento(), f"{mes:%Y}", f"{mes:%Y-%m}.ndjson.gz")
+
+def _volcar(db: Session, desde: datetime, hasta: datetime, ruta: str):
+    """Escribe las filas del rango como NDJSON comprimido. Devuelve (filas, sha256)."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    tmp = ruta + ".tmp"
+    tabla = Transaction.__table__
+    filas = 0
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        resultado = db.execute(
+            select(tabla)
+            .where(tabla.c.fecha >= desde, tabla.c.fecha < hasta)
+            .order_by(tabla.c.id_transaccion)
+            .execution_options(yield_per=_LOTE)
+        ).mappings()
+        for fila in resultado:
+            fila = dict(fila)
+            if fila["monto"] is not None:
+                fila["monto"] = formatear(fila["monto"])   # mismo formato que antes: "10.10", no centavos
+            f.write(json.dumps(fila, default=str, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+            filas += 1
+    h = hashlib.sha256()
+    with open(tmp, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    os.replace(tmp, ruta)
+    return filas, h.hexdigest()
+
+def _resumir(db: Session, desde: datetime, hasta: datetime):
+    """INSERT ... SELECT de los totales diarios (titular y contraparte de envíos/solicitudes)."""
+    completadas = and_(en_rango(Transaction.fecha, (desde, hasta)), Transaction.estado == "completada")
+    dia = func.date(Transaction.fecha)
+    columnas = ["id_usuario", "dia", "tipo", "rol", "categoria_id", "total", "conteo"]
+    titular = (
+        select(Transaction.id_usuario, dia, Transaction.tipo, literal("titular"), Transaction.categoria_id,
+               func.sum(Transaction.monto), func.count())
+        .where(completadas)
+        .group_by(Transaction.id_usuario, dia, Transaction.tipo, Transaction.categoria_id)
+    )
+    contraparte = (
+        select(Transaction.destinatario_id, dia, Transaction.tipo, literal("destinatario"), Transaction.categoria_id,
+               func.sum(Transaction.monto), func.count())
+        .where(completadas, Transaction.destinatario_id.isnot(None), Transaction.tipo.in_(("envio", "solicitud")))
+        .group_by(Transaction.destinatario_id, dia, Transaction.tipo, Transaction.categoria_id)
+    )
+    for consulta in (titular, contraparte):
+        db.execute(insert(ResumenArchivado).from_select(columnas, consulta))
+
+def _borrar_calientes(db: Session, mes: date, desde: datetime, hasta: datetime):
+    engine = shards.motor_actual()
+    if particiones.particiones(engine):
+        # DROP PARTITION no dispara triggers: limpiar antes el texto buscable del mes
+        db.execute(text(
+            "DELETE x FROM transacciones_texto x JOIN transacciones t ON t.id_transaccion = x.id_transaccion "
+            "WHERE t.fecha >= :desde AND t.fecha < :hasta"
+        ), {"desde": desde, "hasta": hasta})
+        db.commit()
+        if particiones.eliminar_particion_mes(engine, mes):
+            return
+
+    # Sin partición propia: DELETE por lotes para no sostener candados largos
+    while True:
+        ids = [r[0] for r in db.query(Transaction.id_transaccion)
+               .filter(Transaction.fecha >= desde, Transaction.fecha < hasta)
+               .limit(_LOTE).all()]
+        if not ids:
+            break
+        db.query(Transaction).filter(Transaction.id_transaccion.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+
+def archivar_mes(db: Session, mes: date) -> Optional[PeriodoArchivado]:
+    """
+    Archiva un mes cerrado: NDJSON.gz con las filas, resúmenes diarios y marca de agua en un
+    commit, y después borra las filas calientes. Como las estadísticas separan caliente y frío
+    por la marca de agua, un fallo entre el commit y el borrado no duplica montos.
+    """
+    corte = corte_archivo(db)
+    if corte and mes < corte:
+        return None
+    if corte and mes != corte:
+        raise ValueError(f"El archivo debe ser contiguo: sigue {corte:%Y-%m}, no {mes:%Y-%m}")
+
+    desde, hasta = rango = rango_mes_de(mes)
+    pendientes = db.query(func.count(Transaction.id_transaccion)).filter(
+        en_rango(Transaction.fecha, rango), Transaction.estado == "pendiente"
+    ).scalar()
+    if pendientes:
+        print(f"[Archivo] {mes:%Y-%m} tiene {pendientes} transacciones pendientes; se pospone.")
+        return None
+
+    ruta = _ruta_archivo(mes)
+    filas, sha = _volcar(db, desde, hasta, ruta)
+    _resumir(db, desde, hasta)
+    periodo = PeriodoArchivado(
+        periodo=f"{mes:%Y-%m}", desde=mes, hasta=mes_siguiente(mes), archivo=ruta, sha256=sha, filas=filas,
+    )
+    db.add(periodo)
+    db.commit()
+
+    _borrar_calientes(db, mes, desde, hasta)
+    print(f"[Archivo] {mes:%Y-%m}: {filas} filas -> {ruta}")
+    return periodo
+
+def archivar_periodos_cerrados(hoy: Optional[date] = None) -> List[str]:
+    """Archiva, del más antiguo al más nuevo, los meses fuera de la ventana caliente."""
+    hoy = hoy or datetime.utcnow().date()
+    limite = inicio_mes(hoy)
+    for _ in range(ARCHIVO_MESES_CALIENTES):
+        limite = inicio_mes(limite - timedelta(days=1))
+
+    db = SessionLocal()
+    archivados = []
+    try:
+        mes = corte_archivo(db)
+        if mes is None:
+            primera = db.query(func.min(Transaction.fecha)).scalar()
+            if primera is None:
+                return []
+            mes = inicio_mes(primera.date() if isinstance(primera, datetime) else primera)
+        while mes < limite:
+            if archivar_mes(db, mes) is None:
+                break
+            archivados.append(f"{mes:%Y-%m}")
+            mes = mes_siguiente(mes)
+        return archivados
+    finally:
+        db.close()
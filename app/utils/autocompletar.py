@@ -0,0 +1,234 @@
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models.categoria_model import Categoria
+from app.models.pago_model import PagoFijo
+from app.models.transaction_model import Transaction
+from app.utils import shards
+
+AUTOCOMPLETAR_MAX_USUARIOS = int(os.environ.get("AUTOCOMPLETAR_MAX_USUARIOS", "2000"))   # índices en memoria (LRU)
+AUTOCOMPLETAR_TTL_S = float(os.environ.get("AUTOCOMPLETAR_TTL_S", "600"))
+AUTOCOMPLETAR_VIDA_MEDIA_DIAS = float(os.environ.get("AUTOCOMPLETAR_VIDA_MEDIA_DIAS", "30"))
+AUTOCOMPLETAR_PALABRAS = int(os.environ.get("AUTOCOMPLETAR_PALABRAS", "4"))            # inicios de palabra indexados
+
+_REFERENCIA = datetime(2020, 1, 1)
+_DECAIMIENTO = math.log(2) / (AUTOCOMPLETAR_VIDA_MEDIA_DIAS * 86400)
+_RE_ESPACIOS = re.compile(r"\s+")
+
+# ===== Normalización =====
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin acentos y con espacios colapsados: 'Café  Central' -> 'cafe central'."""
+    sin_acentos = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+    return _RE_ESPACIOS.sub(" ", sin_acentos).strip().lower()
+
+def _fragmentos(norm: str) -> List[str]:
+    """El texto completo y sus sufijos desde cada inicio de palabra: 'pago luz' -> ['pago luz', 'luz']."""
+    fragmentos, inicio = [], 0
+    for _ in range(AUTOCOMPLETAR_PALABRAS):
+        fragmentos.append(norm[inicio:])
+        inicio = norm.find(" ", inicio) + 1
+        if inicio == 0:
+            break
+    return fragmentos
+
+# ===== Índice de un usuario =====
+@dataclass
+class Entrada:
+    tipo: str                      # 'descripcion' | 'categoria'
+    texto: str                     # forma más reciente tal como la escribió el usuario
+    categoria_id: Optional[int]    # de la categoría: la misma; de la descripción: la del último uso
+    usos: int
+    ultimo: datetime
+
+    def puntaje(self) -> float:
+        # log(usos) + decaimiento exponencial del último uso: con vida media de 30 días, algo usado
+        # hace un mes necesita el doble de usos para empatar. No depende de "ahora": el orden es
+        # estable y una alta solo toca su propia entrada.
+        return math.log(max(self.usos, 1)) + _DECAIMIENTO * (self.ultimo - _REFERENCIA).total_seconds()
+
+class IndiceUsuario:
+    """
+    Arreglo ordenado de (fragmento normalizado, tipo, texto normalizado) para búsqueda por
+    prefijo con bisect; cada fragmento apunta a la Entrada de su texto completo.
+    """
+
+    def __init__(self):
+        self._claves: List[Tuple[str, str, str]] = []
+        self._entradas: Dict[Tuple[str, str], Entrada] = {}
+        self._lock = threading.Lock()
+        self.creado = time.monotonic()
+
+    def sumar(self, tipo: str, texto: str, categoria_id: Optional[int], usos: int, ultimo: Optional[datetime]):
+        norm = normalizar(texto or "")
+        if not norm:
+            return
+        ultimo = ultimo or datetime.utcnow()
+        with self._lock:
+            entrada = self._entradas.get((tipo, norm))
+            if entrada is None:
+                if usos <= 0:
+                    return
+                self._entradas[(tipo, norm)] = Entrada(tipo, texto, categoria_id, usos, ultimo)
+                for fragmento in _fragmentos(norm):
+                    insort(self._claves, (fragmento, tipo, norm))
+                return
+            entrada.usos += usos
+            if usos > 0 and ultimo >= entrada.ultimo:
+                entrada.texto, entrada.categoria_id, entrada.ultimo = texto, categoria_id, ultimo
+            if entrada.usos <= 0:
+                del self._entradas[(tipo, norm)]
+                for fragmento in _fragmentos(norm):
+                    i = bisect_left(self._claves, (fragmento, tipo, norm))
+                    if i < len(self._claves) and self._claves[i] == (fragmento, tipo, norm):
+                        del self._claves[i]
+
+    def sugerir(self, prefijo: str, limite: int, tipo: Optional[str] = None) -> List[Entrada]:
+        prefijo = normalizar(prefijo)
+        if not prefijo:
+            return []
+        with self._lock:
+            vistas: Dict[Tuple[str, str], Entrada] = {}
+            i = bisect_left(self._claves, (prefijo,))
+            while i < len(self._claves) and self._claves[i][0].startswith(prefijo):
+                _, tipo_clave, norm = self._claves[i]
+                if tipo is None or tipo_clave == tipo:
+                    vistas[(tipo_clave, norm)] = self._entradas[(tipo_clave, norm)]
+                i += 1
+            return heapq.nlargest(limite, vistas.values(), key=Entrada.puntaje)
+
+    def __len__(self):
+        return len(self._entradas)
+
+def construir(db: Session, id_usuario: int) -> IndiceUsuario:
+    """Un GROUP BY por tabla (transacciones, pagos) sobre las filas del usuario + los nombres de categoría."""
+    indice = IndiceUsuario()
+    por_categoria: Dict[int, List] = {}
+    for modelo, fecha in ((Transaction, Transaction.fecha), (PagoFijo, PagoFijo.fecha_programada)):
+        filas = (
+            db.query(modelo.descripcion, modelo.categoria_id, func.count(), func.max(fecha))
+            .filter(modelo.id_usuario == id_usuario)
+            .group_by(modelo.descripcion, modelo.categoria_id)
+            .all()
+        )
+        for descripcion, categoria_id, usos, ultimo in filas:
+            if descripcion:
+                indice.sumar("descripcion", descripcion, categoria_id, usos, ultimo)
+            if categoria_id is not None:
+                acumulado = por_categoria.setdefault(categoria_id, [0, ultimo])
+                acumulado[0] += usos
+                acumulado[1] = max(acumulado[1], ultimo)
+    if por_categoria:
+        nombres = db.query(Categoria.id_categoria, Categoria.nombre).filter(
+            Categoria.id_categoria.in_(list(por_categoria))
+        )
+        for categoria_id, nombre in nombres:
+            usos, ultimo = por_categoria[categoria_id]
+            indice.sumar("categoria", nombre, categoria_id, usos, ultimo)
+    return indice
+
+# ===== Caché LRU por proceso =====
+_indices: "OrderedDict[int, IndiceUsuario]" = OrderedDict()
+_lock = threading.Lock()
+_nombres_categoria: Dict[int, str] = {}
+estadisticas = {"aciertos": 0, "construcciones": 0, "desalojos": 0}
+
+def indice_de(db: Session, id_usuario: int) -> IndiceUsuario:
+    with _lock:
+        indice = _indices.get(id_usuario)
+        if indice is not None and time.monotonic() - indice.creado < AUTOCOMPLETAR_TTL_S:
+            _indices.move_to_end(id_usuario)
+            estadisticas["aciertos"] += 1
+            return indice
+    # Fuera del candado: la consulta no bloquea a los demás usuarios
+    indice = construir(db, id_usuario)
+    with _lock:
+        _indices[id_usuario] = indice
+        _indices.move_to_end(id_usuario)
+        estadisticas["construcciones"] += 1
+        while len(_indices) > AUTOCOMPLETAR_MAX_USUARIOS:
+            _indices.popitem(last=False)
+            estadisticas["desalojos"] += 1
+    return indice
+
+def sugerir(db: Session, id_usuario: int, q: str, limite: int = 8, tipo: Optional[str] = None) -> List[dict]:
+    return [
+        {
+            "tipo": e.tipo,
+            "texto": e.texto,
+            "categoria_id": e.categoria_id,
+            "usos": e.usos,
+            "ultimo_uso": e.ultimo,
+        }
+        for e in indice_de(db, id_usuario).sugerir(q, limite, tipo)
+    ]
+
+# ===== Actualización incremental al confirmar =====
+# Solo se mantienen los índices que ya están en memoria de este proceso; los demás workers los
+# ven al reconstruirse (AUTOCOMPLETAR_TTL_S). Una escritura confirmada justo mientras otro hilo
+# construye el índice de ese usuario puede quedar fuera hasta entonces.
+_MODELOS = {Transaction: "fecha", PagoFijo: "fecha_programada"}
+
+def _anterior(obj, atributo: str):
+    historia = inspect(obj).attrs[atributo].history
+    if historia.deleted:
+        return historia.deleted[0]
+    return getattr(obj, atributo)
+
+def _registrar(session: Session, flush_context):
+    cambios = []
+    for objetos, signo in ((session.new, 1), (session.deleted, -1), (session.dirty, 0)):
+        for obj in objetos:
+            fecha = _MODELOS.get(type(obj))
+            if fecha is None or obj.id_usuario not in _indices:
+                continue
+            ahora = (obj.id_usuario, obj.descripcion, obj.categoria_id, getattr(obj, fecha))
+            if signo == 0:
+                antes = (_anterior(obj, "id_usuario"), _anterior(obj, "descripcion"), _anterior(obj, "categoria_id"), None)
+                if antes[:3] == ahora[:3]:
+                    continue
+                cambios += [(antes, -1), (ahora, 1)]
+            else:
+                cambios.append((ahora, signo))
+    if not cambios:
+        return
+    # Nombres de categoría nuevos para el proceso: aquí, porque tras el commit ya no se puede consultar
+    faltantes = {c for (_, _, c, _), _ in cambios if c is not None and c not in _nombres_categoria}
+    if faltantes:
+        tabla = Categoria.__table__
+        conexion = session.connection(bind_arguments=shards.argumentos(cambios[0][0][0]))
+        _nombres_categoria.update(
+            conexion.execute(select(tabla.c.id_categoria, tabla.c.nombre).where(tabla.c.id_categoria.in_(faltantes))).all()
+        )
+    session.info.setdefault("autocompletar", []).extend(cambios)
+
+def _aplicar(session: Session):
+    for (uid, descripcion, categoria_id, fecha), signo in session.info.pop("autocompletar", ()):
+        indice = _indices.get(uid)
+        if indice is None:
+            continue
+        if descripcion:
+            indice.sumar("descripcion", descripcion, categoria_id, signo, fecha)
+        if categoria_id in _nombres_categoria:
+            indice.sumar("categoria", _nombres_categoria[categoria_id], categoria_id, signo, fecha)
+
+def _descartar(session: Session, *args):
+    session.info.pop("autocompletar", None)
+
+def instalar():
+    """Altas, bajas y cambios de descripción/categoría de transacciones y pagos actualizan el índice tras el commit."""
+    for nombre, funcion in (("after_flush", _registrar), ("after_commit", _aplicar), ("after_rollback", _descartar)):
+        if not event.contains(Session, nombre, funcion):
+            event.listen(Session, nombre, funcion)
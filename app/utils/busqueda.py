@@ -0,0 +1,161 @@
+import base64
+import json
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.utils.periodos import inicio_dia
+
+FUENTES = ("transacciones", "pagos")
+
+# ===== Índices de texto =====
+# MySQL: FULLTEXT (bd/migraciones/002_fulltext_descripcion.sql). Las descripciones de transacciones
+# viven en `transacciones_texto` porque la tabla particionada no admite FULLTEXT (003).
+# SQLite (desarrollo local): tablas FTS5 de contenido externo mantenidas con triggers.
+_FTS5 = {
+    "transacciones": ("transacciones_fts", "id_transaccion"),
+    "pagos": ("pagos_fts", "id_pago"),
+}
+
+def asegurar_fts(engine: Engine):
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for tabla, (fts, pk) in _FTS5.items():
+            existia = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"), {"n": fts}
+            ).first()
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                f"descripcion, content='{tabla}', content_rowid='{pk}', tokenize='unicode61 remove_diacritics 2')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabla} BEGIN "
+                f"INSERT INTO {fts}(rowid, descripcion) VALUES (new.{pk}, new.descripcion); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabla} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, descripcion) VALUES ('delete', old.{pk}, old.descripcion); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF descripcion ON {tabla} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, descripcion) VALUES ('delete', old.{pk}, old.descripcion); "
+                f"INSERT INTO {fts}(rowid, descripcion) VALUES (new.{pk}, new.descripcion); END"
+            ))
+            if not existia:
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+# ===== Cursor (keyset sobre score DESC, fuente ASC, id DESC) =====
+def codificar_cursor(score: float, fuente: str, id_: int) -> str:
+    crudo = json.dumps([score, fuente, id_], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+def decodificar_cursor(cursor: str) -> Tuple[float, str, int]:
+    relleno = "=" * (-len(cursor) % 4)
+    score, fuente, id_ = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    return float(score), str(fuente), int(id_)
+
+# ===== Consulta =====
+_RE_TERMINOS = re.compile(r"\w+", re.UNICODE)
+
+def _select_fuente(dialecto: str, fuente: str, filtros: List[str]) -> str:
+    if fuente == "transacciones":
+        tabla, alias, pk, fecha, tipo = "transacciones", "t", "id_transaccion", "fecha", "t.tipo"
+    else:
+        tabla, alias, pk, fecha, tipo = "pagos", "p", "id_pago", "fecha_programada", "'pago'"
+
+    condiciones = [f"{alias}.id_usuario = :id_usuario"] + [f.format(a=alias, fecha=fecha) for f in filtros]
+    columnas = (
+        f"'{fuente}' AS fuente, {alias}.{pk} AS id, {alias}.descripcion AS descripcion, "
+        f"{alias}.monto AS monto, {alias}.{fecha} AS fecha, {alias}.categoria_id AS categoria_id, {tipo} AS tipo"
+    )
+    if dialecto == "sqlite":
+        fts = _FTS5[fuente][0]
+        return (
+            f"SELECT {columnas}, -bm25({fts}) AS score "
+            f"FROM {fts} JOIN {tabla} {alias} ON {alias}.{pk} = {fts}.rowid "
+            f"WHERE {fts} MATCH :q AND " + " AND ".join(condiciones)
+        )
+    if fuente == "transacciones":
+        match = "MATCH(x.descripcion) AGAINST (:q IN NATURAL LANGUAGE MODE)"
+        return (
+            f"SELECT {columnas}, {match} AS score "
+            f"FROM transacciones_texto x JOIN {tabla} {alias} ON {alias}.{pk} = x.id_transaccion "
+            f"WHERE {match} AND " + " AND ".join(condiciones)
+        )
+    match = f"MATCH({alias}.descripcion) AGAINST (:q IN NATURAL LANGUAGE MODE)"
+    return (
+        f"SELECT {columnas}, {match} AS score FROM {tabla} {alias} "
+        f"WHERE {match} AND " + " AND ".join(condiciones)
+    )
+
+def buscar(
+    db: Session,
+    id_usuario: int,
+    q: str,
+    fuentes=FUENTES,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    categoria_id: Optional[int] = None,
+    limite: int = 20,
+    cursor: Optional[str] = None,
+):
+    terminos = _RE_TERMINOS.findall(q or "")
+    if not terminos:
+        return [], None
+
+    dialecto = db.get_bind().dialect.name
+    params = {"id_usuario": id_usuario, "limite": limite + 1}
+    # FTS5 interpreta operadores: cada término va entre comillas y se combinan con OR como en MySQL
+    params["q"] = " OR ".join(f'"{t}"' for t in terminos) if dialecto == "sqlite" else " ".join(terminos)
+
+    filtros = []
+    if desde:
+        filtros.append("{a}.{fecha} >= :desde")
+        params["desde"] = inicio_dia(desde)
+    if hasta:
+        filtros.append("{a}.{fecha} < :hasta")
+        params["hasta"] = inicio_dia(hasta + timedelta(days=1))
+    if categoria_id is not None:
+        filtros.append("{a}.categoria_id = :categoria_id")
+        params["categoria_id"] = categoria_id
+
+    union = " UNION ALL ".join(_select_fuente(dialecto, f, filtros) for f in fuentes)
+    keyset = ""
+    if cursor:
+        params["c_score"], params["c_fuente"], params["c_id"] = decodificar_cursor(cursor)
+        keyset = (
+            "WHERE r.score < :c_score OR (r.score = :c_score AND "
+            "(r.fuente > :c_fuente OR (r.fuente = :c_fuente AND r.id < :c_id)))"
+        )
+    sql = f"SELECT * FROM ({union}) r {keyset} ORDER BY r.score DESC, r.fuente ASC, r.id DESC LIMIT :limite"
+
+    consulta = text(sql)
+    for nombre in ("desde", "hasta"):
+        if nombre in params:
+            consulta = consulta.bindparams(bindparam(nombre, type_=DateTime))
+    filas = db.execute(consulta, params).mappings().all()
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        ultima = filas[-1]
+        siguiente = codificar_cursor(float(ultima["score"]), ultima["fuente"], int(ultima["id"]))
+
+    resultados = [
+        {
+            "fuente": f["fuente"],
+            "id": f["id"],
+            "descripcion": f["descripcion"],
+            "monto": float(f["monto"]),
+            "fecha": f["fecha"].isoformat() if isinstance(f["fecha"], datetime) else str(f["fecha"]).replace(" ", "T"),
+            "categoria_id": f["categoria_id"],
+            "tipo": f["tipo"],
+            "score": float(f["score"]),
+        }
+        for f in filas
+    ]
+    return resultados, siguiente
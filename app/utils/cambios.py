@@ -0,0 +1,147 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.budget_model import Budget
+from app.models.cambio_model import Cambio, SecuenciaCambios
+from app.models.pago_model import PagoFijo
+from app.models.transaction_model import Transaction
+from app.utils import shards
+
+CAMBIOS_RETENCION_DIAS = int(os.environ.get("CAMBIOS_RETENCION_DIAS", "90"))
+
+secuencia = SecuenciaCambios.__table__
+
+# modelo -> (entidad, atributo PK, función que da los usuarios afectados)
+_ENTIDADES = {
+    Transaction: ("transaccion", "id_transaccion", lambda t: (t.id_usuario, t.destinatario_id)),
+    PagoFijo: ("pago", "id_pago", lambda p: (p.id_usuario,)),
+    Budget: ("presupuesto", "id_presupuesto", lambda b: (b.id_usuario,)),
+}
+
+# ===== Registro automático en el mismo commit que la escritura =====
+# Un AUTO_INCREMENT se asigna al insertar, no al confirmar: una transacción que espera un
+# candado puede confirmar un id menor después de que el cliente avanzó su cursor, y ese cambio
+# se pierde. Por eso las filas se juntan en cada flush y se insertan justo antes del COMMIT con
+# ids de la fila de secuencia_cambios del shard: su candado dura hasta el COMMIT, así que los
+# ids quedan visibles en orden y todo id menor que uno visible ya está confirmado.
+def _anotar(session: Session, flush_context):
+    filas = session.info.setdefault("_cambios", [])
+    for objetos, operacion in ((session.new, "alta"), (session.dirty, "cambio"), (session.deleted, "baja")):
+        for obj in objetos:
+            entidad = _ENTIDADES.get(type(obj))
+            if entidad is None or (operacion == "cambio" and not session.is_modified(obj)):
+                continue
+            nombre, pk, usuarios = entidad
+            for uid in {u for u in usuarios(obj) if u is not None}:
+                filas.append({"id_usuario": uid, "entidad": nombre, "id_entidad": getattr(obj, pk),
+                              "operacion": operacion})
+
+def _reservar_ids(conn, n: int, desde: int) -> int:
+    """Último de `n` ids consecutivos del shard; el candado de la fila se suelta con el COMMIT."""
+    subir = update(secuencia).where(secuencia.c.id == 1).values(valor=secuencia.c.valor + n)
+    if conn.execute(subir).rowcount == 0:
+        # Primera escritura del shard: seguir después de lo que ya haya en cambios
+        maximo = conn.execute(select(func.max(Cambio.id))).scalar() or 0
+        try:
+            conn.execute(insert(secuencia).values(id=1, valor=max(maximo, desde)))
+        except IntegrityError:
+            pass  # otro proceso la sembró primero
+        conn.execute(subir)
+    return conn.execute(select(secuencia.c.valor).where(secuencia.c.id == 1)).scalar()
+
+def confirmar_pendientes(session: Session):
+    """
+    Inserta las filas anotadas en la transacción. Corre como before_commit; quien necesite
+    separar sus errores de los del COMMIT mismo (commit_agrupado) puede llamarla antes.
+    """
+    session.flush()  # el COMMIT haría este flush después del hook y sus filas se quedarían fuera
+    filas = session.info.pop("_cambios", None)
+    if not filas:
+        return
+    # Cada fila va al shard de su usuario (una transferencia entre shards escribe en los dos).
+    # Los shards en el mismo orden en todas las transacciones: sin esperas cruzadas entre ellos
+    por_shard = shards.agrupar({f["id_usuario"] for f in filas})
+    for shard in sorted(por_shard):
+        uids = por_shard[shard]
+        propias = [f for f in filas if f["id_usuario"] in uids]
+        conn = session.connection(bind_arguments=shards.argumentos(uids[0]))
+        ultimo = _reservar_ids(conn, len(propias), shards.rango_de(shard)[0])
+        for i, fila in enumerate(propias, start=ultimo - len(propias) + 1):
+            fila["id"] = i
+        conn.execute(insert(Cambio.__table__), propias)
+
+def _descartar(session: Session):
+    session.info.pop("_cambios", None)
+
+def instalar():
+    """
+    Hooks de todas las sesiones ORM: cada alta/cambio/baja de transacciones, pagos y
+    presupuestos deja su fila en `cambios` dentro de la misma transacción. Los DELETE/UPDATE
+    masivos (archivo de meses cerrados) no pasan por aquí a propósito: no son bajas del usuario.
+    """
+    for nombre, funcion in (("after_flush", _anotar), ("before_commit", confirmar_pendientes),
+                            ("after_rollback", _descartar)):
+        if not event.contains(Session, nombre, funcion):
+            event.listen(Session, nombre, funcion)
+
+# ===== Lectura del feed =====
+def leer_cambios(
+    db: Session, id_usuario: int, cursor: int, limite: int
+) -> Tuple[List[Tuple[str, int, str]], int, bool]:
+    """
+    Últimas operaciones por entidad desde `cursor` (exclusivo), en orden de id.
+    Devuelve ([(entidad, id_entidad, operación)], nuevo cursor, hay_mas).
+    """
+    filas = (
+        db.query(Cambio.id, Cambio.entidad, Cambio.id_entidad, Cambio.operacion)
+        .filter(Cambio.id_usuario == id_usuario, Cambio.id > cursor)
+        .order_by(Cambio.id)
+        .limit(limite + 1)
+        .all()
+    )
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    ultimas: Dict[Tuple[str, int], str] = {}
+    for _, entidad, id_entidad, operacion in filas:
+        ultimas.pop((entidad, id_entidad), None)  # reinsertar conserva el orden de la última operación
+        ultimas[(entidad, id_entidad)] = operacion
+    nuevo = filas[-1][0] if filas else cursor
+    return [(e, i, op) for (e, i), op in ultimas.items()], nuevo, hay_mas
+
+def cursor_vigente(db: Session, id_usuario: int, cursor: int) -> bool:
+    """
+    False si la purga ya borró entradas posteriores a `cursor`, o si el cursor es de otro shard
+    (el usuario se movió): el cliente debe resincronizar completo.
+    """
+    shard = shards.shard_de(id_usuario)
+    desde, hasta = shards.rango_de(shard)
+    if cursor and not desde <= cursor < hasta:
+        return False
+    minimo = db.execute(select(func.min(Cambio.id)), bind_arguments=shards.argumentos(id_usuario)).scalar()
+    return minimo is None or max(cursor, desde) >= minimo - 1
+
+def cabeza(db: Session, id_usuario: int) -> int:
+    return db.query(func.max(Cambio.id)).filter(Cambio.id_usuario == id_usuario).scalar() or 0
+
+# ===== Retención =====
+def purgar_cambios(hoy: Optional[datetime] = None) -> int:
+    limite = (hoy or datetime.utcnow()) - timedelta(days=CAMBIOS_RETENCION_DIAS)
+    db = SessionLocal()
+    total = 0
+    try:
+        while True:
+            ids = [r[0] for r in db.query(Cambio.id).filter(Cambio.creado < limite).order_by(Cambio.id).limit(5000)]
+            if not ids:
+                break
+            db.query(Cambio).filter(Cambio.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            total += len(ids)
+        return total
+    finally:
+        db.close()
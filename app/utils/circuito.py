@@ -0,0 +1,60 @@
+import threading
+import time
+
+class Circuito:
+    """
+    Cortacircuitos por proveedor externo. Cerrado: todo pasa. Tras `fallos` errores seguidos se
+    abre y rechaza al instante durante `espera_s`. Después deja pasar una sola llamada de prueba
+    (semiabierto): si sale bien se cierra, si falla vuelve a abrirse otra espera completa.
+    """
+
+    def __init__(self, nombre: str, fallos: int, espera_s: float):
+        self.nombre = nombre
+        self.fallos = max(1, fallos)
+        self.espera_s = espera_s
+        self._lock = threading.Lock()
+        self._seguidos = 0
+        self._abierto_desde = None   # monotonic
+        self._probando = False
+        self.rechazadas = 0
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._abierto_desde is None:
+                return True
+            if not self._probando and time.monotonic() - self._abierto_desde >= self.espera_s:
+                self._probando = True
+                return True
+            self.rechazadas += 1
+            return False
+
+    def abierto(self) -> bool:
+        """Consulta sin consumir la llamada de prueba: True si está abierto y nadie está probando."""
+        with self._lock:
+            return self._abierto_desde is not None and not self._probando
+
+    def exito(self):
+        with self._lock:
+            self._seguidos = 0
+            self._abierto_desde = None
+            self._probando = False
+
+    def fallo(self):
+        with self._lock:
+            self._seguidos += 1
+            if self._probando or self._seguidos >= self.fallos:
+                if self._abierto_desde is None or self._probando:
+                    print(f"[Circuito] {self.nombre} abierto tras {self._seguidos} fallos seguidos")
+                self._abierto_desde = time.monotonic()
+                self._probando = False
+
+    def estado(self) -> dict:
+        with self._lock:
+            if self._abierto_desde is None:
+                nombre = "cerrado"
+            elif self._probando or time.monotonic() - self._abierto_desde >= self.espera_s:
+                nombre = "semiabierto"
+            else:
+                nombre = "abierto"
+            return {"proveedor": self.nombre, "estado": nombre, "fallos_seguidos": self._seguidos,
+                    "rechazadas": self.rechazadas}
@@ -0,0 +1,179 @@
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError as EsperaAgotada
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import bindparam, func, update
+
+from app.database import SessionLocal
+from app.utils import shards
+from app.utils.cambios import confirmar_pendientes
+from app.models.transaction_model import Transaction
+from app.models.user_model import User
+
+# Opt-in: agrupa los INSERT + ajustes de saldo de varios requests en un solo commit (un fsync)
+GROUP_COMMIT = os.environ.get("GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_MS = float(os.environ.get("GROUP_COMMIT_MS", "5"))        # espera máxima para juntar un lote
+GROUP_COMMIT_MAX = int(os.environ.get("GROUP_COMMIT_MAX", "200"))      # asientos por lote
+GROUP_COMMIT_TIMEOUT = float(os.environ.get("GROUP_COMMIT_TIMEOUT", "120"))  # red de seguridad, muy por encima de un lote normal
+
+class CommitIncierto(Exception):
+    """El COMMIT del lote falló sin saber si se aplicó (p. ej. se cortó la conexión): no se reintenta."""
+
+@dataclass
+class Asiento:
+    id_usuario: int
+    tipo: str
+    monto: int                                  # centavos
+    descripcion: Optional[str]
+    categoria_id: Optional[int]
+    delta_saldo: int                            # lo que cambia usuarios.saldo (+ ingreso, - egreso)
+    fecha: datetime = field(default_factory=datetime.utcnow)
+    futuro: Future = field(default_factory=Future)
+
+class AgrupadorEscrituras:
+    """
+    Un hilo por proceso (worker) que junta asientos durante GROUP_COMMIT_MS o hasta
+    GROUP_COMMIT_MAX y los confirma juntos: INSERT de las transacciones, UPDATE de saldos
+    agregados por usuario (en orden de id, como mover_saldo) y un solo COMMIT. Cada llamador
+    recibe su fila solo después del commit durable.
+    """
+
+    def __init__(self, espera_ms: float = GROUP_COMMIT_MS, maximo: int = GROUP_COMMIT_MAX):
+        self._cola: "queue.Queue[Asiento]" = queue.Queue()
+        self._espera = espera_ms / 1000.0
+        self._maximo = maximo
+        self._hilo = threading.Thread(target=self._bucle, name="group-commit", daemon=True)
+        self._hilo.start()
+
+    def registrar(self, asiento: Asiento, timeout: float = GROUP_COMMIT_TIMEOUT) -> dict:
+        """
+        Espera el resultado del lote. Si se pasa de `timeout` el asiento puede confirmarse todavía,
+        así que no es un error reintentable sino CommitIncierto (la ruta responde 202): un 5xx
+        haría que el reintento del cliente lo registrara dos veces.
+        """
+        self._cola.put(asiento)
+        try:
+            return asiento.futuro.result(timeout=timeout)
+        except EsperaAgotada:
+            raise CommitIncierto(f"sin resultado del lote tras {timeout:g}s") from None
+
+    # ===== Hilo de escritura =====
+    def _bucle(self):
+        # El hilo nunca termina: si muriera, cada request posterior esperaría hasta el timeout
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + self._espera
+            while len(lote) < self._maximo:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            try:
+                self._procesar(lote)
+            except BaseException as e:
+                # Error inesperado (p. ej. al responder): no se sabe qué quedó confirmado
+                print(f"[GroupCommit] Lote de {len(lote)} sin resultado: {e}")
+                incierto = CommitIncierto(str(e))
+                for asiento in lote:
+                    if not asiento.futuro.done():
+                        asiento.futuro.set_exception(incierto)
+
+    def _procesar(self, lote: List[Asiento]):
+        try:
+            ids = self._confirmar(lote)
+        except CommitIncierto as e:
+            # El lote pudo quedar escrito: reintentarlo podría duplicar todos sus asientos
+            for asiento in lote:
+                asiento.futuro.set_exception(e)
+            return
+        except Exception:
+            # Falló antes del COMMIT, nada quedó escrito. Un asiento inválido no debe tumbar
+            # a los demás: reintento uno por uno
+            for asiento in lote:
+                try:
+                    ids = self._confirmar([asiento])
+                except Exception as e:
+                    asiento.futuro.set_exception(e)
+                else:
+                    self._responder([asiento], ids)
+            return
+        self._responder(lote, ids)
+
+    def _confirmar(self, lote: List[Asiento]) -> List[int]:
+        """Escribe el lote en una transacción. Devuelve los id_transaccion en el orden del lote."""
+        db = SessionLocal()
+        try:
+            filas = [
+                Transaction(
+                    id_usuario=a.id_usuario,
+                    tipo=a.tipo,
+                    monto=a.monto,
+                    descripcion=a.descripcion,
+                    categoria_id=a.categoria_id,
+                    estado="completada",
+                    fecha=a.fecha,
+                )
+                for a in lote
+            ]
+            db.add_all(filas)
+            db.flush()
+            ids = [f.id_transaccion for f in filas]
+
+            deltas = defaultdict(int)
+            for a in lote:
+                deltas[a.id_usuario] += a.delta_saldo
+            # Un executemany por shard (sin sharding, uno solo)
+            for uids in shards.agrupar(sorted(deltas)).values():
+                db.execute(
+                    update(User.__table__)
+                    .where(User.__table__.c.id_usuario == bindparam("uid"))
+                    .values(saldo=func.coalesce(User.__table__.c.saldo, 0) + bindparam("delta")),
+                    [{"uid": uid, "delta": deltas[uid]} for uid in uids],
+                    bind_arguments=shards.argumentos(uids[0]),
+                )
+            confirmar_pendientes(db)  # sus errores (p. ej. espera de candado) no son del COMMIT
+            try:
+                db.commit()
+            except Exception as e:
+                raise CommitIncierto(str(e)) from e
+            return ids
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _responder(lote: List[Asiento], ids: List[int]):
+        for a, id_transaccion in zip(lote, ids):
+            a.futuro.set_result({
+                "id_transaccion": id_transaccion,
+                "id_usuario": a.id_usuario,
+                "tipo": a.tipo,
+                "monto": a.monto,
+                "descripcion": a.descripcion,
+                "categoria_id": a.categoria_id,
+                "estado": "completada",
+                "fecha": a.fecha,
+            })
+
+_agrupador: Optional[AgrupadorEscrituras] = None
+_lock = threading.Lock()
+
+def agrupador() -> AgrupadorEscrituras:
+    """Instancia del proceso actual; se crea en el primer uso (después del fork de los workers)."""
+    global _agrupador
+    if _agrupador is None:
+        with _lock:
+            if _agrupador is None:
+                _agrupador = AgrupadorEscrituras()
+    return _agrupador
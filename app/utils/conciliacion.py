@@ -0,0 +1,210 @@
+import contextvars
+import json
+import os
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, update
+
+from app.database import SessionLocal
+from app.models.archivo_model import ResumenArchivado
+from app.models.transaction_model import Transaction
+from app.models.user_model import User
+from app.utils import shards
+from app.utils.dinero import a_centavos, formatear
+from app.utils.estados_cuenta import SIGNO_DESTINATARIO, SIGNO_TITULAR
+
+CONCILIACION_DIR = os.environ.get("CONCILIACION_DIR", "conciliacion")
+CONCILIACION_LOTE = int(os.environ.get("CONCILIACION_LOTE", "5000"))        # usuarios por rango de ids
+CONCILIACION_HILOS = int(os.environ.get("CONCILIACION_HILOS", "4"))         # conexiones del pool en paralelo
+CONCILIACION_REPARAR = os.environ.get("CONCILIACION_REPARAR", "0") == "1"
+
+# ===== Checkpoint y reporte en disco (uno por corrida) =====
+def ruta_corrida(corrida: str) -> str:
+    return os.path.join(CONCILIACION_DIR, corrida)
+
+def _ruta_avance(corrida: str) -> str:
+    return os.path.join(CONCILIACION_DIR, corrida, "_avance.json")
+
+def ruta_desvios(corrida: str) -> str:
+    return os.path.join(CONCILIACION_DIR, corrida, "desvios.ndjson")
+
+def leer_avance(corrida: str) -> dict:
+    try:
+        with open(_ruta_avance(corrida)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"ultimo_id": 0, "usuarios": 0, "con_desvio": 0, "desvio_total": "0.00", "reparados": 0,
+                "completo": False}
+
+def _guardar_avance(corrida: str, avance: dict):
+    avance = dict(avance, actualizado=datetime.utcnow().isoformat())
+    tmp = _ruta_avance(corrida) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(avance, f)
+    os.replace(tmp, _ruta_avance(corrida))
+
+def ultima_corrida() -> Optional[str]:
+    if not os.path.isdir(CONCILIACION_DIR):
+        return None
+    corridas = sorted(c for c in os.listdir(CONCILIACION_DIR) if os.path.isfile(_ruta_avance(c)))
+    return corridas[-1] if corridas else None
+
+# ===== Libro de un rango de ids =====
+def _libro(db, desde_id: int, hasta_id: int) -> Dict[int, int]:
+    """Saldo según el libro (centavos) de los usuarios con id en (desde_id, hasta_id]."""
+    libro: Dict[int, int] = defaultdict(int)
+    for uid, tipo, total in (
+        db.query(Transaction.id_usuario, Transaction.tipo, func.sum(Transaction.monto))
+        .filter(Transaction.id_usuario > desde_id, Transaction.id_usuario <= hasta_id,
+                Transaction.estado == "completada")
+        .group_by(Transaction.id_usuario, Transaction.tipo)
+    ):
+        libro[uid] += SIGNO_TITULAR[tipo] * total
+    # Envíos recibidos y resúmenes archivados pueden vivir en el shard del otro usuario
+    with shards.todos(db) as todos:
+        for uid, tipo, total in (
+            todos.query(Transaction.destinatario_id, Transaction.tipo, func.sum(Transaction.monto))
+            .filter(Transaction.destinatario_id > desde_id, Transaction.destinatario_id <= hasta_id,
+                    Transaction.tipo.in_(tuple(SIGNO_DESTINATARIO)), Transaction.estado == "completada")
+            .group_by(Transaction.destinatario_id, Transaction.tipo)
+        ):
+            libro[uid] += SIGNO_DESTINATARIO[tipo] * total
+        for uid, rol, tipo, total in (
+            todos.query(ResumenArchivado.id_usuario, ResumenArchivado.rol, ResumenArchivado.tipo,
+                        func.sum(ResumenArchivado.total))
+            .filter(ResumenArchivado.id_usuario > desde_id, ResumenArchivado.id_usuario <= hasta_id)
+            .group_by(ResumenArchivado.id_usuario, ResumenArchivado.rol, ResumenArchivado.tipo)
+        ):
+            signos = SIGNO_TITULAR if rol == "titular" else SIGNO_DESTINATARIO
+            libro[uid] += signos.get(tipo, 0) * total
+    return libro
+
+# ===== Un rango de ids: detección sin candados =====
+def conciliar_rango(desde_id: int, hasta_id: int, reparar: bool = False) -> Tuple[int, List[dict]]:
+    """
+    Compara `saldo` con el libro (transacciones completadas + resúmenes archivados) para los
+    usuarios con id en (desde_id, hasta_id]. Lecturas sin FOR UPDATE: no bloquean a nadie, pero
+    tampoco son una foto exacta (con sharding, shards.todos abre otra sesión), así que un
+    movimiento en vuelo puede verse como desvío. Por eso cada desvío se vuelve a medir con el
+    usuario bloqueado antes de repararlo. Devuelve (usuarios revisados, desvíos).
+    """
+    db = SessionLocal()
+    try:
+        saldos = dict(
+            db.query(User.id_usuario, User.saldo)
+            .filter(User.id_usuario > desde_id, User.id_usuario <= hasta_id)
+            .all()
+        )
+        libro = _libro(db, desde_id, hasta_id)
+    finally:
+        db.rollback()
+        db.close()
+
+    desvios = []
+    for uid in sorted(saldos):
+        saldo = saldos[uid] or 0
+        esperado = libro.get(uid, 0)
+        if esperado != saldo:
+            desvio = {"id_usuario": uid, "saldo": formatear(saldo), "libro": formatear(esperado),
+                      "desvio": formatear(saldo - esperado)}
+            if reparar:
+                desvio.update(reparar_usuario(uid))
+            desvios.append(desvio)
+    return len(saldos), desvios
+
+def reparar_usuario(uid: int) -> dict:
+    """
+    Bloquea la fila del usuario (SELECT ... FOR UPDATE), recalcula su libro y solo entonces fija
+    el saldo. Ingresos, egresos, transferencias, pagos fijos (ruta y cron) y ediciones de monto
+    actualizan el saldo con un UPDATE relativo y escriben su movimiento en el mismo commit con la
+    fila bloqueada, así que con el candado tomado no hay ninguno a medias.
+    """
+    db = SessionLocal()
+    try:
+        fila = db.query(User.saldo).filter(User.id_usuario == uid).with_for_update().first()
+        if fila is None:
+            return {"reparado": False}
+        saldo = fila.saldo or 0
+        esperado = _libro(db, uid - 1, uid).get(uid, 0)  # lecturas después del candado
+        if esperado == saldo:
+            db.rollback()
+            return {"reparado": False, "transitorio": True}  # era un movimiento en vuelo
+        db.execute(
+            update(User.__table__).where(User.__table__.c.id_usuario == uid).values(saldo=esperado)
+        )
+        db.commit()
+        return {"reparado": True, "ajuste": formatear(esperado - saldo)}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+# ===== Orquestación =====
+def _rangos(desde_id: int, lote: int):
+    """Límites (desde, hasta] de lote en lote sobre la PK de usuarios (solo lee el índice)."""
+    db = SessionLocal()
+    try:
+        while True:
+            hasta = db.query(User.id_usuario).filter(User.id_usuario > desde_id) \
+                .order_by(User.id_usuario).offset(lote - 1).limit(1).scalar()
+            if hasta is None:
+                hasta = db.query(func.max(User.id_usuario)).filter(User.id_usuario > desde_id).scalar()
+                if hasta is not None:
+                    yield desde_id, hasta
+                return
+            yield desde_id, hasta
+            db.rollback()
+            desde_id = hasta
+    finally:
+        db.close()
+
+def conciliar_saldos(
+    corrida: Optional[str] = None,
+    reparar: bool = CONCILIACION_REPARAR,
+    hilos: int = CONCILIACION_HILOS,
+    lote: int = CONCILIACION_LOTE,
+) -> dict:
+    """
+    Recorre todos los usuarios por rangos de id en un pool de hilos (cada uno con su conexión)
+    y anota los desvíos en CONCILIACION_DIR/<corrida>/desvios.ndjson. El checkpoint avanza solo
+    con rangos terminados en orden, así que re-invocar la misma corrida continúa donde quedó.
+    """
+    corrida = corrida or "-".join([f"{datetime.utcnow():%Y-%m-%d}", *shards.segmento()])
+    os.makedirs(ruta_corrida(corrida), exist_ok=True)
+    avance = leer_avance(corrida)
+    if avance.get("completo"):
+        return avance
+
+    def _cerrar(hasta_id: int, futuro):
+        revisados, desvios = futuro.result()
+        if desvios:
+            with open(ruta_desvios(corrida), "a", encoding="utf-8") as f:
+                for d in desvios:
+                    f.write(json.dumps(d, separators=(",", ":")) + "\n")
+        avance["ultimo_id"] = hasta_id
+        avance["usuarios"] += revisados
+        avance["con_desvio"] += len(desvios)
+        avance["desvio_total"] = formatear(
+            a_centavos(avance["desvio_total"]) + sum(a_centavos(d["desvio"]) for d in desvios)
+        )
+        avance["reparados"] += sum(1 for d in desvios if d.get("reparado"))
+        _guardar_avance(corrida, avance)
+
+    pendientes = deque()  # (hasta_id, futuro) en orden de envío
+    with ThreadPoolExecutor(max_workers=max(1, hilos), thread_name_prefix="conciliacion") as pool:
+        for desde_id, hasta_id in _rangos(avance["ultimo_id"], lote):
+            pendientes.append((hasta_id, pool.submit(contextvars.copy_context().run, conciliar_rango, desde_id, hasta_id, reparar)))
+            while pendientes and (pendientes[0][1].done() or len(pendientes) > 2 * hilos):
+                _cerrar(*pendientes.popleft())
+        while pendientes:
+            _cerrar(*pendientes.popleft())
+
+    avance["completo"] = True
+    _guardar_avance(corrida, avance)
+    print(f"[Conciliación] {corrida}: {avance['usuarios']} usuarios, {avance['con_desvio']} con desvío "
+          f"({avance['desvio_total']}), {avance['reparados']} reparados")
+    return avance
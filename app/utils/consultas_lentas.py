@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.utils import perfilador
+from app.utils.contexto import origen_actual
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_SAMPLE = float(os.environ.get("SLOW_QUERY_SAMPLE", "0.01"))
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "logs/consultas_lentas.log")
+SLOW_QUERY_LOG_BYTES = int(os.environ.get("SLOW_QUERY_LOG_BYTES", str(5 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get("SLOW_QUERY_LOG_BACKUPS", "5"))
+
+logger = logging.getLogger("lana.consultas_lentas")
+
+# ===== Huellas: misma consulta con distintos parámetros => misma huella =====
+_RE_COMENTARIOS = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+_RE_CADENAS = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_RE_PARAMS = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+_RE_NUMEROS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_LISTAS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_ESPACIOS = re.compile(r"\s+")
+
+@lru_cache(maxsize=2048)
+def huella(sql: str) -> str:
+    """Normaliza una sentencia quitando literales y parámetros (los SQL compilados se repiten, por eso el caché)."""
+    s = _RE_COMENTARIOS.sub(" ", sql)
+    s = _RE_CADENAS.sub("?", s)
+    s = _RE_PARAMS.sub("?", s)
+    s = _RE_NUMEROS.sub("?", s)
+    s = _RE_LISTAS.sub("(...)", s)
+    return _RE_ESPACIOS.sub(" ", s).strip()
+
+# ===== Agregados en memoria por (huella, origen) =====
+_lock = threading.Lock()
+_agregados: Dict[Tuple[str, str], List[float]] = {}  # [conteo, total_ms, max_ms, lentas]
+
+def _registrar(sql: str, ms: float):
+    h = huella(sql)
+    origen = origen_actual.get()
+    lenta = ms >= SLOW_QUERY_MS
+    with _lock:
+        a = _agregados.get((h, origen))
+        if a is None:
+            a = _agregados[(h, origen)] = [0, 0.0, 0.0, 0]
+        a[0] += 1
+        a[1] += ms
+        if ms > a[2]:
+            a[2] = ms
+        if lenta:
+            a[3] += 1
+
+    if lenta or random.random() < SLOW_QUERY_SAMPLE:
+        logger.info(json.dumps({
+            "ms": round(ms, 2),
+            "lenta": lenta,
+            "origen": origen,
+            "huella": h,
+        }, ensure_ascii=False))
+
+def resumen(agrupar: str = "huella", orden: str = "total_ms", limite: int = 50) -> List[dict]:
+    """
+    agrupar: 'huella' (todas las rutas sumadas), 'origen' o 'ambos'.
+    orden: 'total_ms', 'max_ms', 'conteo' o 'lentas'.
+    """
+    with _lock:
+        filas = [(h, o, list(a)) for (h, o), a in _agregados.items()]
+
+    grupos: Dict[tuple, List[float]] = {}
+    for h, o, (conteo, total, maximo, lentas) in filas:
+        clave = {"huella": (h,), "origen": (o,)}.get(agrupar, (h, o))
+        g = grupos.setdefault(clave, [0, 0.0, 0.0, 0])
+        g[0] += conteo
+        g[1] += total
+        g[2] = max(g[2], maximo)
+        g[3] += lentas
+
+    salida = []
+    for clave, (conteo, total, maximo, lentas) in grupos.items():
+        item = {
+            "conteo": int(conteo),
+            "total_ms": round(total, 2),
+            "promedio_ms": round(total / conteo, 2) if conteo else 0.0,
+            "max_ms": round(maximo, 2),
+            "lentas": int(lentas),
+        }
+        if agrupar == "huella":
+            item["huella"] = clave[0]
+        elif agrupar == "origen":
+            item["origen"] = clave[0]
+        else:
+            item["huella"], item["origen"] = clave
+        salida.append(item)
+
+    salida.sort(key=lambda x: x.get(orden, 0), reverse=True)
+    return salida[:limite]
+
+def reiniciar():
+    with _lock:
+        _agregados.clear()
+
+# ===== Hooks del engine =====
+def _configurar_log():
+    if logger.handlers or not SLOW_QUERY_LOG:
+        return
+    carpeta = os.path.dirname(SLOW_QUERY_LOG)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    handler = RotatingFileHandler(
+        SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8"
+    )
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+def instalar(engine: Engine):
+    """Engancha before/after_cursor_execute para medir cada sentencia que pasa por el engine."""
+    _configurar_log()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        perfilador.marcar_hilo()
+        conn.info.setdefault("_t_consulta", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        pila = conn.info.get("_t_consulta")
+        if not pila:
+            return
+        ms = (time.perf_counter() - pila.pop()) * 1000.0
+        _registrar(statement, ms)
+        perfilador.anotar_sql(statement, ms, cursor.rowcount)
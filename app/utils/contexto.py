@@ -0,0 +1,40 @@
+from contextvars import ContextVar
+from typing import Any, Dict, Tuple
+from starlette.requests import Request
+from starlette.routing import Match
+from starlette.types import Receive
+
+# Ruta o job que originó el trabajo actual (p. ej. "GET /estadisticas/dashboard" o "cron:ejecutar_pagos_fijos").
+# Los endpoints síncronos corren en el threadpool, que copia el contexto, así que el valor llega hasta las consultas.
+origen_actual: ContextVar[str] = ContextVar("origen_actual", default="desconocido")
+
+def resolver_ruta(request: Request) -> Tuple[str, Dict[str, Any]]:
+    """(ruta declarada, path params) del request, antes de que el router lo despache."""
+    for route in request.app.router.routes:
+        match, hijo = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path), hijo.get("path_params", {})
+    return request.url.path, {}
+
+async def leer_cuerpo(receive: Receive) -> Tuple[Receive, bytes]:
+    """Lee el cuerpo completo en un middleware y devuelve un receive que lo vuelve a entregar a la app."""
+    cuerpo = b""
+    while True:
+        msg = await receive()
+        cuerpo += msg.get("body", b"")
+        if not msg.get("more_body"):
+            break
+    entregado = False
+
+    async def receive_repetido():
+        nonlocal entregado
+        if not entregado:
+            entregado = True
+            return {"type": "http.request", "body": cuerpo, "more_body": False}
+        return await receive()
+
+    return receive_repetido, cuerpo
+
+def plantilla_ruta(request: Request) -> str:
+    """Devuelve la ruta declarada (p. ej. '/pagos/{id_pago}') en lugar del path concreto."""
+    return resolver_ruta(request)[0]
@@ -0,0 +1,227 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta, timezone
+from functools import wraps
+from typing import Deque, Dict, List, Optional, Tuple
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+from sqlalchemy import delete, insert, select, update
+
+from app.models.corrida_model import CorridaJob
+from app.utils import shards
+
+CORRIDAS_RETENCION_DIAS = int(os.environ.get("CORRIDAS_RETENCION_DIAS", "30"))
+
+corridas = CorridaJob.__table__
+
+# ===== Contadores de la corrida en curso (uno por hilo de shard) =====
+class Metricas:
+    """Lo que el job va contando; se guarda junto con los tiempos al terminar la corrida."""
+
+    __slots__ = ("filas_revisadas", "pagos_ejecutados", "omitidos_presupuesto", "omitidos_saldo",
+                 "notificaciones", "errores", "lags", "primer_error")
+
+    def __init__(self):
+        self.filas_revisadas = 0
+        self.pagos_ejecutados = 0
+        self.omitidos_presupuesto = 0
+        self.omitidos_saldo = 0
+        self.notificaciones = 0
+        self.errores = 0
+        self.lags: List[float] = []
+        self.primer_error: Optional[str] = None
+
+metricas_actuales: ContextVar[Optional[Metricas]] = ContextVar("metricas_corrida", default=None)
+
+def contar(campo: str, n: int = 1):
+    """Suma al contador de la corrida actual; fuera de un job registrado no hace nada."""
+    metricas = metricas_actuales.get()
+    if metricas is not None:
+        setattr(metricas, campo, getattr(metricas, campo) + n)
+
+def anotar_lag_pago(proxima_ejecucion: date, ahora: Optional[datetime] = None):
+    """Cola de pagos: cuánto pasó desde el inicio del día en que tocaba hasta que se tomó."""
+    metricas = metricas_actuales.get()
+    if metricas is not None:
+        ahora = ahora or datetime.utcnow()
+        metricas.lags.append((ahora - datetime.combine(proxima_ejecucion, datetime.min.time())).total_seconds())
+
+def anotar_error(e: Exception):
+    """Error de un elemento que el job saltó para seguir con los demás."""
+    metricas = metricas_actuales.get()
+    if metricas is not None:
+        metricas.errores += 1
+        metricas.primer_error = metricas.primer_error or f"{type(e).__name__}: {e}"
+
+# ===== Registro de cada corrida =====
+# Corridas recién guardadas que esperan la hora programada (solo la conoce el evento de APScheduler).
+# Por job hay a lo más una instancia en vuelo (max_instances=1 por defecto), así que basta la llave por job.
+_sin_programar: Dict[str, Deque[Tuple[int, datetime]]] = {}
+_lock = threading.Lock()
+_programador = None
+
+def _insertar(**valores) -> Optional[int]:
+    try:
+        with shards.motor(shards.SHARD_PRIMARIO).begin() as conn:
+            return conn.execute(insert(corridas).values(**valores)).inserted_primary_key[0]
+    except Exception as e:  # el historial nunca tumba al job
+        print(f"[Corridas] No se pudo registrar {valores.get('job')}: {e}")
+        return None
+
+def registrar(job):
+    """
+    Envuelve un job (por dentro de en_cada_shard) para dejar una fila en corridas_jobs con tiempos,
+    contadores y estado. Las excepciones se anotan y se vuelven a lanzar, igual que antes.
+    """
+    @wraps(job)
+    def envoltura(*args, **kwargs):
+        metricas = Metricas()
+        token = metricas_actuales.set(metricas)
+        inicio = datetime.utcnow()
+        t0 = time.perf_counter()
+        estado, error = "ok", None
+        try:
+            return job(*args, **kwargs)
+        except Exception as e:
+            estado, error = "error", f"{type(e).__name__}: {e}"
+            metricas.errores += 1
+            raise
+        finally:
+            metricas_actuales.reset(token)
+            lags = metricas.lags
+            id_corrida = _insertar(
+                job=job.__name__,
+                shard=shards.shard_actual.get(),
+                estado=estado,
+                inicio=inicio,
+                fin=datetime.utcnow(),
+                duracion_ms=round((time.perf_counter() - t0) * 1000, 2),
+                filas_revisadas=metricas.filas_revisadas,
+                pagos_ejecutados=metricas.pagos_ejecutados,
+                omitidos_presupuesto=metricas.omitidos_presupuesto,
+                omitidos_saldo=metricas.omitidos_saldo,
+                notificaciones=metricas.notificaciones,
+                errores=metricas.errores,
+                lag_pago_max_s=round(max(lags), 1) if lags else None,
+                lag_pago_prom_s=round(sum(lags) / len(lags), 1) if lags else None,
+                error=error or metricas.primer_error,
+            )
+            if id_corrida is not None:
+                with _lock:
+                    _sin_programar.setdefault(job.__name__, deque(maxlen=64)).append((id_corrida, inicio))
+    return envoltura
+
+def _utc(momento: datetime) -> datetime:
+    return momento.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _al_evento(evento):
+    """Listener de APScheduler: completa la hora programada y anota las corridas que no se dieron."""
+    if evento.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+        programada = _utc(evento.scheduled_run_time)
+        with _lock:
+            pendientes = list(_sin_programar.pop(evento.job_id, ()))
+        # Las corridas manuales (fuera del scheduler) empiezan antes de la hora programada: se dejan sin ella
+        pendientes = [(i, inicio) for i, inicio in pendientes if inicio >= programada]
+        if not pendientes:
+            return
+        try:
+            with shards.motor(shards.SHARD_PRIMARIO).begin() as conn:
+                for id_corrida, inicio in pendientes:
+                    conn.execute(update(corridas).where(corridas.c.id == id_corrida).values(
+                        programada=programada,
+                        retraso_ms=round((inicio - programada).total_seconds() * 1000, 2),
+                    ))
+        except Exception as e:
+            print(f"[Corridas] No se pudo completar {evento.job_id}: {e}")
+    elif evento.code == EVENT_JOB_MISSED:
+        programada = _utc(evento.scheduled_run_time)
+        _insertar(job=evento.job_id, estado="perdida", programada=programada, inicio=datetime.utcnow(),
+                  retraso_ms=round((datetime.utcnow() - programada).total_seconds() * 1000, 2))
+    elif evento.code == EVENT_JOB_MAX_INSTANCES:
+        # La corrida anterior sigue en vuelo: APScheduler descarta estas horas sin correrlas
+        for momento in evento.scheduled_run_times:
+            programada = _utc(momento)
+            _insertar(job=evento.job_id, estado="omitida", programada=programada, inicio=datetime.utcnow(),
+                      retraso_ms=round((datetime.utcnow() - programada).total_seconds() * 1000, 2))
+        print(f"[Corridas] {evento.job_id}: {len(evento.scheduled_run_times)} corrida(s) omitida(s), la anterior sigue en curso")
+
+def escuchar(programador):
+    """Engancha el listener al scheduler y lo recuerda para mostrar la próxima ejecución de cada job."""
+    global _programador
+    _programador = programador
+    programador.add_listener(_al_evento, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
+def proximas() -> Optional[Dict[str, Optional[str]]]:
+    """Próxima ejecución de cada job según el scheduler de este worker (None si aquí no corre cron)."""
+    if _programador is None:
+        return None
+    return {
+        j.id: _utc(j.next_run_time).isoformat() if j.next_run_time else None
+        for j in _programador.get_jobs()
+    }
+
+def purgar_corridas() -> int:
+    with shards.motor(shards.SHARD_PRIMARIO).begin() as conn:
+        return conn.execute(delete(corridas).where(
+            corridas.c.inicio < datetime.utcnow() - timedelta(days=CORRIDAS_RETENCION_DIAS)
+        )).rowcount
+
+# ===== Resumen para /diagnostico/cron =====
+def _percentil(valores: List[float], p: float) -> Optional[float]:
+    if not valores:
+        return None
+    valores = sorted(valores)
+    return round(valores[max(0, math.ceil(p * len(valores)) - 1)], 2)  # nearest-rank
+
+def _fila(c) -> dict:
+    return {
+        "id": c.id, "shard": c.shard, "estado": c.estado,
+        "programada": c.programada.isoformat() if c.programada else None,
+        "inicio": c.inicio.isoformat(), "duracion_ms": c.duracion_ms, "retraso_ms": c.retraso_ms,
+        "filas_revisadas": c.filas_revisadas, "pagos_ejecutados": c.pagos_ejecutados,
+        "omitidos_presupuesto": c.omitidos_presupuesto, "omitidos_saldo": c.omitidos_saldo,
+        "notificaciones": c.notificaciones, "errores": c.errores,
+        "lag_pago_max_s": c.lag_pago_max_s, "lag_pago_prom_s": c.lag_pago_prom_s, "error": c.error,
+    }
+
+def resumen(horas: int = 24, recientes: int = 10, job: Optional[str] = None) -> Dict[str, dict]:
+    """Por job en la ventana: conteo por estado, p50/p95/máx de duración y retraso, totales y últimas corridas."""
+    consulta = select(corridas).where(corridas.c.inicio >= datetime.utcnow() - timedelta(hours=horas))
+    if job:
+        consulta = consulta.where(corridas.c.job == job)
+    with shards.motor(shards.SHARD_PRIMARIO).connect() as conn:
+        filas = conn.execute(consulta.order_by(corridas.c.inicio.desc())).all()
+
+    por_job: Dict[str, list] = {}
+    for c in filas:
+        por_job.setdefault(c.job, []).append(c)
+
+    salida = {}
+    for nombre, lista in sorted(por_job.items()):
+        corridas_reales = [c for c in lista if c.estado in ("ok", "error")]
+        duraciones = [c.duracion_ms for c in corridas_reales if c.duracion_ms is not None]
+        retrasos = [c.retraso_ms for c in corridas_reales if c.retraso_ms is not None]
+        estados: Dict[str, int] = {}
+        for c in lista:
+            estados[c.estado] = estados.get(c.estado, 0) + 1
+        lags = [c.lag_pago_max_s for c in corridas_reales if c.lag_pago_max_s is not None]
+        salida[nombre] = {
+            "corridas": len(corridas_reales),
+            "estados": estados,
+            "duracion_ms": {"p50": _percentil(duraciones, 0.5), "p95": _percentil(duraciones, 0.95),
+                            "max": max(duraciones) if duraciones else None},
+            "retraso_ms": {"p50": _percentil(retrasos, 0.5), "p95": _percentil(retrasos, 0.95),
+                           "max": max(retrasos) if retrasos else None},
+            "totales": {
+                campo: sum(getattr(c, campo) for c in corridas_reales)
+                for campo in ("filas_revisadas", "pagos_ejecutados", "omitidos_presupuesto",
+                              "omitidos_saldo", "notificaciones", "errores")
+            },
+            "lag_pago_max_s": max(lags) if lags else None,
+            "recientes": [_fila(c) for c in lista[:recientes]],
+        }
+    return salida
@@ -0,0 +1,91 @@
+import math
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Annotated, List, Type
+
+from pydantic import BaseModel, BeforeValidator, PlainSerializer, WithJsonSchema
+from sqlalchemy import Integer, Numeric
+from sqlalchemy.sql import operators
+from sqlalchemy.types import TypeDecorator
+
+# Todo el dinero circula como int de centavos. Se convierte una sola vez en cada borde:
+#   - BD: columna Centavos (la tabla sigue siendo DECIMAL(p, 2); SUM/COALESCE/CASE heredan el tipo)
+#   - API: MontoEntrada (pesos del cliente -> centavos) y Monto (centavos -> pesos en el JSON)
+#   - textos para el usuario: formatear()
+
+# ===== Conversión =====
+def a_centavos(valor) -> int:
+    """Pesos (float, str, Decimal o int) a centavos exactos. Los float pasan por str: 10.1 -> 1010, no 1009."""
+    if isinstance(valor, bool) or valor is None:
+        raise TypeError("Monto inválido")
+    if isinstance(valor, int):
+        return valor * 100
+    try:
+        d = valor if isinstance(valor, Decimal) else Decimal(str(valor).strip())
+    except InvalidOperation:
+        raise ValueError("Monto inválido")
+    if not d.is_finite():
+        raise ValueError("Monto inválido")
+    return int((d * 100).to_integral_value(ROUND_HALF_UP))
+
+def a_pesos(centavos: int) -> float:
+    # int / 100 da el float más cercano al decimal exacto: 1010 -> 10.1
+    return centavos / 100
+
+def formatear(centavos: int) -> str:
+    """'1234.50' para mensajes y reportes (sin pasar por float)."""
+    signo = "-" if centavos < 0 else ""
+    pesos, resto = divmod(abs(centavos), 100)
+    return f"{signo}{pesos}.{resto:02d}"
+
+def porcentaje(parte: int, total: int) -> float:
+    return parte * 100 / total if total else 0.0
+
+# ===== Tipo de columna =====
+class Centavos(TypeDecorator):
+    """DECIMAL(precision, 2) en la BD, int de centavos en Python (filas, sumas y parámetros)."""
+
+    impl = Numeric
+    cache_ok = True
+
+    def __init__(self, precision: int = 10):
+        super().__init__(precision, 2)
+
+    def process_bind_param(self, valor, dialect):
+        if valor is None:
+            return None
+        if isinstance(valor, int):
+            return Decimal(valor).scaleb(-2)
+        raise TypeError(f"Se esperaban centavos (int), llegó {type(valor).__name__}")
+
+    def process_result_value(self, valor, dialect):
+        if valor is None:
+            return None
+        return int((Decimal(str(valor)) * 100).to_integral_value(ROUND_HALF_UP))
+
+    def coerce_compared_value(self, op, valor):
+        # `monto * 2` multiplica por 2, no por 2 centavos; sumas y comparaciones sí van en centavos
+        if op in (operators.mul, operators.truediv, operators.floordiv, operators.mod):
+            return Integer() if isinstance(valor, int) else Numeric()
+        return self
+
+# ===== Esquemas Pydantic =====
+MONTO_MAXIMO = 99_999_999_99   # DECIMAL(10, 2)
+
+def _validar_entrada(valor) -> int:
+    if isinstance(valor, float) and not math.isfinite(valor):
+        raise ValueError("Monto inválido")
+    centavos = a_centavos(valor)
+    if abs(centavos) > MONTO_MAXIMO:
+        raise ValueError("Monto fuera de rango")
+    return centavos
+
+_SALIDA = PlainSerializer(a_pesos, return_type=float)
+_ESQUEMA = WithJsonSchema({"type": "number"})
+
+# Lo que manda el cliente (pesos, con hasta 2 decimales) ya validado como centavos
+MontoEntrada = Annotated[int, BeforeValidator(_validar_entrada), _ESQUEMA]
+# Centavos que salen en el JSON como pesos
+Monto = Annotated[int, _SALIDA, _ESQUEMA]
+
+def campos_monto(esquema: Type[BaseModel]) -> List[str]:
+    return [nombre for nombre, campo in esquema.model_fields.items() if _SALIDA in campo.metadata]
@@ -0,0 +1,275 @@
+import json
+import multiprocessing
+import os
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.budget_model import Budget
+from app.models.categoria_model import Categoria
+from app.models.transaction_model import Transaction
+from app.models.user_model import User
+from app.utils import shards
+from app.utils.archivo import corte_archivo
+from app.utils.dinero import a_pesos, porcentaje
+from app.utils.periodos import inicio_mes, rango_mes_de
+
+ESTADOS_DIR = os.environ.get("ESTADOS_DIR", "estados_cuenta")
+ESTADOS_LOTE = int(os.environ.get("ESTADOS_LOTE", "500"))                    # usuarios por lote de consultas
+ESTADOS_PROCESOS = int(os.environ.get("ESTADOS_PROCESOS", str(os.cpu_count() or 2)))
+
+PREFIJO_PAGO_FIJO = "Pago fijo: "  # descripción con la que los pagos programados registran su egreso
+
+# Efecto de cada tipo en el saldo del titular y de la contraparte (solo transacciones completadas)
+SIGNO_TITULAR = {"ingreso": 1, "egreso": -1, "envio": -1, "solicitud": 1}
+SIGNO_DESTINATARIO = {"envio": 1, "solicitud": -1}
+
+# ===== Rutas =====
+def ruta_periodo(periodo: str) -> str:
+    return os.path.join(ESTADOS_DIR, periodo)
+
+def ruta_estado(periodo: str, id_usuario: int) -> str:
+    return os.path.join(ESTADOS_DIR, periodo, f"{id_usuario}.json")
+
+def _ruta_avance(periodo: str) -> str:
+    # Un checkpoint por shard: cada uno recorre sus propios ids
+    return os.path.join(ESTADOS_DIR, periodo, "_".join(["_avance", *shards.segmento()]) + ".json")
+
+def _escribir_atomico(ruta: str, datos: bytes):
+    tmp = ruta + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(datos)
+    os.replace(tmp, ruta)
+
+def leer_avance(periodo: str) -> dict:
+    try:
+        with open(_ruta_avance(periodo)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"ultimo_id": 0, "completo": False}
+
+def _guardar_avance(periodo: str, ultimo_id: int, completo: bool = False):
+    _escribir_atomico(_ruta_avance(periodo), json.dumps({
+        "ultimo_id": ultimo_id,
+        "completo": completo,
+        "actualizado": datetime.utcnow().isoformat(),
+    }).encode())
+
+# ===== Datos del lote: pocas consultas agrupadas para todos los usuarios del rango =====
+def _datos_lote(db: Session, ids: List[int], ini: datetime, fin: datetime, mes: date) -> Dict[int, dict]:
+    datos = {
+        u.id_usuario: {
+            "id_usuario": u.id_usuario, "nombre": u.nombre, "saldo_actual": u.saldo or 0,
+            "neto_mes": 0, "neto_despues": 0, "enviado": 0, "recibido": 0,   # centavos
+            "por_categoria": [], "pagos_fijos": [], "presupuestos": [],
+        }
+        for u in db.query(User.id_usuario, User.nombre, User.saldo).filter(User.id_usuario.in_(ids))
+    }
+    despues = case((Transaction.fecha >= fin, 1), else_=0)
+
+    # 1) Movimientos propios desde el inicio del mes, separando los del mes y los posteriores
+    #    (el saldo de cierre se reconstruye hacia atrás desde el saldo actual)
+    for uid, post, tipo, total in (
+        db.query(Transaction.id_usuario, despues, Transaction.tipo, func.sum(Transaction.monto))
+        .filter(Transaction.id_usuario.in_(ids), Transaction.fecha >= ini, Transaction.estado == "completada")
+        .group_by(Transaction.id_usuario, despues, Transaction.tipo)
+    ):
+        d = datos[uid]
+        d["neto_despues" if post else "neto_mes"] += SIGNO_TITULAR[tipo] * total
+        if not post and tipo == "envio":
+            d["enviado"] += total
+        if not post and tipo == "solicitud":
+            d["recibido"] += total
+
+    # 2) Envíos/solicitudes donde el usuario es la contraparte (pueden estar en el shard del otro)
+    with shards.todos(db) as todos:
+        for uid, post, tipo, total in (
+            todos.query(Transaction.destinatario_id, despues, Transaction.tipo, func.sum(Transaction.monto))
+            .filter(
+                Transaction.destinatario_id.in_(ids),
+                Transaction.tipo.in_(tuple(SIGNO_DESTINATARIO)),
+                Transaction.fecha >= ini,
+                Transaction.estado == "completada",
+            )
+            .group_by(Transaction.destinatario_id, despues, Transaction.tipo)
+        ):
+            d = datos[uid]
+            d["neto_despues" if post else "neto_mes"] += SIGNO_DESTINATARIO[tipo] * total
+            if not post and tipo == "envio":
+                d["recibido"] += total
+            if not post and tipo == "solicitud":
+                d["enviado"] += total
+
+    # 3) Totales por categoría del mes
+    for uid, tipo, cat_id, nombre, total, conteo in (
+        db.query(Transaction.id_usuario, Transaction.tipo, Transaction.categoria_id, Categoria.nombre,
+                 func.sum(Transaction.monto), func.count())
+        .outerjoin(Categoria, Categoria.id_categoria == Transaction.categoria_id)
+        .filter(
+            Transaction.id_usuario.in_(ids),
+            Transaction.tipo.in_(("ingreso", "egreso")),
+            Transaction.fecha >= ini, Transaction.fecha < fin,
+        )
+        .group_by(Transaction.id_usuario, Transaction.tipo, Transaction.categoria_id, Categoria.nombre)
+    ):
+        datos[uid]["por_categoria"].append((tipo, cat_id, nombre, total, conteo))
+
+    # 4) Cargos de pagos fijos ejecutados en el mes
+    for uid, id_tx, fecha, descripcion, monto in (
+        db.query(Transaction.id_usuario, Transaction.id_transaccion, Transaction.fecha,
+                 Transaction.descripcion, Transaction.monto)
+        .filter(
+            Transaction.id_usuario.in_(ids),
+            Transaction.tipo == "egreso",
+            Transaction.descripcion.like(PREFIJO_PAGO_FIJO + "%"),
+            Transaction.fecha >= ini, Transaction.fecha < fin,
+        )
+        .order_by(Transaction.id_usuario, Transaction.fecha)
+    ):
+        datos[uid]["pagos_fijos"].append((id_tx, fecha, descripcion[len(PREFIJO_PAGO_FIJO):], monto))
+
+    # 5) Presupuestos del mes (lo gastado sale de la consulta 3)
+    for uid, cat_id, nombre, monto_mensual in (
+        db.query(Budget.id_usuario, Budget.id_categoria, Categoria.nombre, Budget.monto_mensual)
+        .outerjoin(Categoria, Categoria.id_categoria == Budget.id_categoria)
+        .filter(Budget.id_usuario.in_(ids), Budget.mes == mes.month, Budget.año == mes.year)
+    ):
+        datos[uid]["presupuestos"].append((cat_id, nombre, monto_mensual))
+
+    return datos
+
+# ===== Render (en procesos hijos: sin BD, solo cálculo y escritura) =====
+def _renderizar(periodo: str, generado: str, d: dict) -> dict:
+    saldo_final = d["saldo_actual"] - d["neto_despues"]
+    saldo_inicial = saldo_final - d["neto_mes"]
+
+    por_categoria = {"ingresos": [], "egresos": []}
+    gastado = defaultdict(int)
+    totales = {"ingreso": 0, "egreso": 0}
+    for tipo, cat_id, nombre, total, conteo in d["por_categoria"]:
+        totales[tipo] += total
+        if tipo == "egreso":
+            gastado[cat_id] += total
+        por_categoria["ingresos" if tipo == "ingreso" else "egresos"].append({
+            "categoria_id": cat_id,
+            "categoria": nombre or "Sin categoría",
+            "total": a_pesos(total),
+            "conteo": int(conteo),
+        })
+    for lista in por_categoria.values():
+        lista.sort(key=lambda x: -x["total"])
+
+    presupuestos = []
+    for cat_id, nombre, monto_mensual in d["presupuestos"]:
+        usado = gastado.get(cat_id, 0)
+        monto = monto_mensual or 0
+        presupuestos.append({
+            "id_categoria": cat_id,
+            "categoria": nombre or "Sin categoría",
+            "monto_mensual": a_pesos(monto),
+            "gastado": a_pesos(usado),
+            "disponible": a_pesos(monto - usado),
+            "porcentaje": round(porcentaje(usado, monto), 1) if monto > 0 else None,
+        })
+
+    return {
+        "id_usuario": d["id_usuario"],
+        "nombre": d["nombre"],
+        "periodo": periodo,
+        "generado": generado,
+        "saldo_inicial": a_pesos(saldo_inicial),
+        "saldo_final": a_pesos(saldo_final),
+        "totales": {
+            "ingresos": a_pesos(totales["ingreso"]),
+            "egresos": a_pesos(totales["egreso"]),
+            "enviado": a_pesos(d["enviado"]),
+            "recibido": a_pesos(d["recibido"]),
+        },
+        "por_categoria": por_categoria,
+        "pagos_fijos": [
+            {"id_transaccion": i, "fecha": f.isoformat() if isinstance(f, datetime) else str(f),
+             "descripcion": desc, "monto": a_pesos(m)}
+            for i, f, desc, m in d["pagos_fijos"]
+        ],
+        "presupuestos": presupuestos,
+    }
+
+def _renderizar_lote(periodo: str, generado: str, lote: List[dict]) -> int:
+    for d in lote:
+        doc = _renderizar(periodo, generado, d)
+        _escribir_atomico(ruta_estado(periodo, d["id_usuario"]),
+                          json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    return len(lote)
+
+# ===== Orquestación =====
+def generar_estados(mes: date, procesos: int = ESTADOS_PROCESOS, lote: int = ESTADOS_LOTE) -> dict:
+    """
+    Genera el estado de cuenta de cada usuario para `mes`. El proceso principal hace las
+    consultas por lotes de ids y los hijos renderizan/escriben; el avance (último id con
+    archivos escritos, en orden) se guarda tras cada lote, así que un reinicio continúa ahí.
+    """
+    mes = inicio_mes(mes)
+    periodo = f"{mes:%Y-%m}"
+    ini, fin = rango_mes_de(mes)
+    os.makedirs(ruta_periodo(periodo), exist_ok=True)
+
+    avance = leer_avance(periodo)
+    if avance.get("completo"):
+        return {"periodo": periodo, "usuarios": 0, "completo": True}
+
+    db = SessionLocal()
+    generados = 0
+    ultimo = avance.get("ultimo_id", 0)
+    try:
+        corte = corte_archivo(db)
+        if corte and mes < corte:
+            raise ValueError(f"{periodo} ya está archivado; no hay detalle para reconstruir el saldo.")
+
+        generado = datetime.utcnow().isoformat()
+        pendientes = deque()  # (último id del lote, futuro), en orden de envío
+        contexto = multiprocessing.get_context("spawn")  # el job corre en un hilo del scheduler
+        with ProcessPoolExecutor(max_workers=max(1, procesos), mp_context=contexto) as pool:
+            while True:
+                ids = [r[0] for r in db.query(User.id_usuario)
+                       .filter(User.id_usuario > ultimo)
+                       .order_by(User.id_usuario)
+                       .limit(lote).all()]
+                if not ids:
+                    break
+                datos = _datos_lote(db, ids, ini, fin, mes)
+                db.rollback()  # no sostener la transacción de lectura entre lotes
+                pendientes.append((ids[-1], pool.submit(_renderizar_lote, periodo, generado, list(datos.values()))))
+                ultimo = ids[-1]
+
+                # Avanzar el checkpoint solo con lotes terminados en orden
+                while pendientes and (pendientes[0][1].done() or len(pendientes) > 2 * procesos):
+                    hasta_id, futuro = pendientes.popleft()
+                    generados += futuro.result()
+                    _guardar_avance(periodo, hasta_id)
+
+            while pendientes:
+                hasta_id, futuro = pendientes.popleft()
+                generados += futuro.result()
+                _guardar_avance(periodo, hasta_id)
+
+        _guardar_avance(periodo, ultimo, completo=True)
+        return {"periodo": periodo, "usuarios": generados, "completo": True}
+    finally:
+        db.close()
+
+def periodos_disponibles(id_usuario: int) -> List[str]:
+    if not os.path.isdir(ESTADOS_DIR):
+        return []
+    return sorted(
+        (p for p in os.listdir(ESTADOS_DIR) if os.path.isfile(ruta_estado(p, id_usuario))),
+        reverse=True,
+    )
+
+def mes_anterior(hoy: Optional[date] = None) -> date:
+    hoy = hoy or datetime.utcnow().date()
+    return inicio_mes(date.fromordinal(inicio_mes(hoy).toordinal() - 1))
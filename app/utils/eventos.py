@@ -0,0 +1,117 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from app.models.user_model import User
+from app.utils.dinero import a_pesos
+
+EVENTOS_COLA = int(os.environ.get("EVENTOS_COLA", "100"))            # eventos sin leer por conexión
+EVENTOS_LATIDO_S = float(os.environ.get("EVENTOS_LATIDO_S", "15"))   # comentario SSE para proxies/NAT
+
+# ===== Hub pub/sub en memoria del proceso =====
+# Los publicadores son hilos (threadpool de Starlette, scheduler, agrupador de escrituras) y los
+# suscriptores viven en el event loop: se cruza con call_soon_threadsafe. Solo llega a clientes
+# conectados a este mismo proceso/worker.
+
+class Suscripcion:
+    def __init__(self, id_usuario: int, loop: asyncio.AbstractEventLoop):
+        self.id_usuario = id_usuario
+        self.loop = loop
+        self.cola: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=EVENTOS_COLA)
+        self.descartados = 0
+
+    def _entregar(self, evento: dict):
+        # Cliente lento: se pierde el evento más viejo, no se bloquea al publicador ni crece la memoria
+        if self.cola.full():
+            self.cola.get_nowait()
+            self.descartados += 1
+        self.cola.put_nowait(evento)
+
+_suscripciones: Dict[int, Set[Suscripcion]] = {}
+_lock = threading.Lock()
+_secuencia = itertools.count(1)
+
+def suscribir(id_usuario: int) -> Suscripcion:
+    """Se llama desde el event loop (endpoint async)."""
+    s = Suscripcion(id_usuario, asyncio.get_running_loop())
+    with _lock:
+        _suscripciones.setdefault(id_usuario, set()).add(s)
+    return s
+
+def cancelar(s: Suscripcion):
+    with _lock:
+        activas = _suscripciones.get(s.id_usuario)
+        if activas is not None:
+            activas.discard(s)
+            if not activas:
+                del _suscripciones[s.id_usuario]
+
+def escuchando(id_usuario: int) -> bool:
+    """O(1) y sin candado: los publicadores lo usan para no armar eventos que nadie leerá."""
+    return id_usuario in _suscripciones
+
+def conexiones() -> int:
+    with _lock:
+        return sum(len(s) for s in _suscripciones.values())
+
+def publicar(id_usuario: int, tipo: str, datos: dict):
+    with _lock:
+        destinos = list(_suscripciones.get(id_usuario, ()))
+    if not destinos:
+        return
+    evento = {"id": next(_secuencia), "tipo": tipo, "datos": datos}
+    for s in destinos:
+        try:
+            s.loop.call_soon_threadsafe(s._entregar, evento)
+        except RuntimeError:
+            cancelar(s)  # loop cerrado (worker apagándose)
+
+# ===== Helpers para los caminos de escritura =====
+def transaccion_a_dict(t) -> dict:
+    if isinstance(t, dict):
+        return dict(t, monto=a_pesos(t["monto"]))
+    return {
+        "id_transaccion": t.id_transaccion,
+        "id_usuario": t.id_usuario,
+        "tipo": t.tipo,
+        "monto": a_pesos(t.monto),
+        "descripcion": t.descripcion,
+        "categoria_id": t.categoria_id,
+        "destinatario_id": t.destinatario_id,
+        "estado": t.estado,
+        "fecha": t.fecha,
+    }
+
+def notificar(db: Session, ids: Iterable[Optional[int]], tipo: str, datos: Optional[dict] = None):
+    """
+    Publica `tipo` a cada usuario de `ids` que tenga una conexión abierta, con su saldo ya
+    confirmado. Llamar después del commit. Sin oyentes no hace ninguna consulta; nunca lanza.
+    """
+    try:
+        oyentes = [i for i in set(ids) if i is not None and escuchando(i)]
+        if not oyentes:
+            return
+        saldos = dict(db.query(User.id_usuario, User.saldo).filter(User.id_usuario.in_(oyentes)).all())
+        for uid in oyentes:
+            publicar(uid, tipo, dict(datos or {}, saldo=a_pesos(saldos.get(uid) or 0)))
+    except Exception as e:
+        print(f"[Eventos] No se pudo publicar '{tipo}': {e}")
+
+# ===== Formato SSE =====
+def _por_defecto(valor: Any):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+def formatear_sse(evento: dict) -> str:
+    datos = json.dumps(evento["datos"], default=_por_defecto, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {datos}\n\n"
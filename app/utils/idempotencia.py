@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.database import SessionLocal
+from app.models.idempotencia_model import ClaveIdempotencia
+from app.utils.contexto import leer_cuerpo
+
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", str(24 * 3600)))   # segundos que se guarda la respuesta
+IDEMPOTENCY_LEASE = int(os.environ.get("IDEMPOTENCY_LEASE", "60"))         # se renueva mientras corre; vence si el worker muere
+
+RUTAS_IDEMPOTENTES = {
+    "/transacciones/ingreso",
+    "/transacciones/egreso",
+    "/pagos/ejecutar",
+    "/transferencias",
+}
+
+# (huella, status_code, content_type, cuerpo)
+Resultado = Tuple[str, int, Optional[str], bytes]
+
+# ===== Almacén en BD: compartido entre workers =====
+class ClaveOcupada(Exception):
+    """No se pudo reservar ni leer la clave tras varios intentos (carrera con otros workers)."""
+
+def _reservar(clave: str, huella: str, dueno: str):
+    """
+    Intenta apartar la clave para `dueno`. Devuelve None si quedó reservada para este request;
+    si ya existía, devuelve (huella, estado, status_code, content_type, cuerpo). Si tras los
+    reintentos no hay ni reserva ni fila que leer, lanza ClaveOcupada: nunca se ejecuta sin reserva.
+    """
+    db = SessionLocal()
+    try:
+        for _ in range(3):
+            ahora = datetime.utcnow()
+            db.add(ClaveIdempotencia(
+                clave=clave, huella=huella, estado="en_proceso", dueno=dueno,
+                creada=ahora, expira=ahora + timedelta(seconds=IDEMPOTENCY_LEASE),
+            ))
+            try:
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+
+            fila = db.query(ClaveIdempotencia).filter(ClaveIdempotencia.clave == clave).first()
+            if fila is None:
+                continue
+            if fila.expira < ahora:
+                # Lease vencido = su dueño dejó de renovarlo (el worker murió). Se borra solo esa
+                # fila exacta: si otro worker ya la reemplazó, este DELETE no toca la nueva
+                db.query(ClaveIdempotencia).filter(
+                    ClaveIdempotencia.clave == clave,
+                    ClaveIdempotencia.expira == fila.expira,
+                    ClaveIdempotencia.estado == fila.estado,
+                ).delete(synchronize_session=False)
+                db.commit()
+                continue
+            return fila.huella, fila.estado, fila.status_code, fila.content_type, fila.cuerpo
+        raise ClaveOcupada(clave)
+    finally:
+        db.close()
+
+def _renovar(clave: str, dueno: str) -> bool:
+    """Extiende el lease mientras el request sigue corriendo. False si la fila ya no es de este dueño."""
+    db = SessionLocal()
+    try:
+        renovadas = db.query(ClaveIdempotencia).filter(
+            ClaveIdempotencia.clave == clave,
+            ClaveIdempotencia.dueno == dueno,
+            ClaveIdempotencia.estado == "en_proceso",
+        ).update({ClaveIdempotencia.expira: datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_LEASE)},
+                 synchronize_session=False)
+        db.commit()
+        return renovadas == 1
+    finally:
+        db.close()
+
+def _guardar(clave: str, dueno: str, status_code: int, content_type: Optional[str], cuerpo: bytes):
+    db = SessionLocal()
+    try:
+        fila = db.query(ClaveIdempotencia).filter(
+            ClaveIdempotencia.clave == clave,
+            ClaveIdempotencia.dueno == dueno,
+        ).first()
+        if fila is None:
+            print(f"[Idempotencia] La reserva de {clave} ya no es de este request; no se guarda la respuesta")
+            return
+        # Los 5xx no se guardan: el cliente puede reintentar de verdad
+        if status_code >= 500:
+            db.delete(fila)
+        else:
+            fila.estado = "completada"
+            fila.status_code = status_code
+            fila.content_type = content_type
+            fila.cuerpo = cuerpo
+            fila.expira = datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_TTL)
+        db.commit()
+    finally:
+        db.close()
+
+def _liberar(clave: str, dueno: str):
+    db = SessionLocal()
+    try:
+        db.query(ClaveIdempotencia).filter(
+            ClaveIdempotencia.clave == clave,
+            ClaveIdempotencia.dueno == dueno,
+            ClaveIdempotencia.estado == "en_proceso",
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def purgar_expiradas() -> int:
+    db = SessionLocal()
+    try:
+        borradas = db.query(ClaveIdempotencia).filter(
+            ClaveIdempotencia.expira < datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+        return borradas
+    finally:
+        db.close()
+
+# ===== Middleware =====
+class IdempotenciaMiddleware:
+    """
+    Header `Idempotency-Key` en los POST que mueven dinero. Un reintento con la misma clave
+    y el mismo cuerpo recibe la respuesta original (header `Idempotent-Replayed: true`);
+    los duplicados concurrentes del mismo proceso esperan a la ejecución en vuelo.
+    """
+
+    def __init__(self, app: ASGIApp, rutas=RUTAS_IDEMPOTENTES):
+        self.app = app
+        self.rutas = set(rutas)
+        self._en_vuelo: Dict[str, asyncio.Future] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.rutas:
+            return await self.app(scope, receive, send)
+
+        llave = dict(scope["headers"]).get(b"idempotency-key")
+        if not llave:
+            return await self.app(scope, receive, send)
+
+        receive, cuerpo = await leer_cuerpo(receive)
+        # La clave es por usuario: dos clientes que mandan la misma Idempotency-Key a la misma
+        # ruta no deben recibir la respuesta (movimiento y saldo) del otro
+        try:
+            id_usuario = json.loads(cuerpo).get("id_usuario")
+        except (ValueError, AttributeError):
+            id_usuario = None
+        quien = f"u:{str(id_usuario)[:20]}" if id_usuario is not None else "-"
+        clave = f"{scope['path']}|{quien}|{llave.decode('latin-1')[:200]}"
+        huella = hashlib.sha256(
+            b"\n".join([b"POST", scope["path"].encode(), scope.get("query_string", b""), cuerpo])
+        ).hexdigest()
+
+        # 1) Duplicado concurrente en este proceso: colgarse de la ejecución en vuelo
+        while clave in self._en_vuelo:
+            resultado = await asyncio.shield(self._en_vuelo[clave])
+            if resultado is not None:
+                return await self._reproducir(resultado, huella, scope, receive, send)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_vuelo[clave] = futuro
+        resultado: Optional[Resultado] = None
+        dueno = uuid.uuid4().hex
+        renovacion: Optional[asyncio.Task] = None
+        try:
+            # 2) Duplicado en otro worker o reintento posterior: lo dice la BD
+            try:
+                existente = await run_in_threadpool(_reservar, clave, huella, dueno)
+            except ClaveOcupada:
+                return await JSONResponse(
+                    {"detail": "No se pudo reservar la Idempotency-Key; reintenta."},
+                    status_code=503,
+                    headers={"Retry-After": "1"},
+                )(scope, receive, send)
+            if existente is not None:
+                huella_previa, estado, status_code, content_type, guardado = existente
+                if huella_previa != huella:
+                    return await self._conflicto_huella(scope, receive, send)
+                if estado == "en_proceso":
+                    return await JSONResponse(
+                        {"detail": "Una petición con esta Idempotency-Key sigue en proceso."},
+                        status_code=409,
+                        headers={"Retry-After": "1"},
+                    )(scope, receive, send)
+                resultado = (huella_previa, status_code, content_type, guardado or b"")
+                return await self._reproducir(resultado, huella, scope, receive, send)
+
+            # 3) Primera vez: ejecutar (renovando el lease mientras tanto) y capturar la respuesta
+            renovacion = asyncio.create_task(self._renovar_mientras_corre(clave, dueno))
+            resultado = await self._ejecutar(scope, receive, send, huella)
+            renovacion.cancel()
+            await run_in_threadpool(_guardar, clave, dueno, resultado[1], resultado[2], resultado[3])
+            if resultado[1] >= 500:
+                resultado = None
+        except BaseException:
+            resultado = None
+            await run_in_threadpool(_liberar, clave, dueno)
+            raise
+        finally:
+            if renovacion is not None:
+                renovacion.cancel()
+            self._en_vuelo.pop(clave, None)
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+    @staticmethod
+    async def _renovar_mientras_corre(clave: str, dueno: str):
+        """El lease solo vence si el worker muere: un request lento no deja que otro lo repita."""
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_LEASE / 3)
+            try:
+                if not await run_in_threadpool(_renovar, clave, dueno):
+                    print(f"[Idempotencia] Se perdió la reserva de {clave} a mitad del request")
+                    return
+            except Exception as e:  # un fallo puntual de la BD: se reintenta en la próxima vuelta
+                print(f"[Idempotencia] No se pudo renovar {clave}: {e}")
+
+    async def _ejecutar(self, scope: Scope, receive: Receive, send: Send, huella: str) -> Resultado:
+        inicio: dict = {}
+        partes = []
+
+        async def send_capturando(msg):
+            if msg["type"] == "http.response.start":
+                inicio.update(msg)
+            elif msg["type"] == "http.response.body":
+                partes.append(msg.get("body", b""))
+            await send(msg)
+
+        await self.app(scope, receive, send_capturando)
+        headers = dict(inicio.get("headers", []))
+        content_type = headers.get(b"content-type")
+        return (
+            huella,
+            inicio.get("status", 500),
+            content_type.decode("latin-1") if content_type else None,
+            b"".join(partes),
+        )
+
+    async def _reproducir(self, resultado: Resultado, huella: str, scope: Scope, receive: Receive, send: Send):
+        huella_previa, status_code, content_type, cuerpo = resultado
+        if huella_previa != huella:
+            return await self._conflicto_huella(scope, receive, send)
+        respuesta = Response(
+            content=cuerpo,
+            status_code=status_code,
+            media_type=content_type,
+            headers={"Idempotent-Replayed": "true"},
+        )
+        await respuesta(scope, receive, send)
+
+    async def _conflicto_huella(self, scope: Scope, receive: Receive, send: Send):
+        await JSONResponse(
+            {"detail": "Idempotency-Key ya usada con una petición distinta."},
+            status_code=422,
+        )(scope, receive, send)
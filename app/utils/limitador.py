@@ -0,0 +1,169 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.utils.contexto import leer_cuerpo, resolver_ruta
+
+# Presupuesto por usuario (todas las rutas) y por usuario+ruta, en "tokens"
+RATE_LIMIT_CAPACIDAD = float(os.environ.get("RATE_LIMIT_CAPACIDAD", "60"))
+RATE_LIMIT_RECARGA = float(os.environ.get("RATE_LIMIT_RECARGA", "1"))             # tokens por segundo
+RATE_LIMIT_RUTA_CAPACIDAD = float(os.environ.get("RATE_LIMIT_RUTA_CAPACIDAD", "20"))
+RATE_LIMIT_RUTA_RECARGA = float(os.environ.get("RATE_LIMIT_RUTA_RECARGA", "0.5"))
+RATE_LIMIT_MAX_LLAVES = int(os.environ.get("RATE_LIMIT_MAX_LLAVES", "100000"))
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL")                       # backend compartido opcional
+
+# Saturación del pool de BD (conexiones en uso / máximo) a partir de la cual se recorta carga
+SHED_COSTOSAS = float(os.environ.get("SHED_COSTOSAS", "0.75"))
+SHED_TODAS = float(os.environ.get("SHED_TODAS", "0.95"))
+
+# Costo en tokens por ruta (el resto cuesta 1)
+PESOS_RUTA: Dict[str, float] = {
+    "GET /estadisticas/dashboard": 5,
+    "GET /estadisticas/anual": 5,
+    "GET /estadisticas/serie": 3,
+    "POST /pagos/ejecutar": 10,
+    "GET /presupuestos/verificar-alertas": 5,
+    "GET /busqueda/autocompletar": 0.25,   # una por tecla, servida de memoria
+}
+RUTAS_EXENTAS = {"/health", "/docs", "/redoc", "/openapi.json"}
+
+# ===== Backends =====
+class BucketsLocales:
+    """Token buckets en memoria del proceso (LRU para no crecer sin límite)."""
+
+    def __init__(self, max_llaves: int = RATE_LIMIT_MAX_LLAVES):
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max = max_llaves
+
+    def consumir(self, clave: str, capacidad: float, recarga: float, costo: float) -> Tuple[bool, float]:
+        ahora = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.pop(clave, (capacidad, ahora))
+            tokens = min(capacidad, tokens + (ahora - ts) * recarga)
+            ok = tokens >= costo
+            if ok:
+                tokens -= costo
+            self._buckets[clave] = (tokens, ahora)
+            if len(self._buckets) > self._max:
+                self._buckets.popitem(last=False)
+        return ok, 0.0 if ok else (costo - tokens) / recarga
+
+_LUA_BUCKET = """
+local cap = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local b = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(b[1]) or cap
+local ts = tonumber(b[2]) or now
+tokens = math.min(cap, tokens + math.max(0, now - ts) * rate)
+local ok = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  ok = 1
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(cap / rate) + 1)
+return {ok, tostring(tokens)}
+"""
+
+class BucketsRedis:
+    """Mismo algoritmo en Redis (script Lua atómico) para compartir límites entre workers."""
+
+    def __init__(self, url: str):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._script = self._redis.register_script(_LUA_BUCKET)
+
+    def consumir(self, clave: str, capacidad: float, recarga: float, costo: float) -> Tuple[bool, float]:
+        ok, tokens = self._script(keys=[f"rl:{clave}"], args=[capacidad, recarga, time.time(), costo])
+        tokens = float(tokens)
+        return bool(ok), 0.0 if ok else (costo - tokens) / recarga
+
+def crear_backend():
+    if RATE_LIMIT_REDIS_URL:
+        try:
+            return BucketsRedis(RATE_LIMIT_REDIS_URL)
+        except Exception as e:
+            print(f"[RateLimit] Redis no disponible ({e}), se usan buckets locales.")
+    return BucketsLocales()
+
+# ===== Saturación del pool =====
+def saturacion_pool(engine) -> float:
+    pool = engine.pool
+    try:
+        maximo = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+        return pool.checkedout() / maximo if maximo > 0 else 0.0
+    except (AttributeError, TypeError):
+        return 0.0  # pools sin contadores (p. ej. SQLite en memoria)
+
+# ===== Middleware =====
+def _identidad(request: Request, path_params: dict, cuerpo: bytes = b"") -> str:
+    id_usuario = path_params.get("id_usuario") or request.query_params.get("id_usuario")
+    if not id_usuario and cuerpo:
+        try:
+            id_usuario = json.loads(cuerpo).get("id_usuario")
+        except (ValueError, AttributeError):
+            pass
+    if id_usuario:
+        return f"u:{id_usuario}"
+    return f"ip:{request.client.host if request.client else 'desconocido'}"
+
+class LimitadorMiddleware:
+    """
+    Token bucket por usuario y por usuario+ruta, con pesos para las rutas costosas.
+    Si el pool de BD se satura, recorta primero las rutas costosas (503) y luego todas.
+    """
+
+    def __init__(self, app: ASGIApp, engine=None, backend=None):
+        self.app = app
+        self.engine = engine
+        self.backend = backend or crear_backend()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in RUTAS_EXENTAS or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        ruta, path_params = resolver_ruta(request)
+        nombre = f"{scope['method']} {ruta}"
+        costo = PESOS_RUTA.get(nombre, 1)
+
+        # 1) Recorte de carga por saturación del pool (antes de gastar una conexión)
+        if self.engine is not None:
+            saturacion = saturacion_pool(self.engine)
+            if saturacion >= SHED_TODAS or (costo > 1 and saturacion >= SHED_COSTOSAS):
+                return await self._rechazar(503, "Servicio saturado, intenta de nuevo en unos segundos.", 2,
+                                            scope, receive, send)
+
+        # 2) Presupuesto por usuario+ruta y por usuario. En los POST de movimientos, transferencias y
+        # solicitudes el id_usuario viene en el cuerpo JSON; sin leerlo caerían en el bucket de la IP
+        cuerpo = b""
+        if (scope["method"] in ("POST", "PUT", "PATCH") and "id_usuario" not in path_params
+                and "id_usuario" not in request.query_params):
+            receive, cuerpo = await leer_cuerpo(receive)
+        quien = _identidad(request, path_params, cuerpo)
+        ok, espera = self.backend.consumir(f"{quien}|{nombre}", RATE_LIMIT_RUTA_CAPACIDAD, RATE_LIMIT_RUTA_RECARGA, costo)
+        if ok:
+            ok, espera = self.backend.consumir(quien, RATE_LIMIT_CAPACIDAD, RATE_LIMIT_RECARGA, costo)
+        if not ok:
+            return await self._rechazar(429, "Demasiadas solicitudes.", espera, scope, receive, send)
+
+        await self.app(scope, receive, send)
+
+    async def _rechazar(self, status: int, detalle: str, espera: float, scope: Scope, receive: Receive, send: Send):
+        respuesta = JSONResponse(
+            {"detail": detalle},
+            status_code=status,
+            headers={"Retry-After": str(max(1, math.ceil(espera)))},
+        )
+        await respuesta(scope, receive, send)
@@ -1,14 +1,109 @@
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
+from typing import List, Optional, Tuple
+
+from app.utils.circuito import Circuito
+from app.utils.dinero import formatear
 
 EMAIL_ORIGEN = os.environ.get("EMAIL_ORIGEN")            
 EMAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD")        
 SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT_CONEXION = float(os.environ.get("SMTP_TIMEOUT_CONEXION", "5"))   # TCP + saludo + TLS + login
+SMTP_TIMEOUT_ENVIO = float(os.environ.get("SMTP_TIMEOUT_ENVIO", "10"))        # cada respuesta del envío
+SMTP_REUSO_S = float(os.environ.get("SMTP_REUSO_S", "60"))                    # conexión ociosa más tiempo: se renueva
+SMTP_POOL = int(os.environ.get("SMTP_POOL", "4"))                             # sesiones simultáneas con el proveedor
+SMTP_ESPERA_POOL = float(os.environ.get("SMTP_ESPERA_POOL", "2"))             # espera máxima por una sesión libre
+SMTP_CIRCUITO_FALLOS = int(os.environ.get("SMTP_CIRCUITO_FALLOS", "5"))
+SMTP_CIRCUITO_ESPERA_S = float(os.environ.get("SMTP_CIRCUITO_ESPERA_S", "60"))
+
+circuito_smtp = Circuito("smtp", SMTP_CIRCUITO_FALLOS, SMTP_CIRCUITO_ESPERA_S)
+
+class SmtpEnPausa(Exception):
+    """El circuito se abrió mientras se esperaba una sesión: el correo no se intenta."""
+
+# ===== Pool de sesiones SMTP =====
+# Sesiones autenticadas que comparten los hilos (cron, cola de alertas, requests): evitan
+# TCP + STARTTLS + login por correo. A lo más SMTP_POOL envíos a la vez; el resto espera una
+# sesión libre hasta SMTP_ESPERA_POOL, así un proveedor colgado no encola a todos detrás de él.
+_libres: List[Tuple[smtplib.SMTP, float]] = []   # (sesión, último uso); se toma la más reciente
+_libres_lock = threading.Lock()
+_cupos = threading.BoundedSemaphore(max(1, SMTP_POOL))
+
+def _conectar() -> smtplib.SMTP:
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT_CONEXION)
+    try:
+        if SMTP_STARTTLS:
+            server.starttls()
+        if EMAIL_PASSWORD:
+            server.login(EMAIL_ORIGEN, EMAIL_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    server.sock.settimeout(SMTP_TIMEOUT_ENVIO)
+    return server
+
+def _cerrar(smtp: smtplib.SMTP):
+    try:
+        smtp.close()
+    except OSError:
+        pass
+
+def _tomar() -> Optional[smtplib.SMTP]:
+    while True:
+        with _libres_lock:
+            if not _libres:
+                return None
+            smtp, usado = _libres.pop()
+        if time.monotonic() - usado <= SMTP_REUSO_S:
+            return smtp
+        _cerrar(smtp)  # el servidor probablemente ya la cerró por inactividad
+
+def _devolver(smtp: smtplib.SMTP):
+    with _libres_lock:
+        _libres.append((smtp, time.monotonic()))
+
+def _enviar(destinatario: str, texto: str):
+    if not _cupos.acquire(timeout=SMTP_ESPERA_POOL):
+        raise TimeoutError(f"ninguna de las {SMTP_POOL} sesiones SMTP se liberó en {SMTP_ESPERA_POOL:g}s")
+    try:
+        # Mientras se esperaba, los envíos en curso pudieron abrir el circuito: no sumarse a ellos
+        if circuito_smtp.abierto():
+            raise SmtpEnPausa()
+        for intento in (1, 2):
+            smtp = _tomar() if intento == 1 else None
+            reusada = smtp is not None
+            try:
+                if smtp is None:
+                    smtp = _conectar()
+                smtp.sendmail(EMAIL_ORIGEN, destinatario, texto)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError):
+                _devolver(smtp)  # rechazo del mensaje (sendmail ya hizo RSET): la sesión sigue sana
+                raise
+            except Exception as e:
+                if smtp is not None:
+                    _cerrar(smtp)  # timeout o estado desconocido: no reutilizar
+                # La sesión reutilizada estaba muerta: un solo reintento con una nueva. smtplib envuelve
+                # el timeout de lectura en SMTPServerDisconnected: eso no es una conexión muerta sino
+                # un servidor lento, y reintentar duplicaría la espera
+                if (reusada and isinstance(e, (smtplib.SMTPServerDisconnected, ConnectionError))
+                        and not isinstance(e.__context__, TimeoutError)):
+                    continue
+                raise
+            _devolver(smtp)
+            return
+    finally:
+        _cupos.release()
 
 def enviar_correo(destinatario: str, asunto: str, mensaje: str, es_html: bool = False) -> bool:
+    if not circuito_smtp.permitir():
+        print(f"[Correo] SMTP en pausa tras fallos repetidos; no se envía a {destinatario}")
+        return False
     try:
         msg = MIMEMultipart()
         msg['From'] = EMAIL_ORIGEN
@@ -18,32 +113,43 @@ def enviar_correo(destinatario: str, asunto: str, mensaje: str, es_html: bool =
         cuerpo = MIMEText(mensaje, 'html' if es_html else 'plain')
         msg.attach(cuerpo)
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_ORIGEN, EMAIL_PASSWORD)
-            server.sendmail(EMAIL_ORIGEN, destinatario, msg.as_string())
+        _enviar(destinatario, msg.as_string())
+        circuito_smtp.exito()
 
         print(f"[✅] Correo enviado a {destinatario}")
         return True
 
+    except SmtpEnPausa:
+        print(f"[Correo] SMTP en pausa tras fallos repetidos; no se envía a {destinatario}")
+        return False
+
+    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as e:
+        # El servidor respondió: falla este mensaje, no el proveedor
+        circuito_smtp.exito()
+        print(f"[❌] Correo rechazado para {destinatario}: {e}")
+        return False
+
     except smtplib.SMTPAuthenticationError:
+        circuito_smtp.fallo()
         print("[❌] Error de autenticación: verifica tu contraseña de aplicación.")
         return False
 
     except smtplib.SMTPConnectError:
+        circuito_smtp.fallo()
         print("[❌] Error de conexión con el servidor SMTP.")
         return False
 
     except Exception as e:
+        circuito_smtp.fallo()
         print(f"[❌] Error inesperado: {e}")
         return False
 
-def enviar_alerta_presupuesto(correo: str, categoria: str, monto_gastado: float, porcentaje: float):
+def enviar_alerta_presupuesto(correo: str, categoria: str, monto_gastado: int, porcentaje: float):
     asunto = "⚠️ Alerta de Presupuesto Excedido"
     mensaje = f"""
     Hola,<br><br>
     Has superado el presupuesto mensual para la categoría <strong>{categoria}</strong>.<br>
-    Total gastado: <strong>${monto_gastado:.2f}</strong><br>
+    Total gastado: <strong>${formatear(monto_gastado)}</strong><br>
     Porcentaje: <strong>{porcentaje:.1f}%</strong><br><br>
     Revisa tus gastos para evitar sobrepasar tu límite.
     """
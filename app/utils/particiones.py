@@ -0,0 +1,115 @@
+import os
+import re
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.utils.periodos import inicio_dia, inicio_mes, mes_siguiente
+
+# Meses futuros que deben tener su partición creada de antemano
+PARTICIONES_ADELANTE = int(os.environ.get("PARTICIONES_ADELANTE", "3"))
+
+TABLA = "transacciones"
+_RE_LIMITE = re.compile(r"'(\d{4})-(\d{2})-(\d{2})")
+
+def nombre_particion(mes: date) -> str:
+    return f"p{mes:%Y%m}"
+
+# ===== Estado de las particiones (solo MySQL; en SQLite la tabla no se particiona) =====
+def particiones(engine: Engine) -> List[dict]:
+    """
+    Particiones de `transacciones` en orden: nombre, límite superior exclusivo (None = MAXVALUE)
+    y filas estimadas. Lista vacía si el motor no es MySQL o la tabla no está particionada.
+    """
+    if engine.dialect.name != "mysql":
+        return []
+    with engine.connect() as conn:
+        filas = conn.execute(text(
+            "SELECT partition_name, partition_description, table_rows "
+            "FROM information_schema.partitions "
+            "WHERE table_schema = DATABASE() AND table_name = :t AND partition_name IS NOT NULL "
+            "ORDER BY partition_ordinal_position"
+        ), {"t": TABLA}).all()
+    resultado = []
+    for nombre, descripcion, filas_est in filas:
+        m = _RE_LIMITE.search(descripcion or "")
+        resultado.append({
+            "nombre": nombre,
+            "hasta": date(int(m.group(1)), int(m.group(2)), int(m.group(3))) if m else None,
+            "filas": int(filas_est or 0),
+        })
+    return resultado
+
+def asegurar_particiones(engine: Engine, hoy: Optional[date] = None) -> List[str]:
+    """
+    Parte `pmax` en particiones mensuales hasta PARTICIONES_ADELANTE meses después de hoy.
+    Idempotente: si ya existen no hace nada. Devuelve los nombres creados.
+    """
+    actuales = particiones(engine)
+    if not actuales or actuales[-1]["hasta"] is not None:
+        return []  # sin particionar, o sin pmax que partir
+    limites = [p["hasta"] for p in actuales if p["hasta"] is not None]
+    if not limites:
+        return []
+
+    objetivo = inicio_mes(hoy or datetime.utcnow().date())
+    for _ in range(PARTICIONES_ADELANTE + 1):
+        objetivo = mes_siguiente(objetivo)
+
+    nuevas = []
+    mes = max(limites)
+    while mes < objetivo:
+        nuevas.append(mes)
+        mes = mes_siguiente(mes)
+    if not nuevas:
+        return []
+
+    definiciones = ", ".join(
+        f"PARTITION {nombre_particion(m)} VALUES LESS THAN ('{mes_siguiente(m).isoformat()}')" for m in nuevas
+    )
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"ALTER TABLE {TABLA} REORGANIZE PARTITION pmax INTO "
+            f"({definiciones}, PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+        ))
+    creadas = [nombre_particion(m) for m in nuevas]
+    print(f"[Particiones] Creadas: {', '.join(creadas)}")
+    return creadas
+
+def eliminar_particion_mes(engine: Engine, mes: date) -> bool:
+    """
+    DROP PARTITION del mes si tiene partición propia (instantáneo, sin DELETE fila por fila).
+    Devuelve False si no existe (p. ej. meses dentro de p_hist): el llamador borra por rango.
+    """
+    nombre = nombre_particion(mes)
+    if not any(p["nombre"] == nombre for p in particiones(engine)):
+        return False
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {TABLA} DROP PARTITION {nombre}"))
+    print(f"[Particiones] Eliminada {nombre}")
+    return True
+
+# ===== Verificación de poda =====
+def verificar_poda(engine: Engine, desde: date, hasta: date) -> Optional[dict]:
+    """
+    EXPLAIN de una consulta típica de estadísticas (usuario + rango de fecha semiabierto) para
+    comprobar que MySQL solo toca las particiones del rango. None si la tabla no está particionada.
+    """
+    todas = particiones(engine)
+    if not todas:
+        return None
+    with engine.connect() as conn:
+        fila = conn.execute(text(
+            f"EXPLAIN SELECT SUM(monto) FROM {TABLA} WHERE id_usuario = 0 AND fecha >= :desde AND fecha < :hasta"
+        ), {"desde": inicio_dia(desde), "hasta": inicio_dia(hasta)}
+        ).mappings().first()
+    usadas = [p for p in (fila.get("partitions") or "").split(",") if p]
+    return {
+        "desde": str(desde),
+        "hasta": str(hasta),
+        "particiones_usadas": usadas,
+        "total_particiones": len(todas),
+        "ok": 0 < len(usadas) < len(todas),
+    }
@@ -0,0 +1,433 @@
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.contexto import leer_cuerpo, resolver_ruta
+
+PERFIL_DIR = os.environ.get("PERFIL_DIR", "perfiles")
+PERFIL_INTERVALO_MS = float(os.environ.get("PERFIL_INTERVALO_MS", "5"))       # cada cuánto se toma una muestra de pila
+PERFIL_MAX_SIMULTANEOS = int(os.environ.get("PERFIL_MAX_SIMULTANEOS", "2"))   # requests perfilados a la vez por worker
+PERFIL_MAX_ARCHIVOS = int(os.environ.get("PERFIL_MAX_ARCHIVOS", "200"))       # se borran los más viejos
+PERFIL_MAX_SQL = int(os.environ.get("PERFIL_MAX_SQL", "2000"))                # sentencias en la línea de tiempo
+PERFIL_PROFUNDIDAD = int(os.environ.get("PERFIL_PROFUNDIDAD", "80"))          # marcos por pila (los más internos)
+PERFIL_RECARGA_S = float(os.environ.get("PERFIL_RECARGA_S", "5"))             # relectura de _muestreo.json
+DIAGNOSTICO_TOKEN = os.environ.get("DIAGNOSTICO_TOKEN")
+
+HEADER_PERFILAR = b"x-perfilar"
+_RE_ID = re.compile(r"^\d{8}T\d{6}-[0-9a-f]{8}$")
+
+def _parsear_rutas(texto: str) -> Dict[str, float]:
+    """'GET /estadisticas/dashboard=0.05,POST /transacciones/egreso=1' -> {ruta: fracción}."""
+    rutas = {}
+    for parte in texto.split(","):
+        ruta, _, tasa = parte.strip().rpartition("=")
+        if ruta:
+            rutas[ruta.strip()] = float(tasa)
+    return rutas
+
+# Muestreo por defecto (sin _muestreo.json vigente): rutas y, opcionalmente, solo ciertos usuarios
+PERFIL_RUTAS = _parsear_rutas(os.environ.get("PERFIL_RUTAS", ""))
+PERFIL_USUARIOS = {int(x) for x in os.environ.get("PERFIL_USUARIOS", "").split(",") if x.strip()}
+
+# ===== Muestreo ajustable en caliente =====
+# PUT /diagnostico/perfiles/muestreo escribe PERFIL_DIR/_muestreo.json con vencimiento; cada
+# worker lo relee cada PERFIL_RECARGA_S, así se activa sin redeploy ni reinicio.
+_muestreo = {"leido": 0.0, "mtime": None, "rutas": PERFIL_RUTAS, "usuarios": PERFIL_USUARIOS, "expira": None}
+
+def _ruta_muestreo() -> str:
+    return os.path.join(PERFIL_DIR, "_muestreo.json")
+
+def muestreo_vigente() -> Tuple[Dict[str, float], Set[int]]:
+    ahora = time.monotonic()
+    if ahora - _muestreo["leido"] >= PERFIL_RECARGA_S:
+        _muestreo["leido"] = ahora
+        try:
+            mtime = os.path.getmtime(_ruta_muestreo())
+        except OSError:
+            mtime = None
+        if mtime != _muestreo["mtime"]:
+            _muestreo["mtime"] = mtime
+            _muestreo.update(rutas=PERFIL_RUTAS, usuarios=PERFIL_USUARIOS, expira=None)
+            if mtime is not None:
+                try:
+                    with open(_ruta_muestreo(), encoding="utf-8") as f:
+                        datos = json.load(f)
+                    _muestreo.update(rutas=datos["rutas"], usuarios=set(datos["usuarios"]),
+                                     expira=datetime.fromisoformat(datos["expira"]))
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"[Perfilador] _muestreo.json ilegible, se usa PERFIL_RUTAS: {e}")
+    if _muestreo["expira"] is not None and datetime.utcnow() >= _muestreo["expira"]:
+        return PERFIL_RUTAS, PERFIL_USUARIOS
+    return _muestreo["rutas"], _muestreo["usuarios"]
+
+def estado_muestreo() -> dict:
+    rutas, usuarios = muestreo_vigente()
+    expira = _muestreo["expira"] if rutas is _muestreo["rutas"] else None
+    return {"rutas": rutas, "usuarios": sorted(usuarios), "expira": expira}
+
+def fijar_muestreo(rutas: Dict[str, float], usuarios: List[int], minutos: int) -> dict:
+    datos = {
+        "rutas": rutas,
+        "usuarios": sorted(set(usuarios)),
+        "expira": (datetime.utcnow() + timedelta(minutes=minutos)).isoformat(timespec="seconds"),
+    }
+    os.makedirs(PERFIL_DIR, exist_ok=True)
+    tmp = _ruta_muestreo() + f".{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(datos, f)
+    os.replace(tmp, _ruta_muestreo())
+    _muestreo["leido"] = 0.0
+    return datos
+
+def quitar_muestreo():
+    try:
+        os.remove(_ruta_muestreo())
+    except FileNotFoundError:
+        pass
+    _muestreo["leido"] = 0.0
+
+# ===== Perfil de un request =====
+# Request perfilado en curso. El threadpool copia el contexto, así que llega al hilo del endpoint.
+perfil_actual: ContextVar[Optional["Perfil"]] = ContextVar("perfil_actual", default=None)
+
+class Perfil:
+    def __init__(self, metodo: str, ruta: str, path: str, query: str, motivo: str, id_usuario: Optional[int]):
+        self.id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.fecha = datetime.utcnow()
+        self.metodo, self.ruta, self.path, self.query = metodo, ruta, path, query
+        self.motivo, self.id_usuario = motivo, id_usuario
+        self.inicio = time.perf_counter()
+        self.duracion_ms = 0.0
+        self.hilos: Set[int] = set()            # hilos del threadpool que trabajan ahora para este request
+        self.hilos_vistos: Set[int] = set()
+        self.hilo_loop = threading.get_ident()   # validación, middlewares y serialización (compartido)
+        self.muestras_loop = 0
+        self.pilas: Counter = Counter()          # pila (tupla de marcos, de afuera hacia adentro) -> muestras
+        self.ticks = 0
+        self.sql: List[dict] = []
+        self.sql_total = 0
+        self.sql_ms = 0.0
+        self._lock = threading.Lock()
+
+    def anotar_sql(self, sql: str, ms: float, filas: int):
+        fin_ms = (time.perf_counter() - self.inicio) * 1000
+        with self._lock:
+            self.sql_total += 1
+            self.sql_ms += ms
+            if len(self.sql) < PERFIL_MAX_SQL:
+                self.sql.append({
+                    "inicio_ms": round(fin_ms - ms, 2),
+                    "ms": round(ms, 2),
+                    "filas": filas if filas >= 0 else None,
+                    "hilo": threading.current_thread().name,
+                    "sql": sql,
+                })
+
+    def reporte(self, status: int) -> dict:
+        from app.utils.consultas_lentas import huella  # import local: consultas_lentas importa este módulo
+
+        muestras = sum(self.pilas.values())
+        propias, acumuladas = Counter(), Counter()
+        for pila, n in self.pilas.items():
+            propias[pila[-1]] += n
+            for marco in set(pila):
+                acumuladas[marco] += n
+
+        def _top(contador: Counter, limite: int = 40):
+            return [{"funcion": f, "muestras": n, "pct": round(n * 100 / muestras, 1)}
+                    for f, n in contador.most_common(limite)]
+
+        por_huella: Dict[str, List[float]] = {}
+        for s in self.sql:
+            a = por_huella.setdefault(huella(s["sql"]), [0, 0.0])
+            a[0] += 1
+            a[1] += s["ms"]
+        return {
+            "id": self.id,
+            "fecha": self.fecha.isoformat(timespec="seconds"),
+            "metodo": self.metodo,
+            "ruta": self.ruta,
+            "path": self.path,
+            "query": self.query,
+            "id_usuario": self.id_usuario,
+            "motivo": self.motivo,
+            "status": status,
+            "duracion_ms": round(self.duracion_ms, 2),
+            "python": {
+                "intervalo_ms": PERFIL_INTERVALO_MS,
+                "ticks": self.ticks,
+                "muestras": muestras,
+                "hilos": len(self.hilos_vistos),
+                # El event loop atiende a todos los requests: con mucha concurrencia parte de estas no son propias
+                "muestras_loop": self.muestras_loop,
+                "propias": _top(propias),
+                "acumuladas": _top(acumuladas),
+            },
+            "sql": {
+                "consultas": self.sql_total,
+                "ms": round(self.sql_ms, 2),
+                "pct_del_request": round(self.sql_ms * 100 / self.duracion_ms, 1) if self.duracion_ms else None,
+                "omitidas": self.sql_total - len(self.sql),
+                "por_huella": sorted(
+                    ({"huella": h, "conteo": c, "ms": round(ms, 2)} for h, (c, ms) in por_huella.items()),
+                    key=lambda x: x["ms"], reverse=True,
+                )[:30],
+                "linea_tiempo": self.sql,
+            },
+        }
+
+    def plegado(self) -> str:
+        """Pilas en formato 'a;b;c N' (flamegraph.pl, speedscope)."""
+        return "".join(f"{';'.join(pila)} {n}\n" for pila, n in self.pilas.most_common())
+
+# ===== Muestreo estadístico de pilas =====
+# Un hilo despierta cada PERFIL_INTERVALO_MS solo mientras haya requests perfilados y toma la pila
+# de los hilos de cada uno con sys._current_frames(): no toca a los demás requests y su costo no
+# depende de cuánto código corra el perfilado (a diferencia de cProfile, que mide cada llamada).
+_activos: Set[Perfil] = set()
+_lock = threading.Lock()
+_despertar = threading.Event()
+_muestreador: Optional[threading.Thread] = None
+_RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_etiquetas: Dict[object, str] = {}
+
+def _etiqueta(code) -> str:
+    etiqueta = _etiquetas.get(code)
+    if etiqueta is None:
+        archivo = code.co_filename
+        if "site-packages" in archivo:
+            archivo = archivo.split("site-packages" + os.sep, 1)[1]
+        elif archivo.startswith(_RAIZ):
+            archivo = os.path.relpath(archivo, _RAIZ)
+        else:
+            archivo = os.path.basename(archivo)
+        etiqueta = _etiquetas[code] = f"{code.co_name} ({archivo}:{code.co_firstlineno})"
+    return etiqueta
+
+def _en_espera(frame) -> bool:
+    """Hilo ocioso: del threadpool esperando trabajo en su cola, o el event loop en select()."""
+    if frame.f_code.co_name in ("select", "poll") and os.path.basename(frame.f_code.co_filename) == "selectors.py":
+        return True
+    while frame is not None and os.path.basename(frame.f_code.co_filename) in ("threading.py", "queue.py"):
+        frame = frame.f_back
+    return frame is not None and frame.f_code.co_name == "run" and "anyio" in frame.f_code.co_filename
+
+def _pila(frame) -> Tuple[str, ...]:
+    marcos = []
+    while frame is not None and len(marcos) < PERFIL_PROFUNDIDAD:
+        marcos.append(_etiqueta(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(marcos))
+
+def _muestrear():
+    intervalo = PERFIL_INTERVALO_MS / 1000
+    while True:
+        _despertar.wait()
+        with _lock:
+            activos = list(_activos)
+            if not activos:
+                _despertar.clear()
+                continue
+        marcos, frame = sys._current_frames(), None
+        for perfil in activos:
+            perfil.ticks += 1
+            for ident in list(perfil.hilos):
+                frame = marcos.get(ident)
+                if frame is not None and not _en_espera(frame):
+                    perfil.pilas[_pila(frame)] += 1
+            frame = marcos.get(perfil.hilo_loop)
+            if frame is not None and not _en_espera(frame):
+                perfil.pilas[_pila(frame)] += 1
+                perfil.muestras_loop += 1
+        marcos = frame = None   # no retener marcos de otros hilos durante la espera
+        time.sleep(intervalo)
+
+def iniciar(perfil: Perfil) -> bool:
+    global _muestreador
+    with _lock:
+        if len(_activos) >= PERFIL_MAX_SIMULTANEOS:
+            return False
+        _activos.add(perfil)
+        if _muestreador is None:
+            _muestreador = threading.Thread(target=_muestrear, name="perfilador", daemon=True)
+            _muestreador.start()
+    _despertar.set()
+    return True
+
+def terminar(perfil: Perfil):
+    perfil.duracion_ms = (time.perf_counter() - perfil.inicio) * 1000
+    with _lock:
+        _activos.discard(perfil)
+
+# ===== Hooks SQL (los llama consultas_lentas en cada sentencia) =====
+def marcar_hilo():
+    """
+    before_cursor_execute: el hilo que ejecuta SQL de un request perfilado entra a su muestreo
+    (el endpoint y sus dependencias corren en el threadpool, no en el hilo del middleware). Si
+    ese hilo ahora ejecuta SQL de otro request, sale de los perfiles donde estaba.
+    """
+    if not _activos:
+        return
+    perfil = perfil_actual.get()
+    ident = threading.get_ident()
+    for otro in list(_activos):
+        if otro is not perfil:
+            otro.hilos.discard(ident)
+    if perfil is not None:
+        perfil.hilos.add(ident)
+        perfil.hilos_vistos.add(ident)
+
+def anotar_sql(sql: str, ms: float, filas: int):
+    perfil = perfil_actual.get()
+    if perfil is not None:
+        perfil.anotar_sql(sql, ms, filas)
+
+# ===== Artefactos en disco =====
+def _ruta(id_perfil: str, extension: str) -> str:
+    return os.path.join(PERFIL_DIR, f"{id_perfil}.{extension}")
+
+def guardar(perfil: Perfil, status: int) -> str:
+    os.makedirs(PERFIL_DIR, exist_ok=True)
+    for extension, contenido in (("folded", perfil.plegado()),
+                                 ("json", json.dumps(perfil.reporte(status), ensure_ascii=False))):
+        ruta = _ruta(perfil.id, extension)
+        with open(ruta + ".tmp", "w", encoding="utf-8") as f:
+            f.write(contenido)
+        os.replace(ruta + ".tmp", ruta)
+    _podar()
+    print(f"[Perfilador] {perfil.metodo} {perfil.ruta} ({perfil.motivo}) {perfil.duracion_ms:.0f} ms -> {perfil.id}")
+    return perfil.id
+
+def _ids() -> List[str]:
+    """Ids guardados, del más reciente al más viejo (el id empieza con la fecha)."""
+    try:
+        nombres = os.listdir(PERFIL_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted((n[:-5] for n in nombres if n.endswith(".json") and _RE_ID.match(n[:-5])), reverse=True)
+
+def _podar():
+    for id_perfil in _ids()[PERFIL_MAX_ARCHIVOS:]:
+        for extension in ("json", "folded"):
+            try:
+                os.remove(_ruta(id_perfil, extension))
+            except FileNotFoundError:
+                pass
+
+def listar(limite: int = 50) -> List[dict]:
+    salida = []
+    for id_perfil in _ids()[:limite]:
+        try:
+            with open(_ruta(id_perfil, "json"), encoding="utf-8") as f:
+                doc = json.load(f)
+        except (OSError, ValueError):
+            continue  # borrado por la poda de otro worker
+        salida.append({
+            **{k: doc[k] for k in ("id", "fecha", "metodo", "ruta", "id_usuario", "motivo", "status", "duracion_ms")},
+            "muestras": doc["python"]["muestras"],
+            "consultas": doc["sql"]["consultas"],
+            "sql_ms": doc["sql"]["ms"],
+        })
+    return salida
+
+def leer(id_perfil: str, formato: str = "json"):
+    """Reporte (dict) o pilas plegadas (str); None si no existe."""
+    if not _RE_ID.match(id_perfil):
+        return None
+    try:
+        with open(_ruta(id_perfil, formato), encoding="utf-8") as f:
+            return json.load(f) if formato == "json" else f.read()
+    except FileNotFoundError:
+        return None
+
+# ===== Middleware =====
+def _autorizado(valor: bytes) -> bool:
+    return bool(DIAGNOSTICO_TOKEN) and hmac.compare_digest(valor, DIAGNOSTICO_TOKEN.encode())
+
+def _a_entero(valor) -> Optional[int]:
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+class PerfiladorMiddleware:
+    """
+    Perfil de un request a pedido: header `X-Perfilar: <DIAGNOSTICO_TOKEN>`, o una fracción de
+    los requests de las rutas configuradas (opcionalmente solo de ciertos usuarios). Guarda las
+    pilas muestreadas y la línea de tiempo SQL en PERFIL_DIR y devuelve el id en `X-Perfil-Id`.
+    Los demás requests solo pagan buscar un header y, si hay rutas configuradas, resolver la ruta.
+    Sin DIAGNOSTICO_TOKEN queda apagado (ni header ni muestreo): no escribe nada en PERFIL_DIR.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not DIAGNOSTICO_TOKEN:
+            return await self.app(scope, receive, send)
+
+        header = next((v for k, v in scope["headers"] if k == HEADER_PERFILAR), None)
+        rutas, usuarios = muestreo_vigente()
+        if header is None and not rutas:
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        ruta, path_params = resolver_ruta(request)
+        nombre = f"{scope['method']} {ruta}"
+        id_usuario = _a_entero(path_params.get("id_usuario") or request.query_params.get("id_usuario"))
+
+        motivo = None
+        if header is not None and _autorizado(header):
+            motivo = "header"
+        elif nombre in rutas:
+            if usuarios and id_usuario is None and scope["method"] in ("POST", "PUT", "PATCH"):
+                # El id del usuario de crear_egreso y compañía viene en el cuerpo JSON
+                receive, cuerpo = await leer_cuerpo(receive)
+                try:
+                    id_usuario = _a_entero(json.loads(cuerpo).get("id_usuario"))
+                except (ValueError, AttributeError):
+                    pass
+            if (not usuarios or id_usuario in usuarios) and random.random() < rutas[nombre]:
+                motivo = "muestreo"
+        if motivo is None:
+            return await self.app(scope, receive, send)
+
+        perfil = Perfil(scope["method"], ruta, scope["path"], scope.get("query_string", b"").decode("latin-1"),
+                        motivo, id_usuario)
+        if not iniciar(perfil):
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_con_id(msg: Message):
+            nonlocal status
+            if msg["type"] == "http.response.start":
+                status = msg["status"]
+                msg["headers"] = [*msg.get("headers", []), (b"x-perfil-id", perfil.id.encode())]
+            await send(msg)
+
+        token = perfil_actual.set(perfil)
+        try:
+            await self.app(scope, receive, send_con_id)
+        finally:
+            perfil_actual.reset(token)
+            terminar(perfil)
+            try:
+                await run_in_threadpool(guardar, perfil, status)
+            except OSError as e:
+                print(f"[Perfilador] No se pudo guardar {perfil.id}: {e}")
+
@@ -0,0 +1,38 @@
+from datetime import date, datetime, timedelta
+from typing import Tuple
+
+from sqlalchemy import and_
+from sqlalchemy.sql.elements import ColumnElement
+
+# Rangos semiabiertos [desde, hasta) sobre columnas DATETIME. Comparar la columna "desnuda"
+# (en lugar de EXTRACT(MONTH ...) o DATE(fecha)) permite usar índices y podar particiones.
+Rango = Tuple[datetime, datetime]
+
+# ===== Meses =====
+def inicio_mes(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+def mes_siguiente(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+# ===== Rangos =====
+def inicio_dia(d: date) -> datetime:
+    return datetime.combine(d, datetime.min.time())
+
+def rango_dias(desde: date, hasta: date) -> Rango:
+    """Días `desde`..`hasta` inclusive."""
+    return inicio_dia(desde), inicio_dia(hasta + timedelta(days=1))
+
+def rango_mes(anio: int, mes: int) -> Rango:
+    ini = date(anio, mes, 1)
+    return inicio_dia(ini), inicio_dia(mes_siguiente(ini))
+
+def rango_mes_de(fecha: date) -> Rango:
+    return rango_mes(fecha.year, fecha.month)
+
+def rango_anio(anio: int) -> Rango:
+    return inicio_dia(date(anio, 1, 1)), inicio_dia(date(anio + 1, 1, 1))
+
+def en_rango(columna, rango: Rango) -> ColumnElement:
+    desde, hasta = rango
+    return and_(columna >= desde, columna < hasta)
@@ -0,0 +1,248 @@
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.budget_model import Budget
+from app.models.faltante_model import FaltanteSaldo
+from app.models.pago_model import PagoFijo
+from app.models.transaction_model import Transaction
+from app.models.user_model import User
+from app.utils.dinero import a_pesos
+
+_PERIODICIDAD = {"none": 0, "weekly": 1, "monthly": 2}
+
+# ===== Núcleo vectorizado =====
+def _ocurrencias(prox, periodicidad, hoy: np.datetime64, dias: int):
+    """
+    Expande todas las recurrencias a la vez. Devuelve (indice_pago, indice_dia) de cada cargo dentro del horizonte.
+    Replica al cron: add_months encadenado (el día recortado a fin de mes se queda recortado)
+    y los pagos vencidos se cobran hoy.
+    """
+    n = prox.shape[0]
+    if n == 0:
+        vacio = np.zeros(0, dtype=np.int64)
+        return vacio, vacio
+
+    # Los vencidos se ponen al día (el cron avanza un paso por corrida), así que también cuentan
+    atraso = max(int((hoy - prox.min()).astype(np.int64)), 0)
+    pasos = (dias + atraso) // 7 + 2
+    k = np.arange(pasos, dtype=np.int64)[None, :]
+
+    semanal = prox[:, None] + (7 * k).astype("timedelta64[D]")
+
+    mes0 = prox.astype("datetime64[M]")
+    dia0 = (prox - mes0.astype("datetime64[D]")).astype(np.int64) + 1
+    meses = mes0[:, None] + k.astype("timedelta64[M]")
+    dias_mes = ((meses + 1).astype("datetime64[D]") - meses.astype("datetime64[D]")).astype(np.int64)
+    dia = np.minimum.accumulate(np.minimum(dias_mes, dia0[:, None]), axis=1)
+    mensual = meses.astype("datetime64[D]") + (dia - 1).astype("timedelta64[D]")
+
+    fechas = np.where((periodicidad == _PERIODICIDAD["monthly"])[:, None], mensual, semanal)
+    validos = np.where((periodicidad == _PERIODICIDAD["none"])[:, None], k == 0, True)
+
+    fechas = np.maximum(fechas, hoy)
+    indice_dia = (fechas - hoy).astype(np.int64)
+    validos &= indice_dia < dias
+
+    filas, _ = np.nonzero(validos)
+    return filas, indice_dia[validos]
+
+def proyectar(
+    saldos: np.ndarray,
+    pagos: Dict[str, np.ndarray],
+    presupuestos: Optional[Dict[str, np.ndarray]],
+    hoy: date,
+    dias: int,
+) -> np.ndarray:
+    """
+    saldos: (U,) saldo actual por usuario. Todos los montos en centavos (int64).
+    pagos: arrays paralelos 'usuario' (índice 0..U-1), 'monto', 'proxima' (datetime64[D]), 'periodicidad', 'categoria' (-1 si no tiene).
+    presupuestos: 'usuario', 'categoria', 'mes' (datetime64[M]), 'restante' (ya descontado lo gastado).
+    Devuelve una matriz (U, dias) int64 con el saldo proyectado al cierre de cada día.
+    """
+    n_usuarios = saldos.shape[0]
+    hoy64 = np.datetime64(hoy, "D")
+
+    filas, idx_dia = _ocurrencias(pagos["proxima"], pagos["periodicidad"], hoy64, dias)
+    montos = pagos["monto"][filas]
+    usuarios = pagos["usuario"][filas].astype(np.int64)
+    salidas = np.zeros(n_usuarios * dias, dtype=np.int64)
+    np.add.at(salidas, usuarios * dias + idx_dia, montos)
+    salidas = salidas.reshape(n_usuarios, dias)
+
+    if presupuestos is not None and presupuestos["usuario"].shape[0]:
+        restante = presupuestos["restante"].astype(np.int64).copy()
+
+        # Los pagos fijos de la categoría ya forman parte de su presupuesto: no contarlos dos veces
+        n_cat = int(max(presupuestos["categoria"].max(), pagos["categoria"].max(initial=-1))) + 2
+        mes_base = hoy64.astype("datetime64[M]")
+
+        def _clave(u, c, m):
+            return (u.astype(np.int64) * n_cat + (c.astype(np.int64) + 1)) * 1200 + (m - mes_base).astype(np.int64)
+
+        claves = _clave(presupuestos["usuario"], presupuestos["categoria"], presupuestos["mes"])
+        orden = np.argsort(claves, kind="stable")
+        claves_ord = claves[orden]
+        mes_cargo = (hoy64 + idx_dia.astype("timedelta64[D]")).astype("datetime64[M]")
+        claves_cargo = _clave(usuarios, pagos["categoria"][filas], mes_cargo)
+        pos = np.minimum(np.searchsorted(claves_ord, claves_cargo), len(claves_ord) - 1)
+        coincide = claves_ord[pos] == claves_cargo
+        np.subtract.at(restante, orden[pos[coincide]], montos[coincide])
+        restante = np.maximum(restante, 0)
+
+        # Lo que queda del presupuesto se reparte en centavos enteros sobre los días restantes del
+        # mes: el cociente cada día y el resto, de a un centavo, en los primeros días
+        inicio = np.maximum(presupuestos["mes"].astype("datetime64[D]"), hoy64)
+        fin = (presupuestos["mes"] + 1).astype("datetime64[D]")
+        por_dia, resto = np.divmod(restante, np.maximum((fin - inicio).astype(np.int64), 1))
+        i0 = np.clip((inicio - hoy64).astype(np.int64), 0, dias)
+        i1 = np.clip((fin - hoy64).astype(np.int64), 0, dias)
+        i_resto = np.clip((inicio - hoy64).astype(np.int64) + resto, 0, dias)
+
+        delta = np.zeros((n_usuarios, dias + 1), dtype=np.int64)
+        u = presupuestos["usuario"].astype(np.int64)
+        np.add.at(delta, (u, i0), por_dia + 1)
+        np.subtract.at(delta, (u, i_resto), 1)
+        np.subtract.at(delta, (u, i1), por_dia)
+        salidas += np.cumsum(delta[:, :dias], axis=1)
+
+    return saldos[:, None] - np.cumsum(salidas, axis=1)
+
+def primer_faltante(serie: np.ndarray, hoy: date) -> Tuple[np.ndarray, np.ndarray]:
+    """Para cada fila devuelve (hay_faltante, fecha del primer día con saldo negativo)."""
+    negativo = serie < 0
+    hay = negativo.any(axis=1)
+    idx = np.argmax(negativo, axis=1)
+    fechas = np.datetime64(hoy, "D") + idx.astype("timedelta64[D]")
+    return hay, fechas
+
+# ===== Carga en bloque (un query por tabla, sin importar cuántos usuarios) =====
+def _cargar(db: Session, hoy: date, dias: int, id_usuario: Optional[int] = None, incluir_presupuestos: bool = True):
+    q_usuarios = db.query(User.id_usuario, User.saldo)
+    q_pagos = db.query(
+        PagoFijo.id_usuario, PagoFijo.monto, PagoFijo.proxima_ejecucion, PagoFijo.periodicidad, PagoFijo.categoria_id
+    ).filter(PagoFijo.activo == True)
+    if id_usuario is not None:
+        q_usuarios = q_usuarios.filter(User.id_usuario == id_usuario)
+        q_pagos = q_pagos.filter(PagoFijo.id_usuario == id_usuario)
+
+    usuarios = q_usuarios.order_by(User.id_usuario).all()
+    ids = np.array([u for u, _ in usuarios], dtype=np.int64)
+    saldos = np.array([s or 0 for _, s in usuarios], dtype=np.int64)
+
+    def _indice(id_usuarios):
+        # ids está ordenado: searchsorted mapea id_usuario -> fila
+        arr = np.asarray(id_usuarios, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(ids, arr), max(len(ids) - 1, 0))
+        return pos, (ids[pos] == arr) if len(ids) else np.zeros(len(arr), dtype=bool)
+
+    filas = q_pagos.all()
+    pos, ok = _indice([f[0] for f in filas])
+    pagos = {
+        "usuario": pos[ok],
+        "monto": np.array([f[1] for f in filas], dtype=np.int64)[ok],
+        "proxima": np.array([f[2] for f in filas], dtype="datetime64[D]")[ok],
+        "periodicidad": np.array([_PERIODICIDAD.get(f[3], 0) for f in filas], dtype=np.int8)[ok],
+        "categoria": np.array([f[4] if f[4] is not None else -1 for f in filas], dtype=np.int64)[ok],
+    }
+
+    presupuestos = None
+    if incluir_presupuestos:
+        fin = hoy + timedelta(days=dias)
+        mes_ini = hoy.year * 12 + hoy.month
+        mes_fin = fin.year * 12 + fin.month
+        q_pres = db.query(Budget.id_usuario, Budget.id_categoria, Budget.mes, Budget.año, Budget.monto_mensual).filter(
+            (Budget.año * 12 + Budget.mes).between(mes_ini, mes_fin)
+        )
+        inicio_mes = datetime(hoy.year, hoy.month, 1)
+        q_gastado = db.query(
+            Transaction.id_usuario, Transaction.categoria_id, func.sum(Transaction.monto)
+        ).filter(
+            Transaction.tipo == "egreso",
+            Transaction.fecha >= inicio_mes,
+        )
+        if id_usuario is not None:
+            q_pres = q_pres.filter(Budget.id_usuario == id_usuario)
+            q_gastado = q_gastado.filter(Transaction.id_usuario == id_usuario)
+        gastado = {
+            (u, c): t or 0
+            for u, c, t in q_gastado.group_by(Transaction.id_usuario, Transaction.categoria_id).all()
+        }
+
+        filas = q_pres.all()
+        pos, ok = _indice([f[0] for f in filas])
+        restante = np.array([
+            (f[4] or 0) - (gastado.get((f[0], f[1]), 0) if (f[3], f[2]) == (hoy.year, hoy.month) else 0)
+            for f in filas
+        ], dtype=np.int64)
+        presupuestos = {
+            "usuario": pos[ok],
+            "categoria": np.array([f[1] for f in filas], dtype=np.int64)[ok],
+            "mes": np.array([f"{f[3]:04d}-{f[2]:02d}" for f in filas], dtype="datetime64[M]")[ok],
+            "restante": np.maximum(restante, 0)[ok],
+        }
+
+    return ids, saldos, pagos, presupuestos
+
+def proyectar_usuario(db: Session, id_usuario: int, hoy: date, dias: int, incluir_presupuestos: bool = True):
+    ids, saldos, pagos, presupuestos = _cargar(db, hoy, dias, id_usuario, incluir_presupuestos)
+    if not len(ids):
+        return None
+    serie = proyectar(saldos, pagos, presupuestos, hoy, dias)
+    hay, fechas = primer_faltante(serie, hoy)
+    return {
+        "saldo_actual": a_pesos(int(saldos[0])),
+        "saldo_final": a_pesos(int(serie[0, -1])),
+        "saldo_minimo": a_pesos(int(serie[0].min())),
+        "primer_faltante": str(fechas[0]) if hay[0] else None,
+        "serie": [
+            {"fecha": str(f), "saldo": a_pesos(v)}
+            for f, v in zip(np.datetime64(hoy, "D") + np.arange(dias), serie[0].tolist())
+        ],
+    }
+
+def proyectar_todos(db: Session, hoy: date, dias: int) -> Dict[int, Tuple[date, int]]:
+    """Puntúa a todos los usuarios en bloque. Devuelve {id_usuario: (primer_faltante, saldo_minimo en centavos)} solo de quienes se quedan cortos."""
+    ids, saldos, pagos, presupuestos = _cargar(db, hoy, dias)
+    if not len(ids):
+        return {}
+    serie = proyectar(saldos, pagos, presupuestos, hoy, dias)
+    hay, fechas = primer_faltante(serie, hoy)
+    minimos = serie.min(axis=1)
+    return {
+        int(ids[i]): (fechas[i].astype(date), int(minimos[i]))
+        for i in np.nonzero(hay)[0]
+    }
+
+# ===== Resultado de la corrida nocturna (lo consume verificar_pagos_pendientes) =====
+# En la tabla faltantes_saldo de cada shard (en_cada_shard da la sesión de ese shard), no en
+# memoria: un reinicio no los pierde y los workers no tienen cada uno su copia.
+def guardar_faltantes(db: Session, faltantes: Dict[int, Tuple[date, int]]):
+    """Reemplaza los faltantes del shard por los de esta corrida."""
+    db.query(FaltanteSaldo).delete(synchronize_session=False)
+    db.bulk_insert_mappings(FaltanteSaldo, [
+        {"id_usuario": uid, "fecha": fecha, "minimo": minimo, "calculado": datetime.utcnow()}
+        for uid, (fecha, minimo) in faltantes.items()
+    ])
+    db.commit()
+
+def tomar_faltantes(db: Session) -> Dict[int, Tuple[date, int]]:
+    """
+    Entrega los faltantes aún no avisados y los borra (un aviso por corrida nocturna). El UPDATE
+    con un token propio decide qué filas son de este worker: otro que corra a la vez no las ve.
+    """
+    token = uuid.uuid4().hex
+    db.query(FaltanteSaldo).filter(FaltanteSaldo.tomado_por.is_(None)) \
+        .update({FaltanteSaldo.tomado_por: token}, synchronize_session=False)
+    faltantes = {
+        f.id_usuario: (f.fecha, f.minimo)
+        for f in db.query(FaltanteSaldo.id_usuario, FaltanteSaldo.fecha, FaltanteSaldo.minimo)
+        .filter(FaltanteSaldo.tomado_por == token)
+    }
+    db.query(FaltanteSaldo).filter(FaltanteSaldo.tomado_por == token).delete(synchronize_session=False)
+    db.commit()
+    return faltantes
@@ -0,0 +1,86 @@
+"""
+Mueve usuarios entre shards (ver app/utils/shards.py):
+
+    python -m app.utils.resharding --usuario 42 --usuario 77 --destino 1
+"""
+import argparse
+import time
+from typing import Optional
+
+from sqlalchemy import func, insert, select
+
+from app.database import Base
+from app.models.archivo_model import PeriodoArchivado
+from app.utils import shards
+
+# Orden de inserción (padres primero); se borra al revés. Las transacciones donde el usuario es
+# destinatario pertenecen al remitente y no se mueven. `cambios` tampoco: el cursor del cliente
+# queda fuera del rango del nuevo shard y GET /cambios le pide resincronizar completo.
+TABLAS_A_MOVER = ("usuarios", "transacciones", "pagos", "presupuestos", "anomalias", "resumen_archivado")
+
+def _corte(conn):
+    return conn.execute(select(func.max(PeriodoArchivado.hasta))).scalar()
+
+def mover_usuario(id_usuario: int, destino: str, espera: Optional[float] = None) -> dict:
+    """
+    1) bloquea sus escrituras en el directorio y espera a que venza la caché de todos los workers,
+    2) copia sus filas al destino con los mismos ids, 3) cambia el directorio (desbloquea) y
+    4) borra las filas del origen. Si falla antes del paso 3, deshace la copia y desbloquea.
+    """
+    if not shards.activos():
+        raise ValueError("Sin DATABASE_SHARDS no hay shards entre los que mover usuarios.")
+    if destino not in shards.lista():
+        raise ValueError(f"Shard desconocido: {destino}")
+    shards.olvidar(id_usuario)
+    origen, _ = shards.ubicacion(id_usuario)
+    if origen == destino:
+        return {"id_usuario": id_usuario, "origen": origen, "destino": destino, "filas": 0}
+
+    fuente, meta = shards.motor(origen), shards.motor(destino)
+    with fuente.connect() as conn_f, meta.connect() as conn_d:
+        if _corte(conn_f) != _corte(conn_d):
+            # Con marcas de agua distintas sus estadísticas mezclarían meses calientes y archivados
+            raise ValueError(f"Los shards {origen} y {destino} no tienen archivado el mismo mes.")
+        if conn_f.execute(select(func.count()).select_from(Base.metadata.tables["usuarios"])
+                          .where(Base.metadata.tables["usuarios"].c.id_usuario == id_usuario)).scalar() == 0:
+            raise ValueError(f"El usuario {id_usuario} no está en el shard {origen}.")
+
+    shards.fijar_ubicacion(id_usuario, origen, bloqueado=True)
+    time.sleep(shards.SHARD_MAPA_TTL if espera is None else espera)
+
+    copiadas = 0
+    try:
+        with fuente.connect() as conn_f, meta.begin() as conn_d:
+            for nombre in TABLAS_A_MOVER:
+                tabla = Base.metadata.tables[nombre]
+                filas = [dict(f) for f in conn_f.execute(select(tabla).where(tabla.c.id_usuario == id_usuario)).mappings()]
+                if filas:
+                    conn_d.execute(insert(tabla), filas)
+                    copiadas += len(filas)
+        shards.fijar_ubicacion(id_usuario, destino, bloqueado=False)
+    except Exception:
+        with meta.begin() as conn_d:
+            for nombre in reversed(TABLAS_A_MOVER):
+                tabla = Base.metadata.tables[nombre]
+                conn_d.execute(tabla.delete().where(tabla.c.id_usuario == id_usuario))
+        shards.fijar_ubicacion(id_usuario, origen, bloqueado=False)
+        raise
+
+    with fuente.begin() as conn_f:
+        # faltantes_saldo no se copia: la proyección de la noche lo rehace en el shard nuevo
+        for nombre in ("cambios", "faltantes_saldo") + tuple(reversed(TABLAS_A_MOVER)):
+            tabla = Base.metadata.tables[nombre]
+            conn_f.execute(tabla.delete().where(tabla.c.id_usuario == id_usuario))
+    print(f"[Shards] Usuario {id_usuario}: shard {origen} -> {destino} ({copiadas} filas)")
+    return {"id_usuario": id_usuario, "origen": origen, "destino": destino, "filas": copiadas}
+
+if __name__ == "__main__":
+    import app.main  # noqa: F401  registra los modelos y prepara los shards
+
+    parser = argparse.ArgumentParser(description="Mueve usuarios a otro shard.")
+    parser.add_argument("--usuario", type=int, action="append", required=True)
+    parser.add_argument("--destino", required=True)
+    parser.add_argument("--espera", type=float, default=None, help="Segundos de bloqueo antes de copiar")
+    args = parser.parse_args()
+    for uid in args.usuario:
+        mover_usuario(uid, args.destino, args.espera)
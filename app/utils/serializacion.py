@@ -0,0 +1,52 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable, List, Sequence, Type
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Query
+from starlette.responses import JSONResponse
+
+from app.utils.dinero import a_pesos, campos_monto
+
+try:
+    import orjson
+except ImportError:  # sin orjson se usa json de la stdlib (más lento, mismo resultado)
+    orjson = None
+
+def _por_defecto(valor: Any):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+class RespuestaJSONRapida(JSONResponse):
+    """JSONResponse con orjson: serializa Decimal como float y fechas en ISO, igual que los modelos Pydantic."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_por_defecto)
+        return json.dumps(content, default=_por_defecto, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def columnas_de(modelo_orm, esquema: Type[BaseModel]) -> List:
+    """Solo las columnas que expone el esquema de respuesta, en el mismo orden."""
+    return [getattr(modelo_orm, campo) for campo in esquema.model_fields]
+
+def filas_a_dicts(filas: Iterable, esquema: Type[BaseModel]) -> List[dict]:
+    """Tuplas de columnas_de(...) a dicts con las llaves del esquema; los montos salen en pesos."""
+    nombres: Sequence[str] = list(esquema.model_fields)
+    montos = campos_monto(esquema)  # centavos -> pesos, como haría el serializador del esquema
+    salida = [dict(zip(nombres, f)) for f in filas]
+    for fila in salida:
+        for campo in montos:
+            if fila[campo] is not None:
+                fila[campo] = a_pesos(fila[campo])
+    return salida
+
+def respuesta_filas(query: Query, esquema: Type[BaseModel]) -> RespuestaJSONRapida:
+    """
+    Camino rápido para listados: tuplas en vez de entidades (sin identity map) y sin validar
+    fila por fila con Pydantic. El esquema se mantiene porque las llaves salen del propio modelo.
+    """
+    return RespuestaJSONRapida(filas_a_dicts(query.all(), esquema))
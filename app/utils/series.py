@@ -0,0 +1,125 @@
+from datetime import date
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Integer, cast, func
+from sqlalchemy.sql.elements import ColumnElement
+
+GRANULARIDADES = ("dia", "semana", "mes", "trimestre")
+
+# ===== Cubeta en la BD: inicio del periodo como 'YYYY-MM-DD' (o DATE) =====
+def expr_periodo(columna, granularidad: str, dialecto: str) -> ColumnElement:
+    """Expresión SQL con el primer día del periodo de `columna` (semanas empiezan en lunes)."""
+    if dialecto == "sqlite":
+        if granularidad == "dia":
+            return func.date(columna)
+        if granularidad == "semana":
+            dias_desde_lunes = (cast(func.strftime("%w", columna), Integer) + 6) % 7
+            return func.date(columna, func.printf("-%d days", dias_desde_lunes))
+        if granularidad == "mes":
+            return func.date(columna, "start of month")
+        mes_inicio = (cast(func.strftime("%m", columna), Integer) - 1) // 3 * 3 + 1
+        return func.printf("%04d-%02d-01", cast(func.strftime("%Y", columna), Integer), mes_inicio)
+
+    # MySQL
+    if granularidad == "dia":
+        return func.date(columna)
+    if granularidad == "semana":
+        return func.subdate(func.date(columna), func.weekday(columna))
+    if granularidad == "mes":
+        return func.date_format(columna, "%Y-%m-01")
+    return func.concat(func.year(columna), "-", func.lpad((func.quarter(columna) - 1) * 3 + 1, 2, "0"), "-01")
+
+# ===== Calendario y relleno de huecos, vectorizado =====
+def calendario(ini: date, fin: date, granularidad: str) -> np.ndarray:
+    """Inicio de cada periodo entre ini y fin (inclusive) como datetime64[D]."""
+    d0 = np.datetime64(ini, "D")
+    d1 = np.datetime64(fin, "D")
+    if granularidad == "dia":
+        return np.arange(d0, d1 + 1, dtype="datetime64[D]")
+    if granularidad == "semana":
+        # Ancla en el lunes 1970-01-05: restar el residuo módulo 7 lleva d0 al lunes de su semana
+        lunes0 = d0 - ((d0 - np.datetime64("1970-01-05")).astype(np.int64) % 7)
+        return np.arange(lunes0, d1 + 1, 7, dtype="datetime64[D]")
+    m0 = d0.astype("datetime64[M]")
+    m1 = d1.astype("datetime64[M]")
+    if granularidad == "mes":
+        return np.arange(m0, m1 + 1, dtype="datetime64[M]").astype("datetime64[D]")
+    q0 = m0 - (m0.astype(np.int64) % 3)
+    return np.arange(q0, m1 + 1, 3, dtype="datetime64[M]").astype("datetime64[D]")
+
+def rellenar(
+    periodos: np.ndarray,
+    claves: Sequence,
+    filas_periodo: Sequence,
+    filas_clave: Sequence,
+    valores: Dict[str, Sequence[int]],
+) -> Tuple[List, Dict[str, np.ndarray]]:
+    """
+    Coloca las filas agregadas (periodo, clave, métricas) en matrices densas (n_claves, n_periodos)
+    con ceros donde no hubo movimientos. Sin bucles por fecha: searchsorted + add.at. Las métricas
+    enteras (centavos, conteos) quedan en int64: las sumas por cubeta no acumulan error de float.
+    """
+    claves = list(claves)
+    n = len(periodos)
+    fechas = np.array([str(p)[:10] for p in filas_periodo], dtype="datetime64[D]")
+    col = np.searchsorted(periodos, fechas)
+    ok = (col < n) & (periodos[np.minimum(col, n - 1)] == fechas) if n else np.zeros(len(fechas), dtype=bool)
+
+    indice = {k: i for i, k in enumerate(claves)}
+    fila = np.array([indice[k] for k in filas_clave], dtype=np.int64)
+
+    salida = {}
+    for nombre, vals in valores.items():
+        arr = np.asarray(vals)
+        tipo = np.int64 if arr.dtype.kind in "iu" or arr.size == 0 else np.float64
+        m = np.zeros((len(claves), n), dtype=tipo)
+        np.add.at(m, (fila[ok], col[ok]), arr.astype(tipo)[ok])
+        salida[nombre] = m
+    return claves, salida
+
+# ===== Reducción de series largas a un máximo de puntos =====
+METODOS_MUESTREO = ("suma", "lttb")
+
+def cubetas(n: int, puntos: int) -> np.ndarray:
+    """Inicio de `puntos` cubetas contiguas de tamaño casi igual sobre n elementos."""
+    return np.linspace(0, n, puntos + 1).astype(np.int64)[:-1]
+
+def reducir_suma(series: np.ndarray, puntos: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Suma cada serie (filas de `series`) por cubetas contiguas: conserva los totales del rango.
+    Devuelve (índice de inicio de cada cubeta, matriz reducida).
+    """
+    inicios = cubetas(series.shape[1], puntos)
+    return inicios, np.add.reduceat(series, inicios, axis=1)
+
+def lttb(x: np.ndarray, series: np.ndarray, puntos: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: índices de `puntos` muestras que conservan la forma
+    (picos y valles) de todas las series a la vez. Cada serie se normaliza por su rango para
+    que la de mayor escala no decida sola. El bucle es por cubeta (≤ puntos), no por elemento.
+    """
+    n = series.shape[1]
+    if puntos >= n:
+        return np.arange(n)
+    if puntos < 3:
+        return np.array([0, n - 1])[:puntos]
+
+    x = x.astype(np.float64)
+    escala = np.ptp(series, axis=1, keepdims=True)
+    ys = series / np.where(escala > 0, escala, 1.0)
+    bordes = np.linspace(1, n - 1, puntos - 1).astype(np.int64)
+
+    elegidos = np.empty(puntos, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, n - 1
+    a = 0
+    for i in range(puntos - 2):
+        ini, fin = bordes[i], bordes[i + 1]
+        sig_fin = bordes[i + 2] if i + 2 < len(bordes) else n
+        cx = x[fin:sig_fin].mean()
+        cy = ys[:, fin:sig_fin].mean(axis=1, keepdims=True)
+        ya = ys[:, a:a + 1]
+        areas = np.abs((x[a] - cx) * (ys[:, ini:fin] - ya) - (x[a] - x[ini:fin]) * (cy - ya)).sum(axis=0)
+        a = ini + int(np.argmax(areas))
+        elegidos[i + 1] = a
+    return elegidos
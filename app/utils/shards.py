@@ -0,0 +1,361 @@
+import contextvars
+import os
+from contextlib import contextmanager
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import Boolean, Column, Integer, MetaData, String, Table, event, func, insert, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.elements import BindParameter
+
+SHARD_PRIMARIO = "0"
+SHARD_RANGO_IDS = int(os.environ.get("SHARD_RANGO_IDS", "100000000"))   # ids por shard (INT: hasta 21 shards)
+SHARD_MAPA_TTL = float(os.environ.get("SHARD_MAPA_TTL", "30"))          # segundos de caché del directorio
+
+# Dónde vive cada tabla
+TABLAS_POR_USUARIO = {"usuarios", "transacciones", "pagos", "presupuestos", "cambios", "secuencia_cambios",
+                      "anomalias", "resumen_archivado", "faltantes_saldo"}
+TABLAS_GLOBALES = {"idempotencia", "corridas_jobs"}  # solo en el primario
+TABLAS_REPLICADAS = {"categorias"}                # se escriben en el primario y se copian a todos
+# PK con rango propio por shard: se pueden buscar por id sin conocer al usuario
+TABLAS_CON_RANGO = ("transacciones", "pagos", "presupuestos", "cambios", "anomalias", "resumen_archivado")
+
+class UsuarioEnMovimiento(Exception):
+    """El usuario se está moviendo de shard: sus escrituras se rechazan hasta que termine."""
+
+# ===== Directorio de usuarios (solo en el primario) =====
+_meta = MetaData()
+mapa_shards = Table(
+    "mapa_shards", _meta,
+    Column("id_usuario", Integer, primary_key=True, autoincrement=True),   # también reparte los ids nuevos
+    Column("shard", String(16), nullable=False),
+    Column("bloqueado", Boolean, nullable=False, default=False),
+    sqlite_autoincrement=True,
+)
+
+_motores: Dict[str, Engine] = {}
+_fabrica_global: Optional[Callable[..., Session]] = None
+shard_actual: contextvars.ContextVar = contextvars.ContextVar("shard_actual", default=None)
+_cache: Dict[int, Tuple[str, bool, float]] = {}
+_cache_lock = threading.Lock()
+
+def activos() -> bool:
+    return len(_motores) > 1
+
+def lista() -> List[str]:
+    return sorted(_motores, key=int)
+
+def motor(shard: str) -> Engine:
+    return _motores[shard]
+
+def motor_actual() -> Engine:
+    """Engine del shard del job en curso (en_cada_shard) o el primario."""
+    return _motores[shard_actual.get() or SHARD_PRIMARIO]
+
+def segmento() -> List[str]:
+    """Subcarpeta para archivos por shard (archivo frío, checkpoints); vacío sin sharding."""
+    k = shard_actual.get()
+    return [f"shard{k}"] if k is not None and activos() else []
+
+def ubicacion(id_usuario: int) -> Tuple[str, bool]:
+    ahora = time.monotonic()
+    en_cache = _cache.get(id_usuario)
+    if en_cache and ahora - en_cache[2] < SHARD_MAPA_TTL:
+        return en_cache[0], en_cache[1]
+    with _motores[SHARD_PRIMARIO].connect() as conn:
+        fila = conn.execute(
+            select(mapa_shards.c.shard, mapa_shards.c.bloqueado).where(mapa_shards.c.id_usuario == id_usuario)
+        ).first()
+    # Sin entrada: usuario anterior al sharding, sigue en la base original
+    shard, bloqueado = (fila[0], bool(fila[1])) if fila else (SHARD_PRIMARIO, False)
+    with _cache_lock:
+        _cache[id_usuario] = (shard, bloqueado, ahora)
+    return shard, bloqueado
+
+def shard_de(id_usuario: int, escritura: bool = False) -> str:
+    if not activos():
+        return SHARD_PRIMARIO
+    shard, bloqueado = ubicacion(int(id_usuario))
+    if escritura and bloqueado:
+        raise UsuarioEnMovimiento(id_usuario)
+    return shard
+
+def argumentos(id_usuario: Optional[int]) -> dict:
+    """bind_arguments para Session.execute que fijan el shard del usuario (vacío sin sharding)."""
+    if not activos() or id_usuario is None:
+        return {}
+    return {"shard_id": shard_de(id_usuario)}
+
+def agrupar(ids: Iterable[int]) -> Dict[str, List[int]]:
+    grupos: Dict[str, List[int]] = {}
+    for i in ids:
+        grupos.setdefault(shard_de(i), []).append(i)
+    return grupos
+
+def olvidar(id_usuario: int):
+    with _cache_lock:
+        _cache.pop(id_usuario, None)
+
+def fijar_ubicacion(id_usuario: int, shard: str, bloqueado: bool):
+    """Alta o cambio de la entrada del directorio (la usa el resharding)."""
+    with _motores[SHARD_PRIMARIO].begin() as conn:
+        cambio = conn.execute(
+            update(mapa_shards).where(mapa_shards.c.id_usuario == id_usuario).values(shard=shard, bloqueado=bloqueado)
+        )
+        if cambio.rowcount == 0:
+            conn.execute(insert(mapa_shards).values(id_usuario=id_usuario, shard=shard, bloqueado=bloqueado))
+    olvidar(id_usuario)
+
+def asignar_id() -> int:
+    """Reserva un id_usuario global y su shard (reparto por id módulo N)."""
+    with _motores[SHARD_PRIMARIO].begin() as conn:
+        nuevo = conn.execute(insert(mapa_shards).values(shard=SHARD_PRIMARIO, bloqueado=False)).inserted_primary_key[0]
+        shard = lista()[nuevo % len(_motores)]
+        conn.execute(update(mapa_shards).where(mapa_shards.c.id_usuario == nuevo).values(shard=shard))
+    with _cache_lock:
+        _cache[nuevo] = (shard, False, time.monotonic())
+    return nuevo
+
+# ===== Elección de shard por sentencia =====
+def _tablas(sentencia) -> Set[str]:
+    nombres: Set[str] = set()
+    visitors.traverse(sentencia, {}, {"table": lambda t: nombres.add(t.name)})
+    return nombres
+
+def _usuarios(sentencia) -> Set[int]:
+    """
+    Valores de `id_usuario = :v` / `id_usuario IN (...)` del filtro. Los que están dentro de un
+    OR no acotan nada (p. ej. titular o destinatario) y se ignoran.
+    """
+    valores: Set[int] = set()
+    en_or: Set[int] = set()
+
+    def marcar_or(lista_):
+        if lista_.operator is operators.or_:
+            en_or.update(id(e) for e in visitors.iterate(lista_) if e.__visit_name__ == "binary")
+
+    def visitar(binaria):
+        if id(binaria) in en_or:
+            return
+        if getattr(binaria.left, "name", None) != "id_usuario" or not isinstance(binaria.right, BindParameter):
+            return
+        valor = binaria.right.effective_value
+        if binaria.operator is operators.eq and valor is not None:
+            valores.add(int(valor))
+        elif binaria.operator is operators.in_op and valor:
+            valores.update(int(v) for v in valor)
+
+    visitors.traverse(sentencia, {}, {"expression_clauselist": marcar_or})
+    visitors.traverse(sentencia, {}, {"binary": visitar})
+    return valores
+
+def _elegir_ejecucion(contexto) -> List[str]:
+    sentencia = contexto.statement
+    tablas = _tablas(sentencia)
+    if tablas and tablas <= TABLAS_GLOBALES | TABLAS_REPLICADAS:
+        return [SHARD_PRIMARIO]
+    usuarios = _usuarios(sentencia)
+    if usuarios and tablas & TABLAS_POR_USUARIO:
+        return sorted({shard_de(u, escritura=not contexto.is_select) for u in usuarios}, key=int)
+    return lista()  # sin usuario en el filtro: se consulta en todos y se juntan las filas
+
+def _elegir_shard(mapper, instancia, clause=None, **kw) -> str:
+    tabla = mapper.local_table.name if mapper is not None else None
+    if tabla in TABLAS_GLOBALES or tabla in TABLAS_REPLICADAS:
+        return SHARD_PRIMARIO
+    id_usuario = getattr(instancia, "id_usuario", None) if instancia is not None else None
+    if id_usuario is not None:
+        return shard_de(id_usuario, escritura=True)
+    if clause is not None:
+        usuarios = _usuarios(clause)
+        if len(usuarios) == 1:
+            return shard_de(usuarios.pop(), escritura=True)
+    return shard_actual.get() or SHARD_PRIMARIO
+
+def _elegir_identidad(mapper, primary_key, **kw) -> List[str]:
+    tabla = mapper.local_table.name
+    if tabla in TABLAS_GLOBALES or tabla in TABLAS_REPLICADAS:
+        return [SHARD_PRIMARIO]
+    if tabla == "usuarios":
+        return [shard_de(primary_key[0])]
+    return lista()
+
+def _asignar_ids(session: Session, flush_context, instancias):
+    # Usuarios nuevos: el id sale del directorio antes del INSERT para saber su shard
+    for obj in session.new:
+        if obj.__table__.name == "usuarios" and getattr(obj, "id_usuario", None) is None:
+            obj.id_usuario = asignar_id()
+
+class SesionShards(ShardedSession):
+    def get_bind(self, mapper=None, *, shard_id=None, instance=None, clause=None, **kw):
+        # db.get_bind() sin argumentos (para leer el dialecto): todos los shards comparten motor de BD
+        if shard_id is None and mapper is None and instance is None and clause is None:
+            shard_id = shard_actual.get() or SHARD_PRIMARIO
+        return super().get_bind(mapper, shard_id=shard_id, instance=instance, clause=clause, **kw)
+
+# ===== Réplica de categorías =====
+def _anotar_categorias(session: Session, flush_context):
+    for objetos, clave in ((session.new, "_cat_upsert"), (session.dirty, "_cat_upsert"), (session.deleted, "_cat_baja")):
+        for obj in objetos:
+            if obj.__table__.name in TABLAS_REPLICADAS:
+                session.info.setdefault(clave, set()).add(obj.id_categoria)
+
+def _replicar_tras_commit(session: Session):
+    upsert = session.info.pop("_cat_upsert", None)
+    bajas = session.info.pop("_cat_baja", None)
+    if upsert or bajas:
+        try:
+            replicar_categorias(ids=upsert or set(), bajas=bajas or set())
+        except Exception as e:
+            # El job diario (replicar_categorias sin ids) la completa más tarde
+            print(f"[Shards] Réplica de categorías pendiente: {e}")
+
+def replicar_categorias(ids: Optional[Set[int]] = None, bajas: Iterable[int] = ()) -> int:
+    """Copia `categorias` del primario a los demás shards (todas si ids es None). Upsert por PK."""
+    if not activos():
+        return 0
+    from app.database import Base
+    tabla = Base.metadata.tables["categorias"]
+    pk = tabla.c.id_categoria
+    consulta = select(tabla)
+    if ids is not None:
+        if not ids and not bajas:
+            return 0
+        consulta = consulta.where(pk.in_(list(ids)))
+    with _motores[SHARD_PRIMARIO].connect() as conn:
+        filas = [dict(f) for f in conn.execute(consulta).mappings()]
+    for shard in lista()[1:]:
+        with _motores[shard].begin() as conn:
+            if bajas:
+                conn.execute(tabla.delete().where(pk.in_(list(bajas))))
+            for fila in filas:
+                if conn.execute(tabla.update().where(pk == fila["id_categoria"]).values(**fila)).rowcount == 0:
+                    conn.execute(tabla.insert().values(**fila))
+    return len(filas)
+
+# ===== Configuración =====
+def fabrica_sesiones(motores: Dict[str, Engine], **opciones) -> Callable[..., Session]:
+    """
+    SessionLocal con sharding: una ShardedSession (rutea cada sentencia por el id_usuario de su
+    filtro o de la fila que inserta; sin él consulta todos los shards) o, dentro de un job
+    lanzado con en_cada_shard, una Session normal ligada a ese shard.
+    """
+    _motores.clear()
+    _motores.update(motores)
+    # Un commit que toca dos shards (transferencia entre usuarios de shards distintos) va con XA en MySQL
+    xa = all(m.dialect.name == "mysql" for m in motores.values())
+    global_ = sessionmaker(
+        class_=SesionShards,
+        shards=motores,
+        shard_chooser=_elegir_shard,
+        identity_chooser=_elegir_identidad,
+        execute_chooser=_elegir_ejecucion,
+        twophase=xa,
+        **opciones,
+    )
+    global _fabrica_global
+    _fabrica_global = global_
+    event.listen(global_, "before_flush", _asignar_ids)
+    event.listen(global_, "after_flush", _anotar_categorias)
+    event.listen(global_, "after_commit", _replicar_tras_commit)
+    por_shard = {k: sessionmaker(bind=m, **opciones) for k, m in motores.items()}
+
+    def SessionLocal(**extra) -> Session:
+        k = shard_actual.get()
+        return (por_shard[k] if k is not None else global_)(**extra)
+
+    return SessionLocal
+
+def configurar_unico(engine: Engine):
+    """Sin DATABASE_SHARDS: un solo 'shard' (el engine de siempre)."""
+    _motores.clear()
+    _motores[SHARD_PRIMARIO] = engine
+
+def preparar(metadata: MetaData):
+    """
+    Crea el esquema en cada shard, el directorio en el primario y el rango de ids de cada shard
+    (shard k empieza en k * SHARD_RANGO_IDS + 1) para que los ids no choquen entre shards.
+    """
+    for k in lista():
+        metadata.create_all(bind=_motores[k])
+    if not activos():
+        return
+    primario = _motores[SHARD_PRIMARIO]
+    _meta.create_all(bind=primario)
+    with primario.begin() as conn:
+        if conn.execute(select(func.count()).select_from(mapa_shards)).scalar() == 0:
+            maximo = conn.execute(text("SELECT COALESCE(MAX(id_usuario), 0) FROM usuarios")).scalar()
+            _fijar_autoincremento(conn, "mapa_shards", maximo + 1)
+    replicar_categorias()
+    for k in lista()[1:]:
+        inicio = int(k) * SHARD_RANGO_IDS + 1
+        with _motores[k].begin() as conn:
+            for tabla in TABLAS_CON_RANGO:
+                pk = metadata.tables[tabla].primary_key.columns.values()[0].name
+                if (conn.execute(text(f"SELECT COALESCE(MAX({pk}), 0) FROM {tabla}")).scalar() or 0) < inicio:
+                    _fijar_autoincremento(conn, tabla, inicio)
+
+def _fijar_autoincremento(conn, tabla: str, inicio: int):
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"ALTER TABLE {tabla} AUTO_INCREMENT = {int(inicio)}"))
+        return
+    # SQLite: solo en tablas creadas con AUTOINCREMENT (sqlite_autoincrement en el modelo)
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :t"), {"t": tabla})
+    conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:t, :s)"), {"t": tabla, "s": int(inicio) - 1})
+
+@contextmanager
+def todos(db: Session):
+    """
+    Sesión para leer filas de un usuario que pueden estar en otros shards (envíos donde es la
+    contraparte, resúmenes archivados como destinatario). En una petición `db` ya consulta todos;
+    dentro de en_cada_shard se abre una ShardedSession aparte. Los resultados agrupados llegan
+    una vez por shard: quien los lea debe acumular, no asignar.
+    """
+    if not activos() or shard_actual.get() is None:
+        yield db
+        return
+    sesion = _fabrica_global()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+
+def rango_de(shard: str) -> Tuple[int, int]:
+    """Ids [desde, hasta) que asigna el shard en las TABLAS_CON_RANGO."""
+    k = int(shard)
+    return (k * SHARD_RANGO_IDS, (k + 1) * SHARD_RANGO_IDS) if activos() else (0, 1 << 62)
+
+# ===== Jobs en paralelo por shard =====
+def en_cada_shard(job):
+    """
+    Corre el job una vez por shard en paralelo, cada hilo con SessionLocal/motor_actual ligados a
+    su shard. Sin sharding es el job tal cual. Un shard que falla no detiene a los demás.
+    """
+    @wraps(job)
+    def envoltura(*args, **kwargs):
+        if not activos():
+            return job(*args, **kwargs)
+
+        def correr(k):
+            token = shard_actual.set(k)
+            try:
+                return job(*args, **kwargs)
+            finally:
+                shard_actual.reset(token)
+
+        with ThreadPoolExecutor(max_workers=len(_motores), thread_name_prefix=job.__name__) as pool:
+            futuros = {k: pool.submit(contextvars.copy_context().run, correr, k) for k in lista()}
+        resultados = {}
+        for k, futuro in futuros.items():
+            try:
+                resultados[k] = futuro.result()
+            except Exception as e:
+                print(f"[Shards] {job.__name__} falló en el shard {k}: {e}")
+        return resultados
+    return envoltura
@@ -1,18 +1,55 @@
 import os
+import threading
+
+from app.utils.circuito import Circuito
 
 TWILIO_SID = os.environ.get("TWILIO_ACCOUNT_SID")
 TWILIO_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
 TWILIO_FROM = os.environ.get("TWILIO_FROM")
+TWILIO_API_URL = os.environ.get("TWILIO_API_URL")                                  # opcional: proxy o servidor de pruebas
+TWILIO_TIMEOUT_CONEXION = float(os.environ.get("TWILIO_TIMEOUT_CONEXION", "3"))
+TWILIO_TIMEOUT_ENVIO = float(os.environ.get("TWILIO_TIMEOUT_ENVIO", "10"))          # espera de la respuesta HTTP
+TWILIO_CIRCUITO_FALLOS = int(os.environ.get("TWILIO_CIRCUITO_FALLOS", "5"))
+TWILIO_CIRCUITO_ESPERA_S = float(os.environ.get("TWILIO_CIRCUITO_ESPERA_S", "60"))
+
+circuito_sms = Circuito("twilio", TWILIO_CIRCUITO_FALLOS, TWILIO_CIRCUITO_ESPERA_S)
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+def _cliente_twilio():
+    """Un Client por proceso: reutiliza la sesión HTTP (keep-alive + TLS) entre envíos."""
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                from twilio.rest import Client
+                from twilio.http.http_client import TwilioHttpClient
+                http = TwilioHttpClient(pool_connections=True)
+                # requests acepta (conexión, lectura); el constructor de Twilio solo valida un número
+                http.timeout = (TWILIO_TIMEOUT_CONEXION, TWILIO_TIMEOUT_ENVIO)
+                cliente = Client(TWILIO_SID, TWILIO_TOKEN, http_client=http)
+                if TWILIO_API_URL:
+                    cliente.api.base_url = TWILIO_API_URL.rstrip("/")
+                _cliente = cliente
+    return _cliente
 
 def enviar_sms(destino: str, mensaje: str) -> bool:
     """Envía SMS vía Twilio. Devuelve True si se envió, False si no está configurado o falló."""
     if not (TWILIO_SID and TWILIO_TOKEN and TWILIO_FROM and destino):
         return False
+    if not circuito_sms.permitir():
+        print(f"[SMS] Twilio en pausa tras fallos repetidos; no se envía a {destino}")
+        return False
     try:
-        from twilio.rest import Client
-        client = Client(TWILIO_SID, TWILIO_TOKEN)
-        client.messages.create(to=destino, from_=TWILIO_FROM, body=mensaje)
-        return True
+        _cliente_twilio().messages.create(to=destino, from_=TWILIO_FROM, body=mensaje)
     except Exception as e:
+        estado = getattr(e, "status", None)
+        if isinstance(estado, int) and estado < 500:
+            circuito_sms.exito()  # Twilio respondió (número inválido, etc.): el proveedor está bien
+        else:
+            circuito_sms.fallo()
         print(f"[SMS] Error enviando SMS a {destino}: {e}")
         return False
+    circuito_sms.exito()
+    return True
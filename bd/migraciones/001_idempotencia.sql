@@ -0,0 +1,16 @@
+-- ============================================================================
+-- Tabla: idempotencia
+--  Respuestas guardadas por Idempotency-Key para POST que mueven dinero
+--  (/transacciones/ingreso, /transacciones/egreso, /pagos/ejecutar, /transferencias)
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS idempotencia (
+  clave         VARCHAR(255) NOT NULL PRIMARY KEY,     -- "<ruta>|u:<id_usuario>|<Idempotency-Key>"
+  huella        CHAR(64)     NOT NULL,                 -- sha256 del request
+  estado        ENUM('en_proceso','completada') NOT NULL DEFAULT 'en_proceso',
+  status_code   INT          NULL,
+  content_type  VARCHAR(100) NULL,
+  cuerpo        BLOB         NULL,
+  creada        DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  expira        DATETIME     NOT NULL,
+  KEY idx_idempotencia_expira (expira)
+) ENGINE=InnoDB;
@@ -0,0 +1,8 @@
+-- ============================================================================
+-- Índices FULLTEXT para /busqueda (descripciones de transacciones y pagos)
+--  Ojo: innodb_ft_min_token_size (3 por defecto) y la lista de stopwords
+--  definen qué palabras se indexan.
+--  En SQLite (desarrollo) la app crea tablas FTS5 equivalentes al arrancar.
+-- ============================================================================
+ALTER TABLE transacciones ADD FULLTEXT INDEX ft_tx_descripcion (descripcion);
+ALTER TABLE pagos ADD FULLTEXT INDEX ft_pago_descripcion (descripcion);
@@ -0,0 +1,75 @@
+-- ============================================================================
+-- Particionado por rango de fecha de `transacciones` + archivo frío
+--
+--  Restricciones de MySQL para tablas particionadas (InnoDB):
+--   * toda llave única (incluida la PK) debe contener la columna de partición
+--     -> PK (id_transaccion, fecha)
+--   * no admiten FOREIGN KEY (ni propias ni apuntando a ellas)
+--     -> se quitan fk_tx_*; el borrado de usuarios ya no cascadea a sus transacciones
+--   * no admiten índices FULLTEXT
+--     -> la descripción se indexa en `transacciones_texto` (mantenida por triggers)
+--
+--  La migración deja una sola partición histórica y `pmax`; la app crea las
+--  mensuales hacia adelante (app/utils/particiones.py, job diario) partiendo pmax.
+-- ============================================================================
+
+-- 1) Texto buscable fuera de la tabla particionada
+CREATE TABLE IF NOT EXISTS transacciones_texto (
+  id_transaccion INT          NOT NULL PRIMARY KEY,
+  descripcion    VARCHAR(255) NOT NULL,
+  FULLTEXT INDEX ft_txt_descripcion (descripcion)
+) ENGINE=InnoDB;
+
+INSERT INTO transacciones_texto (id_transaccion, descripcion)
+SELECT id_transaccion, descripcion FROM transacciones WHERE descripcion IS NOT NULL;
+
+DROP TRIGGER IF EXISTS trg_tx_texto_ai;
+DROP TRIGGER IF EXISTS trg_tx_texto_au;
+DROP TRIGGER IF EXISTS trg_tx_texto_ad;
+CREATE TRIGGER trg_tx_texto_ai AFTER INSERT ON transacciones FOR EACH ROW
+  INSERT INTO transacciones_texto (id_transaccion, descripcion)
+  SELECT NEW.id_transaccion, NEW.descripcion FROM DUAL WHERE NEW.descripcion IS NOT NULL;
+CREATE TRIGGER trg_tx_texto_au AFTER UPDATE ON transacciones FOR EACH ROW
+  REPLACE INTO transacciones_texto (id_transaccion, descripcion)
+  SELECT NEW.id_transaccion, NEW.descripcion FROM DUAL WHERE NEW.descripcion IS NOT NULL;
+CREATE TRIGGER trg_tx_texto_ad AFTER DELETE ON transacciones FOR EACH ROW
+  DELETE FROM transacciones_texto WHERE id_transaccion = OLD.id_transaccion;
+
+-- 2) Quitar lo que MySQL no permite en tablas particionadas
+ALTER TABLE transacciones
+  DROP FOREIGN KEY fk_tx_categoria,
+  DROP FOREIGN KEY fk_tx_destinatario,
+  DROP FOREIGN KEY fk_tx_usuario,
+  DROP INDEX ft_tx_descripcion,
+  DROP PRIMARY KEY,
+  ADD PRIMARY KEY (id_transaccion, fecha);
+
+-- 3) Particionar (reescribe la tabla: correr en ventana de mantenimiento)
+ALTER TABLE transacciones
+  PARTITION BY RANGE COLUMNS (fecha) (
+    PARTITION p_hist VALUES LESS THAN ('2026-01-01'),
+    PARTITION pmax   VALUES LESS THAN (MAXVALUE)
+  );
+
+-- 4) Resúmenes diarios de los periodos archivados y marca de agua del archivo
+CREATE TABLE IF NOT EXISTS resumen_archivado (
+  id            INT           NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  id_usuario    INT           NOT NULL,
+  dia           DATE          NOT NULL,
+  tipo          ENUM('ingreso','egreso','envio','solicitud') NOT NULL,
+  rol           ENUM('titular','destinatario') NOT NULL DEFAULT 'titular',
+  categoria_id  INT           NULL,
+  total         DECIMAL(14,2) NOT NULL,
+  conteo        INT           NOT NULL,
+  KEY idx_resarch_usuario_dia (id_usuario, dia)
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS periodos_archivados (
+  periodo       CHAR(7)       NOT NULL PRIMARY KEY,    -- 'YYYY-MM'
+  desde         DATE          NOT NULL,
+  hasta         DATE          NOT NULL,                -- exclusivo: primer día que sigue en caliente
+  archivo       VARCHAR(255)  NOT NULL,
+  sha256        CHAR(64)      NOT NULL,
+  filas         INT           NOT NULL,
+  archivado_en  DATETIME      NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
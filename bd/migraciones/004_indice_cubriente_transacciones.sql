@@ -0,0 +1,9 @@
+-- ============================================================================
+-- Índice cubriente para las agregaciones de transacciones
+--  (id_usuario, tipo, categoria_id, fecha, monto): las sumas por usuario/tipo
+--  [/categoría] sobre un rango semiabierto de fecha se resuelven solo con el
+--  índice ("Using index" en EXPLAIN), sin ir a la fila.
+--  Requiere que los filtros comparen `fecha` directamente (app/utils/periodos.py),
+--  no EXTRACT(MONTH/YEAR ...) ni DATE(fecha).
+-- ============================================================================
+ALTER TABLE transacciones ADD INDEX idx_tx_cubriente (id_usuario, tipo, categoria_id, fecha, monto);
@@ -0,0 +1,20 @@
+-- ============================================================================
+-- Anomalías de gasto detectadas por el job nocturno (app/utils/anomalias.py)
+--  Una fila por (transacción, motivo); la API las lee por (id_usuario, fecha)
+--  sin volver a calcular nada.
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS anomalias (
+  id              INT           NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  id_transaccion  INT           NOT NULL,
+  id_usuario      INT           NOT NULL,
+  categoria_id    INT           NULL,
+  fecha           DATETIME      NOT NULL,
+  monto           DECIMAL(10,2) NOT NULL,
+  motivo          ENUM('monto','frecuencia') NOT NULL,
+  puntaje         DOUBLE        NOT NULL,
+  detalle         VARCHAR(255)  NULL,
+  detectada_en    DATETIME      NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  notificada      TINYINT(1)    NOT NULL DEFAULT 0,
+  UNIQUE KEY uq_anomalia_tx_motivo (id_transaccion, motivo),
+  KEY idx_anomalia_usuario_fecha (id_usuario, fecha)
+) ENGINE=InnoDB;
@@ -0,0 +1,16 @@
+-- ============================================================================
+-- Bitácora de cambios para sincronización incremental (GET /cambios/{id_usuario})
+--  La llena app/utils/cambios.py en el mismo commit que la escritura (after_flush
+--  de la sesión). El feed lee por (id_usuario, id > cursor): costo proporcional a
+--  los cambios, no al historial. Se purga por `creado` (CAMBIOS_RETENCION_DIAS).
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS cambios (
+  id          BIGINT        NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  id_usuario  INT           NOT NULL,
+  entidad     ENUM('transaccion','pago','presupuesto') NOT NULL,
+  id_entidad  INT           NOT NULL,
+  operacion   ENUM('alta','cambio','baja') NOT NULL,
+  creado      DATETIME      NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  KEY idx_cambios_usuario_id (id_usuario, id),
+  KEY idx_cambios_creado (creado)
+) ENGINE=InnoDB;
@@ -0,0 +1,25 @@
+-- ============================================================================
+-- Directorio de usuarios por shard (solo en el primario, la primera URL de
+-- DATABASE_SHARDS). Sin DATABASE_SHARDS no se usa.
+--  * Reparte los id_usuario nuevos: el AUTO_INCREMENT de esta tabla es la única
+--    fuente de ids de usuarios, así no chocan entre shards. Arranca después del
+--    mayor id existente (app/utils/shards.py lo ajusta al crearla vacía).
+--  * Usuarios sin fila = anteriores al sharding, siguen en el primario.
+--  * bloqueado = 1 mientras app/utils/resharding.py mueve al usuario: sus
+--    escrituras responden 503 hasta que termina.
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS mapa_shards (
+  id_usuario  INT           NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  shard       VARCHAR(16)   NOT NULL,
+  bloqueado   BOOLEAN       NOT NULL DEFAULT FALSE
+) ENGINE=InnoDB;
+
+-- En cada shard k > 0 los ids de las tablas por usuario arrancan en k * SHARD_RANGO_IDS + 1
+-- (por defecto 100 000 000) para que un id_transaccion/id_pago/... sea único en todo el
+-- sistema. La app lo fija al arrancar si la tabla está por debajo; a mano, por ejemplo en el shard 1:
+--   ALTER TABLE transacciones     AUTO_INCREMENT = 100000001;
+--   ALTER TABLE pagos             AUTO_INCREMENT = 100000001;
+--   ALTER TABLE presupuestos      AUTO_INCREMENT = 100000001;
+--   ALTER TABLE cambios           AUTO_INCREMENT = 100000001;
+--   ALTER TABLE anomalias         AUTO_INCREMENT = 100000001;
+--   ALTER TABLE resumen_archivado AUTO_INCREMENT = 100000001;
@@ -0,0 +1,31 @@
+-- ============================================================================
+-- Historial de corridas de los cron jobs (app/utils/corridas.py)
+--  Solo en el primario. Una fila por corrida y shard, más las que APScheduler
+--  no llegó a correr: 'omitida' (la anterior seguía corriendo, max_instances)
+--  y 'perdida' (se pasó del misfire_grace_time).
+--  * retraso_ms: inicio real - hora programada por el CronTrigger.
+--  * lag_pago_*: hora de ejecución - proxima_ejecucion de los pagos tomados.
+--  La app purga lo anterior a CORRIDAS_RETENCION_DIAS (30 por defecto).
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS corridas_jobs (
+  id                    BIGINT        NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  job                   VARCHAR(64)   NOT NULL,
+  shard                 VARCHAR(16)   NULL,
+  estado                ENUM('ok','error','omitida','perdida') NOT NULL,
+  programada            DATETIME      NULL,
+  inicio                DATETIME      NOT NULL,
+  fin                   DATETIME      NULL,
+  duracion_ms           DOUBLE        NULL,
+  retraso_ms            DOUBLE        NULL,
+  filas_revisadas       INT           NOT NULL DEFAULT 0,
+  pagos_ejecutados      INT           NOT NULL DEFAULT 0,
+  omitidos_presupuesto  INT           NOT NULL DEFAULT 0,
+  omitidos_saldo        INT           NOT NULL DEFAULT 0,
+  notificaciones        INT           NOT NULL DEFAULT 0,
+  errores               INT           NOT NULL DEFAULT 0,
+  lag_pago_max_s        DOUBLE        NULL,
+  lag_pago_prom_s       DOUBLE        NULL,
+  error                 TEXT          NULL,
+  KEY idx_corrida_job_inicio (job, inicio),
+  KEY idx_corrida_inicio (inicio)
+) ENGINE=InnoDB;
@@ -0,0 +1,9 @@
+-- ============================================================================
+-- Dueño de cada reserva de Idempotency-Key (app/utils/idempotencia.py)
+--  El request que reserva la clave guarda un token propio; solo ese request
+--  puede renovar el lease, guardar la respuesta o liberar la fila. Una fila
+--  'en_proceso' se reemplaza únicamente si su lease venció (el worker murió:
+--  mientras corre, lo renueva cada IDEMPOTENCY_LEASE / 3 segundos).
+-- ============================================================================
+ALTER TABLE idempotencia
+  ADD COLUMN dueno CHAR(32) NULL AFTER estado;
@@ -0,0 +1,13 @@
+-- ============================================================================
+-- Ids del feed de cambios en orden de commit (app/utils/cambios.py)
+--  Los ids de `cambios` ya no salen del AUTO_INCREMENT (se asigna al insertar y
+--  una transacción lenta podía confirmar un id menor que el cursor del cliente).
+--  Justo antes del COMMIT se suben en esta fila, cuyo candado se suelta con el
+--  COMMIT: los ids quedan visibles en orden y el feed ya no espera un margen.
+--  Una tabla por shard; la app siembra la fila en la primera escritura con
+--  MAX(cambios.id) o el inicio del rango del shard, lo que sea mayor.
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS secuencia_cambios (
+  id     INT     NOT NULL PRIMARY KEY,
+  valor  BIGINT  NOT NULL
+) ENGINE=InnoDB;
@@ -0,0 +1,16 @@
+-- ============================================================================
+-- Faltantes de saldo de la proyección nocturna (app/utils/proyeccion.py)
+--  Una fila por usuario cuyo saldo proyectado queda en negativo. La corrida de
+--  las 02:00 reemplaza las del shard; verificar_pagos_pendientes las toma con
+--  un UPDATE de tomado_por (un solo worker gana cada fila) y las borra, así un
+--  aviso no se pierde por un reinicio ni sale dos veces con varios workers.
+--  Una tabla por shard.
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS faltantes_saldo (
+  id_usuario  INT           NOT NULL PRIMARY KEY,
+  fecha       DATE          NOT NULL,
+  minimo      DECIMAL(10,2) NOT NULL,
+  calculado   DATETIME      NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  tomado_por  CHAR(32)      NULL,
+  KEY idx_faltante_tomado (tomado_por)
+) ENGINE=InnoDB;
@@ -0,0 +1,110 @@
+"""
+Inserciones por segundo de POST /transacciones/ingreso: ruta actual (un commit por
+request) contra el modo GROUP_COMMIT (un commit por lote de requests).
+
+    DATABASE_URL=mysql+pymysql://root:@127.0.0.1:3306/lana_bench \\
+        python benchmarks/bench_group_commit.py --hilos 40 --ops 20000
+
+Sin DATABASE_URL usa un archivo SQLite temporal. Con MySQL la diferencia depende sobre todo
+de innodb_flush_log_at_trx_commit / sync_binlog (costo de cada fsync).
+"""
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_group_commit.db")
+
+from sqlalchemy import func  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models.categoria_model import Categoria  # noqa: E402
+from app.models.user_model import User  # noqa: E402
+from app.routes.transaction_routes import IngresoCrear, crear_ingreso  # noqa: E402
+from app.utils.dinero import formatear  # noqa: E402
+
+# app.routes re-exporta el router con el nombre del módulo: tomar el módulo en sí
+transaction_routes = importlib.import_module("app.routes.transaction_routes")
+
+def preparar(n_usuarios: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        prefijo = f"gc{int(time.time() * 1000)}"
+        cat = Categoria(nombre=prefijo, tipo="ingreso")
+        usuarios = [
+            User(nombre=f"{prefijo}-{i}", correo=f"{prefijo}-{i}@bench.local", telefono=f"{prefijo}{i}",
+                 contrasena_hash="x", saldo=0)
+            for i in range(n_usuarios)
+        ]
+        db.add(cat)
+        db.add_all(usuarios)
+        db.commit()
+        return [u.id_usuario for u in usuarios], cat.id_categoria
+    finally:
+        db.close()
+
+def saldo_total(ids) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(func.sum(User.saldo)).filter(User.id_usuario.in_(ids)).scalar() or 0
+    finally:
+        db.close()
+
+def correr(ids, categoria_id: int, hilos: int, ops: int):
+    latencias = []
+    errores = [0]
+    lock = threading.Lock()
+
+    def trabajador(k: int):
+        locales = []
+        for i in range(ops // hilos):
+            data = IngresoCrear(id_usuario=ids[(k + i) % len(ids)], monto=1, descripcion="nómina",
+                                categoria_id=categoria_id)
+            db = SessionLocal()
+            t0 = time.perf_counter()
+            try:
+                crear_ingreso(data, db)
+                locales.append(time.perf_counter() - t0)
+            except Exception:
+                with lock:
+                    errores[0] += 1
+            finally:
+                db.close()
+        with lock:
+            latencias.extend(locales)
+
+    inicio = time.perf_counter()
+    ts = [threading.Thread(target=trabajador, args=(k,)) for k in range(hilos)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return time.perf_counter() - inicio, sorted(latencias), errores[0]
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--usuarios", type=int, default=100)
+    p.add_argument("--hilos", type=int, default=40)     # hilos del threadpool de Starlette por worker
+    p.add_argument("--ops", type=int, default=4000)
+    args = p.parse_args()
+
+    ids, categoria_id = preparar(args.usuarios)
+    print(f"motor: {engine.url.get_backend_name()}  hilos: {args.hilos}  ops: {args.ops}")
+    for nombre, activo in (("actual", False), ("group-commit", True)):
+        transaction_routes.GROUP_COMMIT = activo
+        antes = saldo_total(ids)
+        duracion, lat, errores = correr(ids, categoria_id, args.hilos, args.ops)
+        acreditado = saldo_total(ids) - antes
+        print(f"[{nombre}] {len(lat) / duracion:.0f} inserciones/s  "
+              f"p50 {statistics.median(lat) * 1000:.2f} ms  p99 {lat[int(len(lat) * 0.99) - 1] * 1000:.2f} ms  "
+              f"errores {errores}  saldo acreditado {formatear(acreditado)} (esperado {len(lat)}.00)")
+
+if __name__ == "__main__":
+    main()
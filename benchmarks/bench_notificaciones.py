@@ -0,0 +1,152 @@
+"""
+SMTP y Twilio contra servidores falsos locales: reutilización de conexiones con el proveedor
+sano, y con el proveedor colgado, cuánto bloquea cada envío (timeout) y cuándo el circuito
+empieza a rechazar al instante.
+
+    python benchmarks/bench_notificaciones.py --envios 200
+
+No necesita red ni credenciales: levanta un SMTP mínimo y un HTTP que imita la API de mensajes.
+"""
+import argparse
+import json
+import os
+import socketserver
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ===== Servidores falsos =====
+class Estado:
+    colgado = False      # acepta la conexión pero no responde nunca
+    conexiones = 0
+
+class SMTPFalso(socketserver.StreamRequestHandler):
+    def handle(self):
+        Estado.conexiones += 1
+        if Estado.colgado:
+            time.sleep(30)
+            return
+        self.wfile.write(b"220 falso ESMTP\r\n")
+        en_datos = False
+        for linea in self.rfile:
+            if Estado.colgado:       # también cuelga las sesiones ya abiertas (reutilizadas)
+                time.sleep(30)
+                return
+            if en_datos:
+                if linea == b".\r\n":
+                    en_datos = False
+                    self.wfile.write(b"250 OK\r\n")
+                continue
+            comando = linea[:4].upper()
+            if comando == b"DATA":
+                en_datos = True
+                self.wfile.write(b"354 Fin con .\r\n")
+            elif comando == b"QUIT":
+                self.wfile.write(b"221 Adios\r\n")
+                return
+            elif comando == b"EHLO":
+                self.wfile.write(b"250-falso\r\n250 8BITMIME\r\n")
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+class TwilioFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como la API real
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        Estado.conexiones += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if Estado.colgado:
+            time.sleep(30)
+            return
+        cuerpo = json.dumps({"sid": "SM" + "0" * 32, "status": "queued"}).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+class _SMTPServidor(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def levantar():
+    smtp = _SMTPServidor(("127.0.0.1", 0), SMTPFalso)
+    http = ThreadingHTTPServer(("127.0.0.1", 0), TwilioFalso)
+    http.daemon_threads = True
+    for servidor in (smtp, http):
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return smtp.server_address[1], http.server_address[1]
+
+# ===== Medición =====
+def medir(nombre: str, enviar, n: int, timeout: float):
+    import builtins
+    imprimir, builtins.print = builtins.print, (lambda *a, **k: None)  # silenciar los logs por envío
+    Estado.conexiones = 0
+    tiempos, ok = [], 0
+    try:
+        for i in range(n):
+            t0 = time.perf_counter()
+            ok += bool(enviar(i))
+            tiempos.append((time.perf_counter() - t0) * 1000)
+    finally:
+        builtins.print = imprimir
+    lentos = sum(1 for t in tiempos if t >= timeout * 500)
+    print(f"  {nombre:<7} enviados {ok:>4}/{n}  conexiones {Estado.conexiones:>3}  "
+          f"p50 {statistics.median(tiempos):7.1f} ms  máx {max(tiempos):7.1f} ms  "
+          f"total {sum(tiempos) / 1000:6.2f} s  bloqueados por timeout {lentos}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--envios", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--fallos", type=int, default=3)
+    args = parser.parse_args()
+
+    puerto_smtp, puerto_http = levantar()
+    os.environ.update({
+        "SMTP_SERVER": "127.0.0.1", "SMTP_PORT": str(puerto_smtp), "SMTP_STARTTLS": "0",
+        "EMAIL_ORIGEN": "bench@local",
+        "SMTP_TIMEOUT_CONEXION": str(args.timeout), "SMTP_TIMEOUT_ENVIO": str(args.timeout),
+        "SMTP_CIRCUITO_FALLOS": str(args.fallos), "SMTP_CIRCUITO_ESPERA_S": "2",
+        "TWILIO_ACCOUNT_SID": "AC" + "0" * 32, "TWILIO_AUTH_TOKEN": "x", "TWILIO_FROM": "+10000000000",
+        "TWILIO_API_URL": f"http://127.0.0.1:{puerto_http}",
+        "TWILIO_TIMEOUT_CONEXION": str(args.timeout), "TWILIO_TIMEOUT_ENVIO": str(args.timeout),
+        "TWILIO_CIRCUITO_FALLOS": str(args.fallos), "TWILIO_CIRCUITO_ESPERA_S": "2",
+    })
+    from app.utils import notificaciones, sms
+
+    def correo(i):
+        return notificaciones.enviar_correo(f"u{i}@local", "Prueba", "Hola")
+
+    def mensaje(i):
+        return sms.enviar_sms("+15550000000", "Hola")
+
+    for titulo, colgado, n in (("Proveedor sano", False, args.envios), ("Proveedor colgado", True, 20)):
+        Estado.colgado = colgado
+        print(titulo)
+        medir("SMTP", correo, n, args.timeout)
+        medir("Twilio", mensaje, n, args.timeout)
+    print("Circuitos:", notificaciones.circuito_smtp.estado(), sms.circuito_sms.estado())
+
+    # Recuperación: pasada la espera, una llamada de prueba cierra el circuito
+    Estado.colgado = False
+    time.sleep(2.1)
+    print("Tras la espera")
+    medir("SMTP", correo, 1, args.timeout)
+    medir("Twilio", mensaje, 1, args.timeout)
+    print("Circuitos:", notificaciones.circuito_smtp.estado()["estado"], sms.circuito_sms.estado()["estado"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark de contención para /transferencias.
+
+Muchos usuarios transfieren a una sola cuenta "caliente" (o entre pares aleatorios en
+ambas direcciones, para comprobar que el orden de bloqueo evita deadlocks) y se mide
+el throughput, la latencia y que el dinero total se conserve.
+
+    DATABASE_URL=mysql+pymysql://root:@127.0.0.1:3306/lana_bench \\
+        python benchmarks/bench_transferencias.py --hilos 32 --usuarios 500 --ops 5000
+
+Sin DATABASE_URL usa un archivo SQLite temporal (sirve para validar, no para medir
+contención real: SQLite serializa todas las escrituras).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_transferencias.db")
+
+from fastapi import HTTPException  # noqa: E402
+from sqlalchemy import func  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models.user_model import User  # noqa: E402
+from app.routes.transferencias_routes import TransferenciaCrear, crear_transferencia  # noqa: E402
+from app.utils.dinero import formatear  # noqa: E402
+
+def preparar(n_usuarios: int, saldo: int) -> list:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        prefijo = f"bench{int(time.time() * 1000)}"
+        usuarios = [
+            User(nombre=f"{prefijo}-{i}", correo=f"{prefijo}-{i}@bench.local", telefono=f"{prefijo}{i}",
+                 contrasena_hash="x", saldo=saldo)
+            for i in range(n_usuarios)
+        ]
+        db.add_all(usuarios)
+        db.commit()
+        return [u.id_usuario for u in usuarios]
+    finally:
+        db.close()
+
+def total(ids: list) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(func.sum(User.saldo)).filter(User.id_usuario.in_(ids)).scalar() or 0
+    finally:
+        db.close()
+
+def correr(ids: list, hilos: int, ops: int, modo: str):
+    caliente = ids[0]
+    latencias = []
+    errores = {"saldo": 0, "otros": 0}
+    lock = threading.Lock()
+    por_hilo = ops // hilos
+
+    def trabajador(semilla: int):
+        rnd = random.Random(semilla)
+        locales = []
+        for _ in range(por_hilo):
+            if modo == "caliente":
+                origen, destino = rnd.choice(ids[1:]), caliente
+            else:
+                origen, destino = rnd.sample(ids, 2)
+            db = SessionLocal()
+            t0 = time.perf_counter()
+            try:
+                crear_transferencia(TransferenciaCrear(id_usuario=origen, destinatario_id=destino, monto=1), db)
+                locales.append(time.perf_counter() - t0)
+            except HTTPException as e:
+                with lock:
+                    errores["saldo" if e.status_code == 400 else "otros"] += 1
+            except Exception:
+                with lock:
+                    errores["otros"] += 1
+            finally:
+                db.close()
+        with lock:
+            latencias.extend(locales)
+
+    inicio = time.perf_counter()
+    ts = [threading.Thread(target=trabajador, args=(i,)) for i in range(hilos)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return time.perf_counter() - inicio, latencias, errores
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--usuarios", type=int, default=200)
+    p.add_argument("--hilos", type=int, default=16)
+    p.add_argument("--ops", type=int, default=2000)
+    p.add_argument("--modo", choices=["caliente", "aleatorio"], default="caliente")
+    args = p.parse_args()
+
+    ids = preparar(args.usuarios, 100_000_00)
+    antes = total(ids)
+    duracion, lat, errores = correr(ids, args.hilos, args.ops, args.modo)
+    despues = total(ids)
+
+    lat.sort()
+    print(f"motor: {engine.url.get_backend_name()}  modo: {args.modo}  hilos: {args.hilos}  usuarios: {args.usuarios}")
+    print(f"transferencias ok: {len(lat)}  errores: {errores}  duración: {duracion:.2f}s")
+    if lat:
+        print(f"throughput: {len(lat) / duracion:.1f} tx/s")
+        print(f"latencia p50: {statistics.median(lat) * 1000:.2f} ms  "
+              f"p99: {lat[int(len(lat) * 0.99) - 1] * 1000:.2f} ms  max: {lat[-1] * 1000:.2f} ms")
+    print(f"dinero conservado: {antes == despues} ({formatear(antes)} -> {formatear(despues)})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Verificación de sharding con varios archivos SQLite y FOREIGN KEY activas.
+
+SQLite no valida llaves foráneas si no se pide con PRAGMA foreign_keys=ON, así que una prueba
+"con varios SQLite" pasaba aunque en MySQL/InnoDB la misma escritura fallara. Aquí cada shard
+abre sus conexiones con el PRAGMA y se recorren los caminos que cruzan shards: alta de usuarios,
+ingresos/egresos, transferencias y solicitudes entre usuarios de shards distintos, categorías
+replicadas, presupuestos y pagos fijos. Al final se comprueba que el dinero se conserve.
+
+    python benchmarks/verificar_shards.py --shards 3 --usuarios 6
+
+Sale con código 1 si algo falla (sirve en CI).
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def configurar(n_shards: int) -> str:
+    directorio = tempfile.mkdtemp(prefix="verificar_shards_")
+    os.environ["DATABASE_SHARDS"] = ",".join(
+        "sqlite:///" + os.path.join(directorio, f"shard{i}.db") for i in range(n_shards)
+    )
+    os.environ.setdefault("ENABLE_CRON", "0")
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+    os.environ.setdefault("SLOW_QUERY_LOG", os.path.join(directorio, "consultas_lentas.log"))
+    os.environ.setdefault("SHARD_MAPA_TTL", "0")
+    return directorio
+
+def activar_llaves():
+    """PRAGMA foreign_keys=ON en cada conexión de cada shard, antes de que la app cree el esquema."""
+    from sqlalchemy import event
+    import app.database as database
+
+    def _pragma(conexion, _registro):
+        cursor = conexion.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    for motor in database.motores.values():
+        event.listen(motor, "connect", _pragma)
+
+def verificar(n_usuarios: int) -> list:
+    from fastapi.testclient import TestClient
+    from sqlalchemy import text
+    from app.main import app
+    from app.utils import shards
+
+    fallas = []
+
+    def esperar(respuesta, codigo, que):
+        if respuesta.status_code != codigo:
+            fallas.append(f"{que}: HTTP {respuesta.status_code} {respuesta.text[:200]}")
+            return None
+        return respuesta.json() if respuesta.headers.get("content-type", "").startswith("application/json") else None
+
+    for k in shards.lista():
+        with shards.motor(k).connect() as conn:
+            if conn.execute(text("PRAGMA foreign_keys")).scalar() != 1:
+                fallas.append(f"shard {k}: PRAGMA foreign_keys no quedó activo")
+
+    c = TestClient(app)
+    ids = []
+    for i in range(n_usuarios):
+        u = esperar(c.post("/usuarios/registrar", json={
+            "nombre": f"Verif {i}", "correo": f"verif{i}@example.com",
+            "telefono": f"5500{i:04d}", "contraseña": "Clave-segura-123",
+        }), 200, f"alta usuario {i}")
+        if u:
+            ids.append(u["id_usuario"])
+    if len(ids) < 2:
+        return fallas + ["no se pudieron dar de alta al menos dos usuarios"]
+    por_shard = {}
+    for i in ids:
+        por_shard.setdefault(shards.shard_de(i), []).append(i)
+    if len(por_shard) < min(2, len(shards.lista())):
+        fallas.append(f"los usuarios no se repartieron entre shards: {por_shard}")
+
+    categoria = esperar(c.post("/categorias", json={"nombre": "Verificación", "tipo": "egreso"}), 200, "categoría")
+    id_categoria = categoria["id_categoria"] if categoria else None
+
+    for i in ids:
+        esperar(c.post("/transacciones/ingreso", json={"id_usuario": i, "monto": 1000, "descripcion": "inicial"}),
+                200, f"ingreso {i}")
+        esperar(c.post("/transacciones/egreso", json={"id_usuario": i, "monto": 10, "descripcion": "café",
+                                                      "categoria_id": id_categoria}), 200, f"egreso {i}")
+        esperar(c.post("/presupuestos", json={"id_usuario": i, "id_categoria": id_categoria, "monto_mensual": 500,
+                                              "mes": 1, "año": 2030}), 200, f"presupuesto {i}")
+        esperar(c.post("/pagos", json={"id_usuario": i, "descripcion": "renta", "monto": 5,
+                                       "fecha_programada": "2030-01-01T00:00:00", "categoria_id": id_categoria,
+                                       "periodicidad": "monthly"}), 200, f"pago {i}")
+
+    # Transferencias y solicitudes en ambos sentidos entre cada par de usuarios (casi todos en shards distintos)
+    for a in ids:
+        for b in ids:
+            if a == b:
+                continue
+            esperar(c.post("/transferencias", json={"id_usuario": a, "destinatario_id": b, "monto": 1.25}),
+                    200, f"transferencia {a}->{b}")
+    for a, b in zip(ids, ids[1:] + ids[:1]):
+        solicitud = esperar(c.post("/solicitudes", json={"id_usuario": a, "destinatario_id": b, "monto": 2}),
+                            200, f"solicitud {a}->{b}")
+        if solicitud:
+            esperar(c.post(f"/solicitudes/{solicitud['id_transaccion']}/pagar", json={"id_usuario": b}),
+                    200, f"pagar solicitud {solicitud['id_transaccion']}")
+
+    esperar(c.post("/transferencias", json={"id_usuario": ids[0], "destinatario_id": 10 ** 9, "monto": 1}),
+            404, "transferencia a usuario inexistente")
+
+    # Cada usuario: 1000 - 10 de entrada; las transferencias y solicitudes entre ellos suman cero
+    total = sum((esperar(c.get(f"/usuarios/{i}"), 200, f"saldo {i}") or {"saldo": 0})["saldo"] for i in ids)
+    if round(total, 2) != round(990 * len(ids), 2):
+        fallas.append(f"el dinero no se conserva: total {total}, esperado {990 * len(ids)}")
+    return fallas
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--usuarios", type=int, default=6)
+    args = parser.parse_args()
+
+    directorio = configurar(args.shards)
+    activar_llaves()
+    fallas = verificar(args.usuarios)
+    print(f"{args.shards} shards SQLite con foreign_keys=ON en {directorio}")
+    if fallas:
+        print(f"FALLÓ ({len(fallas)}):")
+        for falla in fallas:
+            print(f"  - {falla}")
+        sys.exit(1)
+    print("OK: alta, movimientos, transferencias y solicitudes entre shards; dinero conservado")
+
+if __name__ == "__main__":
+    main()